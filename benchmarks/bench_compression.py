@@ -0,0 +1,81 @@
+"""Wire size and transfer time of compressed array payloads
+
+Usage: python benchmarks/bench_compression.py [bandwidth in MB/s]
+
+Serializes every array of the Wolfpass, Topography and Brain example
+projects (downloading the example data on first use) and compares the
+raw payloads with each available compression codec. End-to-end time is
+the time to compress, send at the given bandwidth (default 10 MB/s) and
+decode on download.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import time
+
+import numpy as np
+
+from steno3d.client import COMPRESSIBLE_TYPES
+from steno3d.compression import CompressedStream, codecs, decode_stream
+from steno3d.examples import Brain, Topography, Wolfpass
+
+
+def payloads(project):
+    """Serialized array files of every resource in project"""
+    contents = []
+    for resource in project.resources:
+        contents.append(resource.mesh)
+        contents += [binder.data for binder in resource.data]
+    return [fileprop for content in contents
+            for fileprop in content._get_dirty_files(force=True).values()
+            if fileprop.dtype in COMPRESSIBLE_TYPES]
+
+
+def measure(project, codec, bandwidth):
+    raw_size = wire_size = 0
+    encode_time = decode_time = 0.
+    for fileprop in payloads(project):
+        raw = fileprop.file.read()
+        raw_size += len(raw)
+        if codec is None:
+            wire_size += len(raw)
+            continue
+        fileprop.file.seek(0)
+        start = time.time()
+        stream = CompressedStream(fileprop.file, fileprop.dtype, codec)
+        encoded = stream.read()
+        encode_time += time.time() - start
+        wire_size += len(encoded)
+        start = time.time()
+        decoded = b''.join(block.tobytes() for block in decode_stream(
+            [encoded], fileprop.dtype, stream.encoding
+        ))
+        decode_time += time.time() - start
+        assert decoded == raw
+    total = encode_time + wire_size / (bandwidth * 1e6) + decode_time
+    return raw_size, wire_size, total
+
+
+def main(bandwidth):
+    examples = (('Wolfpass', Wolfpass.get_project),
+                ('Topography', Topography.get_project),
+                ('Brain', Brain.get_project))
+    print('End-to-end times at {} MB/s'.format(bandwidth))
+    for label, get_project in examples:
+        project = get_project()
+        for codec in [None] + codecs():
+            raw_size, wire_size, total = measure(project, codec, bandwidth)
+            print('{:>11} {:>5}: {:8.2f} MB on the wire ({:5.1f}%), '
+                  '{:6.2f} s'.format(
+                      label, codec or 'raw', wire_size / 1e6,
+                      100. * wire_size / max(raw_size, 1), total
+                  ))
+
+
+if __name__ == '__main__':
+    np.seterr(all='ignore')
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10.)
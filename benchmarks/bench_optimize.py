@@ -0,0 +1,53 @@
+"""Time to optimize a triangle soup with Mesh2D.optimize
+
+Usage: python benchmarks/bench_optimize.py [number of triangles]
+
+Builds a wavy height-field surface where every triangle has its own
+three vertices, as marching-cubes exports often do, then welds and
+reorders it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import time
+
+import numpy as np
+
+import steno3d
+
+
+def triangle_soup(n_triangles):
+    side = int(np.sqrt(n_triangles / 2)) + 1
+    x, y = np.meshgrid(np.arange(side, dtype=float),
+                       np.arange(side, dtype=float), indexing='ij')
+    z = np.sin(x / 50) * np.cos(y / 50)
+    points = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+    index = np.arange(side * side).reshape(side, side)
+    a, b = index[:-1, :-1].ravel(), index[1:, :-1].ravel()
+    c, d = index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+    triangles = np.vstack([np.column_stack([a, b, c]),
+                           np.column_stack([a, c, d])])
+    vertices = points[triangles.reshape(-1)]
+    return vertices, np.arange(len(vertices)).reshape(-1, 3)
+
+
+def main(n_triangles):
+    vertices, triangles = triangle_soup(n_triangles)
+    mesh = steno3d.Mesh2D(vertices=vertices, triangles=triangles)
+    print('{} triangles, {} vertices ({:.0f} MB serialized)'.format(
+        mesh.nC, mesh.nN, mesh._nbytes() / 1e6
+    ))
+    start = time.time()
+    mesh.optimize()
+    elapsed = time.time() - start
+    print('optimized in {:.2f} s: {} triangles, {} vertices ({:.0f} MB '
+          'serialized)'.format(elapsed, mesh.nC, mesh.nN,
+                               mesh._nbytes() / 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
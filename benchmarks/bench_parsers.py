@@ -0,0 +1,106 @@
+"""Throughput of the built-in OBJ, PLY and STL parsers
+
+Usage: python benchmarks/bench_parsers.py [number of triangles]
+
+Writes a height-field surface (1M triangles by default) as ASCII OBJ,
+ASCII and binary PLY, and ASCII and binary STL files in a temporary
+directory, then times parsing each into a project.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import steno3d
+
+
+def height_field(n_triangles):
+    side = int(np.ceil(np.sqrt(n_triangles / 2))) + 1
+    x, y = np.meshgrid(np.arange(side, dtype=float),
+                       np.arange(side, dtype=float), indexing='ij')
+    z = np.sin(x / 50) * np.cos(y / 50)
+    vertices = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+    index = np.arange(side * side).reshape(side, side)
+    a, b = index[:-1, :-1].ravel(), index[1:, :-1].ravel()
+    c, d = index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+    triangles = np.vstack([np.column_stack([a, b, c]),
+                           np.column_stack([a, c, d])])
+    return vertices, triangles[:n_triangles]
+
+
+def write_files(directory, vertices, triangles):
+    files = {}
+    files['obj'] = os.path.join(directory, 'surface.obj')
+    with open(files['obj'], 'wb') as fileobj:
+        np.savetxt(fileobj, vertices, fmt='v %.6f %.6f %.6f')
+        np.savetxt(fileobj, triangles + 1, fmt='f %d %d %d')
+
+    header = ('ply\nformat {} 1.0\nelement vertex %d\nproperty float x\n'
+              'property float y\nproperty float z\nelement face %d\n'
+              'property list uchar int vertex_indices\nend_header\n' %
+              (len(vertices), len(triangles)))
+    files['ply (ascii)'] = os.path.join(directory, 'ascii.ply')
+    with open(files['ply (ascii)'], 'wb') as fileobj:
+        fileobj.write(header.format('ascii').encode())
+        np.savetxt(fileobj, vertices, fmt='%.6f')
+        np.savetxt(fileobj, triangles, fmt='3 %d %d %d')
+    files['ply (binary)'] = os.path.join(directory, 'binary.ply')
+    with open(files['ply (binary)'], 'wb') as fileobj:
+        fileobj.write(header.format('binary_little_endian').encode())
+        fileobj.write(vertices.astype('<f4').tobytes())
+        faces = np.zeros(len(triangles), [('n', 'u1'), ('v', '<i4', 3)])
+        faces['n'], faces['v'] = 3, triangles
+        fileobj.write(faces.tobytes())
+
+    corners = vertices[triangles]
+    files['stl (ascii)'] = os.path.join(directory, 'ascii.stl')
+    with open(files['stl (ascii)'], 'wb') as fileobj:
+        fileobj.write(b'solid surface\n')
+        np.savetxt(fileobj, corners.reshape(-1, 9), fmt=(
+            'facet normal 0 0 1\n outer loop\n  vertex %.6f %.6f %.6f\n'
+            '  vertex %.6f %.6f %.6f\n  vertex %.6f %.6f %.6f\n endloop\n'
+            'endfacet'
+        ))
+        fileobj.write(b'endsolid surface\n')
+    files['stl (binary)'] = os.path.join(directory, 'binary.stl')
+    with open(files['stl (binary)'], 'wb') as fileobj:
+        fileobj.write(b' ' * 80 + np.uint32(len(triangles)).tobytes())
+        records = np.zeros(len(triangles), [('normal', '<f4', 3),
+                                            ('corners', '<f4', 9),
+                                            ('attribute', '<u2')])
+        records['corners'] = corners.reshape(-1, 9)
+        fileobj.write(records.tobytes())
+    return files
+
+
+def main(n_triangles):
+    vertices, triangles = height_field(n_triangles)
+    directory = tempfile.mkdtemp()
+    try:
+        files = write_files(directory, vertices, triangles)
+        for label in sorted(files):
+            parser = steno3d.parsers.AllParsers(files[label])
+            start = time.time()
+            (project,) = parser.parse()
+            elapsed = time.time() - start
+            parsed = sum(res.mesh.nC for res in project.resources)
+            print('{:>13}: {:7.1f} MB, {} triangles in {:.2f} s '
+                  '({:.2f}M triangles/s)'.format(
+                      label, os.path.getsize(files[label]) / 1e6, parsed,
+                      elapsed, parsed / elapsed / 1e6
+                  ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,87 @@
+"""Throughput of raster ingestion into grid surfaces
+
+Usage: python benchmarks/bench_rasters.py [raster side] [max cells]
+
+Writes a square float32 elevation raster (8000 x 8000 by default) as an
+uncompressed TIFF and an ESRI ASCII grid in a temporary directory, then
+times parsing each into a Surface downsampled to at most max cells
+(1M by default), and reports the peak resident memory, which counts
+the pages of the memory-mapped files.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import steno3d
+
+
+def rows(side, start, stop):
+    y, x = np.mgrid[start:stop, 0:side].astype(np.float32)
+    return np.sin(x / 300) * np.cos(y / 300) * 100
+
+
+def write_files(directory, side):
+    files = {}
+    files['tif'] = os.path.join(directory, 'dem.tif')
+    entries = [(256, 4, side), (257, 4, side), (258, 3, 32), (259, 3, 1),
+               (273, 4, 16), (277, 3, 1), (278, 4, side),
+               (279, 4, side * side * 4), (339, 3, 3)]
+    with open(files['tif'], 'wb') as fileobj:
+        fileobj.write(b'II' + struct.pack('<HI', 42, 16 + side * side * 4))
+        fileobj.write(b'\0' * 8)
+        for start in range(0, side, 500):
+            fileobj.write(rows(side, start, min(start + 500, side))
+                          .astype('<f4').tobytes())
+        fileobj.write(struct.pack('<H', len(entries)))
+        for tag, kind, value in entries:
+            fileobj.write(struct.pack('<HHI', tag, kind, 1))
+            fileobj.write(struct.pack('<I' if kind == 4 else '<Hxx', value))
+        fileobj.write(b'\0' * 4)
+
+    files['asc'] = os.path.join(directory, 'dem.asc')
+    with open(files['asc'], 'wb') as fileobj:
+        fileobj.write('ncols {0}\nnrows {0}\nxllcorner 0\nyllcorner 0\n'
+                      'cellsize 1\n'.format(side).encode())
+        for start in range(0, side, 500):
+            np.savetxt(fileobj, rows(side, start, min(start + 500, side)),
+                       fmt='%.2f')
+    return files
+
+
+def main():
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    max_cells = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    directory = tempfile.mkdtemp()
+    try:
+        files = write_files(directory, side)
+        for name in ('tif', 'asc'):
+            size = os.path.getsize(files[name])
+            start = time.time()
+            (proj,) = steno3d.parsers.AllParsers(files[name]).parse(
+                max_cells=max_cells
+            )
+            elapsed = time.time() - start
+            print('{:4} {:8.1f} MB {:7.2f} s {:8.1f} MB/s  {} cells'.format(
+                name, size / 1e6, elapsed, size / 1e6 / elapsed,
+                proj.resources[0].mesh.nC
+            ))
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+        print('peak resident memory {:.0f} MB'.format(peak))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
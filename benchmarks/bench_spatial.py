@@ -0,0 +1,57 @@
+"""Time to reduce a large point cloud with Point.downsample and Point.thin
+
+Usage: python benchmarks/bench_spatial.py [number of points]
+
+Builds a LiDAR-like cloud over a wavy 1 km square with one data array,
+downsamples it to 5 m voxels, thins the result to 10 m spacing and
+times a few box and radius queries.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import time
+
+import numpy as np
+
+import steno3d
+
+
+def cloud(n_points):
+    points = np.random.rand(n_points, 3) * [1000, 1000, 1]
+    points[:, 2] += 20 * np.sin(points[:, 0] / 100) * np.cos(points[:, 1] / 80)
+    return points
+
+
+def main(n_points):
+    points = cloud(n_points)
+    point = steno3d.Point(
+        steno3d.Project(),
+        mesh=steno3d.Mesh0D(vertices=points),
+        data=[dict(data=steno3d.DataArray(array=points[:, 2]))]
+    )
+    start = time.time()
+    point.mesh.grid_index()
+    for center in np.random.rand(100, 3) * [1000, 1000, 20]:
+        point.mesh.query_radius(center, 10.)
+        point.mesh.query_box(center - 25, center + 25)
+    print('{} points indexed and queried 200 times in {:.2f} s'.format(
+        n_points, time.time() - start
+    ))
+    start = time.time()
+    point.downsample(5., how='mean')
+    print('downsampled to {} points in {:.2f} s'.format(
+        point.mesh.nN, time.time() - start
+    ))
+    start = time.time()
+    point.thin(10., how='max')
+    print('thinned to {} points in {:.2f} s'.format(
+        point.mesh.nN, time.time() - start
+    ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000000)
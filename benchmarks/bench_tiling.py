@@ -0,0 +1,65 @@
+"""Throughput of splitting a large orthophoto into texture tiles
+
+Usage: python benchmarks/bench_tiling.py [image side] [levels] [workers]
+
+Writes a square RGB image (8000 x 8000 by default) as a .npy file in a
+temporary directory, then times memory-mapping it and splitting it into
+2048 x 2048 PNG tiles with lower resolution levels (3 by default), and
+reports the peak resident memory, which counts the pages of the
+memory-mapped files.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import steno3d
+
+
+def write_image(file_name, side):
+    pixels = np.lib.format.open_memmap(file_name, mode='w+', dtype=np.uint8,
+                                       shape=(side, side, 3))
+    for start in range(0, side, 500):
+        y, x = np.mgrid[start:min(start + 500, side), 0:side]
+        pixels[start:start + 500] = np.dstack([
+            x % 256, y % 256, (np.sin(x / 50.) * np.cos(y / 50.) + 1) * 127
+        ])
+    pixels.flush()
+
+
+def main():
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    levels = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    directory = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(directory, 'ortho.npy')
+        write_image(file_name, side)
+        start = time.time()
+        tiles = steno3d.Texture2DImage.tiles(
+            file_name, U=[side, 0., 0.], V=[0., side, 0.], levels=levels,
+            workers=workers, directory=directory
+        )
+        elapsed = time.time() - start
+        print('{:8.1f} Mpixels {:7.2f} s {:8.1f} Mpixels/s  tiles {}'.format(
+            side * side / 1e6, elapsed, side * side / 1e6 / elapsed,
+            [len(level) for level in tiles]
+        ))
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+        print('peak resident memory {:.0f} MB'.format(peak))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
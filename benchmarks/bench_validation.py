@@ -0,0 +1,89 @@
+"""Peak memory of validating a large Mesh2D
+
+Usage: python benchmarks/bench_validation.py [number of triangles]
+                                             [baseline git revision]
+
+Constructs and validates a Mesh2D (4000000 triangles by default), and
+counts its serialized bytes, with this tree and with the steno3d package
+of a baseline revision (the root commit by default), extracted with git
+archive into a temporary directory. Each is measured in its own process on the same random mesh,
+and the memory high-water mark of the step is reported.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(n_triangles):
+    """Validate a random mesh with the steno3d on sys.path"""
+    import steno3d
+    np.random.seed(0)
+    n_vertices = n_triangles // 2
+    vertices = np.random.rand(n_vertices, 3)
+    triangles = np.random.randint(0, n_vertices, (n_triangles, 3))
+    tracemalloc.start()
+    start = time.time()
+    mesh = steno3d.Mesh2D(vertices=vertices, triangles=triangles)
+    mesh.validate()
+    nbytes = mesh._nbytes()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('peak {:8.1f} MB, {:6.3f} s ({} serialized bytes)'.format(
+        peak / 1e6, elapsed, nbytes
+    ))
+
+
+def run(label, path, n_triangles):
+    env = dict(os.environ, PYTHONPATH=path)
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', __file__, '--measure',
+         str(n_triangles)], env=env
+    )
+    print('{:>7}: {}'.format(label, output.decode('utf-8').strip()))
+
+
+def main(n_triangles, revision=None):
+    if revision is None:
+        revision = subprocess.check_output(
+            ['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=ROOT
+        ).decode('utf-8').split()[0]
+    input_mb = n_triangles * 1.5 * 8 * 3 / 1e6
+    print('{} triangles, {} vertices ({:.0f} MB of input)'.format(
+        n_triangles, n_triangles // 2, input_mb
+    ))
+    directory = tempfile.mkdtemp()
+    try:
+        archive = subprocess.Popen(
+            ['git', 'archive', revision, 'steno3d'], cwd=ROOT,
+            stdout=subprocess.PIPE
+        )
+        subprocess.check_call(['tar', '-x', '-C', directory],
+                              stdin=archive.stdout)
+        archive.wait()
+        run('before', directory, n_triangles)
+        run('after', ROOT, n_triangles)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(int(sys.argv[2]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 4000000,
+             sys.argv[2] if len(sys.argv) > 2 else None)
@@ -26,6 +26,7 @@ from __future__ import unicode_literals
 
 from atexit import register
 
+from . import cache
 from . import parsers
 from . import query
 from . import client
@@ -36,6 +37,7 @@ from .point import *
 from .surface import *
 from .texture import *
 from .volume import *
+from .lazy import LazyArray
 
 __version__ = '0.2.13'
 __author__ = '3point Science'
@@ -48,7 +50,9 @@ logout = client.Comms.logout
 
 try:
     del project, data, line, point, surface, texture, traits, volume
-    del base, client, options, user
+    del base, client, compression, geofiles, imaging, lazy, meshfiles
+    del meshops, options, parallel, rasters, spatial, sync, textio, tiling
+    del user
     del absolute_import, division, print_function, unicode_literals
     del register
 except NameError:
@@ -9,13 +9,29 @@ from __future__ import unicode_literals
 
 from json import dumps
 from pprint import pformat
+
+from numpy import arange, asarray, count_nonzero, empty
 from six import string_types
 
 from traitlets import All, observe, Undefined, validate
 
-from .client import Comms, needs_login, pause, plot
-from .traits import (_REGISTRY, HasSteno3DTraits, KeywordInstance, Repeated,
-                     String)
+from .client import Comms, needs_login, pause, plot, sent_hashes
+from .meshops import compact, kd_partition
+from .sync import SYNC_QUEUE
+from .traits import (_REGISTRY, Array, HasSteno3DTraits, KeywordInstance,
+                     Repeated, String, serialized_nbytes)
+
+
+def _copy_opts(opts):
+    """Keyword dict of the current option values, or None"""
+    if opts is None:
+        return None
+    return {name: getattr(opts, name) for name in opts.trait_names()}
+
+
+def split_long_uid(long_uid):
+    """Split a long uid into its resource class name and uid"""
+    return tuple(long_uid.split('Resource')[-1].split(':'))
 
 
 class classproperty(property):
@@ -38,6 +54,7 @@ class UserContent(HasSteno3DTraits):
     )
     _sync = False
     _upload_data = None
+    _file_hashes = {}
 
     @classproperty
     @classmethod
@@ -57,7 +74,7 @@ class UserContent(HasSteno3DTraits):
             )
         return cls.__model_api_location
 
-    def _upload(self, sync=False, verbose=True, tab_level=''):
+    def _upload(self, sync=False, verbose=True, tab_level='', recurse=True):
         if getattr(self, '_uploading', False):
             return
         try:
@@ -71,7 +88,9 @@ class UserContent(HasSteno3DTraits):
             self._uploading = True
             pause()
             assert self.validate()
-            self._upload_dirty(sync, verbose, tab_level + '    ')
+            if recurse:
+                self._upload_dirty(sync, verbose, tab_level + '    ')
+            generation = self._generation
             if getattr(self, '_upload_data', None) is None:
                 self._post(
                     self._get_dirty_data(force=True),
@@ -82,7 +101,9 @@ class UserContent(HasSteno3DTraits):
                 dirty_files = self._get_dirty_files()
                 if len(dirty_data) > 0 or len(dirty_files) > 0:
                     self._put(dirty_data, dirty_files)
-            self._mark_clean(recurse=False)
+            # Changes made on another thread during the upload keep
+            # their traits dirty for the next upload
+            self._mark_clean(recurse=False, generation=generation)
             self._sync = sync
             if verbose:
                 print(tab_level + '... Complete!')
@@ -113,8 +134,31 @@ class UserContent(HasSteno3DTraits):
 
     @observe(All)
     def _on_property_change(self, change):
-        if getattr(self, '_sync', False):
-            self._upload(self._sync)
+        sync = getattr(self, '_sync', False)
+        if not sync:
+            return
+        if sync is True and not SYNC_QUEUE.batching:
+            self._upload(sync)
+        else:
+            SYNC_QUEUE.schedule(self, 0 if sync is True else sync)
+
+    @staticmethod
+    def batch():
+        """Context manager that holds synced uploads until it exits
+
+        Within `with content.batch():`, changes to any synced content are
+        not uploaded. When the block exits, each changed resource is
+        uploaded once, with all of its changes, on a background thread.
+        """
+        return SYNC_QUEUE.batch()
+
+    @staticmethod
+    def flush(timeout=None):
+        """Wait until all pending synced uploads have been sent
+
+        Returns False if `timeout` seconds pass first.
+        """
+        return SYNC_QUEUE.flush(timeout)
 
     def _post(self, datadict=None, files=None):
         self._client_upload(Comms.post, 'api/' + self._model_api_location,
@@ -128,6 +172,17 @@ class UserContent(HasSteno3DTraits):
 
     def _client_upload(self, request_fcn, url,
                        datadict=None, files=None):
+        hashes = {}
+        if files:
+            datadict, files, hashes = Comms.delta_files(
+                datadict, files, self._file_hashes
+            )
+            if not datadict and not files:
+                self._file_hashes = dict(self._file_hashes,
+                                         **sent_hashes(hashes))
+                return
+        if files and Comms.chunk_size:
+            datadict, files = Comms.chunk_files(datadict, files)
         req = request_fcn(
             url,
             data=datadict if datadict else tuple(),
@@ -169,6 +224,7 @@ class UserContent(HasSteno3DTraits):
                     )
                 )
             self._upload_data = req['json']
+        self._file_hashes = dict(self._file_hashes, **sent_hashes(hashes))
 
     @property
     def _json(self):
@@ -194,25 +250,28 @@ class UserContent(HasSteno3DTraits):
         return resp['json']
 
     @classmethod
-    def _build(cls, src, copy=True, tab_level='', **kwargs):
+    def _build(cls, src, copy=True, tab_level='', verbose=True, **kwargs):
         if isinstance(src, HasSteno3DTraits):
             raise NotImplementedError('Copying instances not supported')
-        print('{tl}Downloading {cls}'.format(
-            tl=tab_level,
-            cls=cls._resource_class
-        ), end=': ')
+        if verbose:
+            print('{tl}Downloading {cls}'.format(
+                tl=tab_level,
+                cls=cls._resource_class
+            ), end=': ')
         if isinstance(src, string_types):
             json = cls._json_from_uid(src)
         else:
             json = src
         title = '' if json['title'] is None else json['title']
         desc = '' if json['description'] is None else json['description']
-        print(title)
+        if verbose:
+            print(title)
         res = cls._build_from_json(json, copy=copy, tab_level=tab_level,
                                    title=title, description=desc, **kwargs)
         if not copy:
             res._upload_data = json
-        print('{}...Complete!'.format(tab_level))
+        if verbose:
+            print('{}...Complete!'.format(tab_level))
         return res
 
     @classmethod
@@ -234,7 +293,8 @@ class BaseResource(UserContent):
 
 
     def _validate_file_size(self, name, arr):
-        if Comms.user.logged_in:
+        # With auto_partition on, oversized resources are split at upload
+        if Comms.user.logged_in and not Comms.auto_partition:
             file_limit = Comms.user.file_size_limit
             if self._nbytes(arr) > file_limit:
                 raise ValueError(
@@ -248,6 +308,11 @@ class BaseResource(UserContent):
 
 class CompositeResource(BaseResource):
     """A composite resource that stores references to lower-level objects."""
+    _backref_traits = ('project',)
+    # Name of the mesh array of vertex indices per cell, used by
+    # partition; None if every vertex is a cell
+    _cells = None
+
     project = Repeated(
         help='Project',
         trait=KeywordInstance(klass='Project')
@@ -279,15 +344,135 @@ class CompositeResource(BaseResource):
         return True
 
     @needs_login
-    def upload(self, sync=False, verbose=True, print_url=True):
+    def upload(self, sync=False, verbose=True, print_url=True, workers=None):
         """Upload the resource through its containing project(s)"""
         for proj in self.project:
-            proj.upload(sync, verbose, False)
+            proj.upload(sync, verbose, False, workers)
         if print_url:
             print(self._url)
         return self._url
 
-
+    def _remap_data(self, node_index=None, cell_index=None):
+        """Index node ('N') and cell ('CC') data to follow a changed mesh
+
+        Data at a location whose index is None is left alone.
+        """
+        for binder in self.data:
+            index = node_index if binder.location == 'N' else cell_index
+            if index is not None:
+                binder.data.array = asarray(binder.data.array)[index]
+
+    def _file_sizes(self):
+        """Serialized bytes of each mesh and data file"""
+        sizes = [serialized_nbytes(getattr(self.mesh, name))
+                 for name, trait in self.mesh.traits().items()
+                 if isinstance(trait, Array)]
+        return sizes + [binder.data._nbytes() for binder in self.data]
+
+    def _decimate_until(self, decimate_mesh, size, limit):
+        """Decimate the mesh and remap data until size() <= limit
+
+        `decimate_mesh(target)` reduces the mesh to about target cells
+        and returns its (node_index, cell_index). Size is assumed to
+        shrink in proportion to the number of cells. Returns the
+        combined (node_index, cell_index) into the original mesh.
+        """
+        node_index = arange(self.mesh.nN)
+        cell_index = arange(self.mesh.nC)
+        while size() > limit:
+            n_cells = self.mesh.nC
+            target = int(n_cells * min(.95, max(limit, 0) / size()))
+            nodes, cells = decimate_mesh(target)
+            if self.mesh.nC >= n_cells:
+                raise ValueError(
+                    'Mesh of {} cells cannot be reduced further to fit in '
+                    '{} bytes'.format(n_cells, limit)
+                )
+            self._remap_data(nodes, cells)
+            node_index, cell_index = node_index[nodes], cell_index[cells]
+        return node_index, cell_index
+
+    def partition(self, file_size_limit=None):
+        """Split the resource into pieces with every mesh and data file
+        within file_size_limit (by default, that of the logged in user)
+
+        Cells (or points) are divided spatially with a k-d tree. Each
+        piece is a new resource of the same class with the title,
+        description and options of this one, the same textures, and
+        data bindings holding its share of each data array. The pieces
+        are not added to any project; see Project.partition_resources.
+        """
+        if not self._can_partition():
+            raise ValueError('{} resources cannot be partitioned'.format(
+                self.__class__.__name__
+            ))
+        if file_size_limit is None:
+            file_size_limit = Comms.user.file_size_limit
+        vertices = asarray(self.mesh.vertices)
+        if self._cells is None:
+            cells = arange(len(vertices))[:, None]
+        else:
+            cells = asarray(getattr(self.mesh, self._cells))
+        centers = vertices[cells[:, 0]]
+        for i in range(1, cells.shape[1]):
+            centers = centers + vertices[cells[:, i]]
+
+        # Scratch space for counting the distinct nodes of each group in
+        # time proportional to the group: every node of the group is
+        # stamped with a position, and only the last stamp of each node
+        # survives, so no reset is needed between groups
+        stamps = empty(len(vertices), dtype=int)
+
+        def fits(cell_index):
+            if 4*cells.shape[1]*len(cell_index) > file_size_limit:
+                return False
+            nodes = cells[cell_index].ravel()
+            positions = arange(len(nodes))
+            stamps[nodes] = positions
+            n_nodes = count_nonzero(stamps[nodes] == positions)
+            return 12*n_nodes <= file_size_limit
+
+        return [self._piece(vertices, cells, cell_index)
+                for cell_index in kd_partition(centers, fits)]
+
+    def _can_partition(self):
+        return False
+
+    def _piece(self, vertices, cells, cell_index):
+        """New resource holding the given cells of this one"""
+        node_index, piece_cells = compact(cells[cell_index], len(vertices))
+        mesh_kwargs = dict(title=self.mesh.title,
+                           description=self.mesh.description,
+                           opts=_copy_opts(self.mesh.opts),
+                           vertices=vertices[node_index])
+        if self._cells is not None:
+            mesh_kwargs[self._cells] = piece_cells
+        data = []
+        for binder in self.data:
+            index = node_index if binder.location == 'N' else cell_index
+            data.append(dict(
+                location=binder.location,
+                data=binder.data.__class__(
+                    title=binder.data.title,
+                    description=binder.data.description,
+                    order=binder.data.order,
+                    array=asarray(binder.data.array)[index]
+                )
+            ))
+        kwargs = dict(project=[], title=self.title,
+                      description=self.description,
+                      opts=_copy_opts(self.opts),
+                      mesh=self.mesh.__class__(**mesh_kwargs), data=data)
+        if 'textures' in self.trait_names():
+            kwargs['textures'] = list(self.textures)
+        return self.__class__(**kwargs)
+
+    def _fit(self, decimate_mesh, file_size_limit):
+        if file_size_limit is None:
+            file_size_limit = Comms.user.file_size_limit
+        return self._decimate_until(
+            decimate_mesh, lambda: max(self._file_sizes()), file_size_limit
+        )
 
     def _get_dirty_data(self, force=False):
         datadict = super(CompositeResource, self)._get_dirty_data(force)
@@ -311,14 +496,21 @@ class CompositeResource(BaseResource):
             ])
         return datadict
 
-    def _upload_dirty(self, sync=False, verbose=True, tab_level=''):
+    def _dirty_leaves(self):
+        """Mesh, data and textures that must upload before this resource"""
         dirty = self._dirty
+        leaves = []
         if 'mesh' in dirty:
-            self.mesh._upload(sync, verbose, tab_level)
+            leaves += [self.mesh]
         if 'data' in dirty:
-            [d.data._upload(sync, verbose, tab_level) for d in self.data]
+            leaves += [d.data for d in self.data]
         if 'textures' in dirty:
-            [t._upload(sync, verbose, tab_level) for t in self.textures]
+            leaves += self.textures
+        return leaves
+
+    def _upload_dirty(self, sync=False, verbose=True, tab_level=''):
+        for leaf in self._dirty_leaves():
+            leaf._upload(sync, verbose, tab_level)
 
     @observe('project')
     def _fix_proj_res(self, change):
@@ -376,40 +568,55 @@ class CompositeResource(BaseResource):
             description=kwargs['description'],
             opts=json['meta']
         )
-        (mesh_string, mesh_uid) = (
-            json['mesh']['uid'].split('Resource')[-1].split(':')
-        )
-        mesh_class = _REGISTRY[mesh_string]
-
-        res.mesh = mesh_class._build(mesh_uid, copy, tab_level + '    ')
+        res.mesh = cls._build_child(json['mesh']['uid'], copy, tab_level,
+                                    **kwargs)
 
         if 'textures' in json:
             res.textures = []
             for t in json['textures']:
-                (tex_string, tex_uid) = (
-                    t['uid'].split('Resource')[-1].split(':')
-                )
-                tex_class = _REGISTRY[tex_string]
-                res.textures += [tex_class._build(
-                    tex_uid, copy, tab_level + '    '
+                res.textures += [cls._build_child(
+                    t['uid'], copy, tab_level, **kwargs
                 )]
 
         if 'data' in json:
             res.data = []
             for d in json['data']:
-                (data_string, data_uid) = (
-                    d['uid'].split('Resource')[-1].split(':')
-                )
-                data_class = _REGISTRY[data_string]
                 res.data += [dict(
                     location=d['location'],
-                    data=data_class._build(
-                        data_uid, copy, tab_level + '    '
+                    data=cls._build_child(
+                        d['uid'], copy, tab_level, **kwargs
                     )
                 )]
 
         return res
 
+    @staticmethod
+    def _child_uids(json):
+        """Long uids of the mesh, textures and data in resource json"""
+        return ([json['mesh']['uid']] +
+                [t['uid'] for t in json.get('textures', [])] +
+                [d['uid'] for d in json.get('data', [])])
+
+    @staticmethod
+    def _build_child(long_uid, copy, tab_level, **kwargs):
+        """Build a mesh, texture or data resource from its long uid
+
+        Resources already built into the dict kwargs['prefetched'] are
+        reused, and new ones are added to it, so composite resources
+        that refer to the same uid share one instance.
+        """
+        prefetched = kwargs.get('prefetched')
+        if prefetched is not None and long_uid in prefetched:
+            return prefetched[long_uid]
+        (class_string, uid) = split_long_uid(long_uid)
+        child = _REGISTRY[class_string]._build(
+            uid, copy, tab_level + '    ',
+            memmap_dir=kwargs.get('memmap_dir')
+        )
+        if prefetched is not None:
+            prefetched[long_uid] = child
+        return child
+
 
 class BaseMesh(BaseResource):
     """Base class for all mesh resources. These are contained within
@@ -0,0 +1,187 @@
+"""cache.py contains the on-disk cache for downloaded resource payloads
+
+Enable the cache with `steno3d.cache.enable()`. Arrays and images that are
+downloaded while building projects are then saved locally, keyed by the
+resource long uid, a hash of the resource json (its revision) and the
+file name. Building the same unchanged project again reads the payloads
+from disk instead of the network; the resource json is still fetched,
+since it gives the revision. Only payloads are cached. The least
+recently used entries are evicted once the cache grows past its size
+limit.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from hashlib import sha1
+from json import dumps
+from os import listdir, makedirs, remove, rename, utime
+from os.path import (expanduser, getmtime, getsize, isdir, join, realpath,
+                     sep)
+from shutil import copyfileobj
+from six import string_types
+from threading import Lock
+from uuid import uuid4
+
+
+DEFAULT_MAX_SIZE = 2147483648
+
+_CACHE = [None]
+
+
+class DownloadCache(object):
+    """Least recently used cache of downloaded payloads in a directory
+
+    Each entry is a raw payload file `<key>.dat`. Keys already cover
+    the resource revision, so entries need no other metadata.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = sep.join([expanduser('~'), '.steno3d_client',
+                                  'cache'])
+        directory = realpath(expanduser(directory))
+        if not isdir(directory):
+            makedirs(directory)
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = Lock()
+
+    @staticmethod
+    def revision(json):
+        """Content hash of resource json
+
+        Query strings are dropped from payload urls first; they hold
+        short-lived signatures that change on every request while the
+        underlying file does not.
+        """
+        def strip(value):
+            if isinstance(value, dict):
+                return {k: strip(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [strip(v) for v in value]
+            if isinstance(value, string_types) and value.startswith('http'):
+                return value.split('?')[0]
+            return value
+        return sha1(
+            dumps(strip(json), sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def entry_key(long_uid, revision, name):
+        """Cache key for one file of one revision of a resource"""
+        return sha1('{}:{}:{}'.format(
+            long_uid, revision, name
+        ).encode('utf-8')).hexdigest()
+
+    def _path(self, key, ext='.dat'):
+        return join(self.directory, key + ext)
+
+    def read(self, key):
+        """The cached payload for key, opened for reading, or None if
+        missing
+
+        A hit marks the entry as most recently used. Another thread may
+        evict the entry at any time, so any error opening it is a miss;
+        once open, the file stays readable until it is closed.
+        """
+        try:
+            fileobj = open(self._path(key), 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            utime(self._path(key), None)
+        except OSError:
+            fileobj.close()
+            return None
+        return fileobj
+
+    def put(self, key, fileobj):
+        """Save the contents of fileobj as the payload for key
+
+        The payload is written to a temporary file and renamed into
+        place, so concurrent readers never see a partial entry.
+        """
+        tmp_path = self._path(uuid4().hex, '.tmp')
+        with open(tmp_path, 'wb') as tmp:
+            copyfileobj(fileobj, tmp)
+        with self._lock:
+            self._remove(key)
+            rename(tmp_path, self._path(key))
+            self._evict()
+        return self._path(key)
+
+    @property
+    def size(self):
+        """Total bytes of cached payloads"""
+        return sum(getsize(join(self.directory, fname))
+                   for fname in listdir(self.directory)
+                   if fname.endswith('.dat'))
+
+    def _evict(self):
+        """Remove least recently used entries until under max_size"""
+        entries = []
+        for fname in listdir(self.directory):
+            if not fname.endswith('.dat'):
+                continue
+            path = join(self.directory, fname)
+            try:
+                entries.append((getmtime(path), getsize(path), fname))
+            except OSError:
+                continue
+        total = sum(entry[1] for entry in entries)
+        for _, nbytes, fname in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(fname[:-4])
+            total -= nbytes
+
+    def _remove(self, key):
+        try:
+            remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            for fname in listdir(self.directory):
+                if fname.endswith('.dat'):
+                    self._remove(fname[:-4])
+
+
+def enable(directory=None, max_size=DEFAULT_MAX_SIZE):
+    """Cache downloaded arrays and images on disk
+
+    Optional arguments:
+        directory - Folder for cached payloads
+                    (Default: ~/.steno3d_client/cache)
+        max_size  - Size limit in bytes; least recently used payloads are
+                    evicted beyond this (Default: 2 GB)
+    """
+    _CACHE[0] = DownloadCache(directory, max_size)
+    return _CACHE[0]
+
+
+def disable():
+    """Stop caching downloads; existing cached files are kept"""
+    _CACHE[0] = None
+
+
+def get_cache():
+    """The active DownloadCache, or None if caching is disabled"""
+    return _CACHE[0]
+
+
+def cache_key(json, name):
+    """Cache key for file `name` of resource json, or None if disabled
+
+    The key combines the resource long uid, a content hash of its json and
+    the file name.
+    """
+    if _CACHE[0] is None:
+        return None
+    return DownloadCache.entry_key(json.get('longUid', json.get('uid')),
+                                   DownloadCache.revision(json), name)
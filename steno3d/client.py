@@ -7,25 +7,49 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from base64 import b64encode
 from builtins import input
 from builtins import str
 from functools import wraps
+from hashlib import md5
 from os import mkdir
 from os import path
 from time import sleep
+from uuid import uuid4
 
 import requests
-from six import string_types
+from requests.adapters import HTTPAdapter
+from six import binary_type, string_types, text_type
 from six.moves.urllib.parse import urlparse
 
+from .compression import CompressedStream, check_codec
+from .traits import FileProp
 from .user import User
 
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
+
 
 __version__ = '0.2.13'
 
 PRODUCTION_BASE_URL = 'https://steno3d.com/'
 SLEEP_TIME = .75
 
+POOL_SIZE = 10
+RETRIES = 3
+BACKOFF_FACTOR = .5
+RETRY_STATUS = (500, 502, 503, 504)
+CHUNK_SIZE = None
+DELTA_UPLOADS = False
+DELTA_BLOCK_SIZE = 65536
+COMPRESSION = None
+AUTO_PARTITION = False
+TEXTURE_PIXELS = None
+JPEG_TEXTURES = False
+COMPRESSIBLE_TYPES = ('<f4', '<i4')
+
 DEVKEY_PROMPT = "If you have a Steno3D developer key, please enter it here > "
 
 WELCOME_MESSAGE = """
@@ -139,6 +163,247 @@ def pause():
         sleep(SLEEP_TIME)
 
 
+def _file_length(fileobj):
+    """Number of bytes left to read in a file-like object"""
+    if hasattr(fileobj, '__len__'):
+        return len(fileobj) - fileobj.tell()
+    position = fileobj.tell()
+    fileobj.seek(0, 2)
+    length = fileobj.tell() - position
+    fileobj.seek(position)
+    return length
+
+
+def block_hashes(fileobj, block_size=DELTA_BLOCK_SIZE):
+    """MD5 digest of each block of the rest of a file-like object
+
+    The file position is restored afterwards.
+    """
+    start = fileobj.tell()
+    hashes = []
+    while True:
+        block = fileobj.read(block_size)
+        if len(block) == 0:
+            break
+        hashes.append(md5(block).digest())
+    fileobj.seek(start)
+    return hashes
+
+
+class _HashingStream(object):
+    """File-like object that hashes the blocks of another file as the
+    file is read, for `block_hashes` without a separate pass"""
+
+    def __init__(self, fileobj, block_size=DELTA_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self._start = fileobj.tell()
+        self._length = _file_length(fileobj)
+        self._hashed = 0
+        self._block = md5()
+        self._block_length = 0
+        self._hashes = []
+
+    @property
+    def name(self):
+        return self.fileobj.name
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seek(self, offset, whence=0):
+        return self.fileobj.seek(offset, whence)
+
+    def read(self, size=-1):
+        position = self.fileobj.tell() - self._start
+        data = self.fileobj.read(size)
+        # Only bytes read in order from the start are hashed; re-reads
+        # after a seek back are not hashed again
+        if position == self._hashed:
+            self._update(data)
+        return data
+
+    def _update(self, data):
+        self._hashed += len(data)
+        while len(data) > 0:
+            size = self.block_size - self._block_length
+            self._block.update(data[:size])
+            self._block_length += len(data[:size])
+            data = data[size:]
+            if self._block_length == self.block_size:
+                self._hashes.append(self._block.digest())
+                self._block = md5()
+                self._block_length = 0
+
+    def close(self):
+        self.fileobj.close()
+
+    @property
+    def hashes(self):
+        """(size, block hashes) of the file, as delta_files records them,
+        or None if it has not been read in full"""
+        if self._hashed != self._length:
+            return None
+        if self._block_length > 0:
+            return self._length, self._hashes + [self._block.digest()]
+        return self._length, list(self._hashes)
+
+
+def sent_hashes(hashes):
+    """The (size, block hashes) of each file from the hashes returned by
+    Comms.delta_files, once the files have been sent
+
+    Files that were not read in full are left out, so they are sent
+    again next time.
+    """
+    sent = {}
+    for name, value in hashes.items():
+        if isinstance(value, _HashingStream):
+            value = value.hashes
+        if value is not None:
+            sent[name] = value
+    return sent
+
+
+class _BlockStream(object):
+    """Read-only file-like object over selected blocks of another file"""
+
+    def __init__(self, fileobj, blocks, block_size, name='delta.dat'):
+        self.fileobj = fileobj
+        self.name = name
+        self._start = fileobj.tell()
+        self._total = _file_length(fileobj)
+        self._spans = []
+        for block in blocks:
+            offset = block*block_size
+            self._spans.append(
+                (offset, min(block_size, self._total - offset))
+            )
+        self.seek(0)
+
+    def __len__(self):
+        return sum(length for _, length in self._spans)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self)
+        self._position = min(max(offset, 0), len(self))
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self) - self._position
+        pieces = []
+        span_start = 0
+        for offset, length in self._spans:
+            if size <= 0:
+                break
+            span_end = span_start + length
+            if self._position < span_end:
+                skip = self._position - span_start
+                self.fileobj.seek(self._start + offset + skip)
+                piece = self.fileobj.read(min(length - skip, size))
+                pieces.append(piece)
+                size -= len(piece)
+                self._position += len(piece)
+            span_start = span_end
+        return b''.join(pieces)
+
+    def close(self):
+        self.fileobj.close()
+
+
+class _MultipartStream(object):
+    """Read-only file-like multipart/form-data request body
+
+    Form fields are encoded up front; files are read lazily in whatever
+    block size the HTTP connection asks for, so file contents are never
+    copied into one request body in memory.
+    """
+
+    def __init__(self, data, files):
+        boundary = uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=' + boundary
+        self._parts = []
+        for name, value in data:
+            self._add_field(boundary, name, value)
+        for name, value in files:
+            if hasattr(value, 'read'):
+                self._add_file(boundary, name, value)
+            else:
+                self._add_field(boundary, name, value)
+        self._parts.append('--{}--\r\n'.format(boundary).encode('utf-8'))
+        self._starts = [part.tell() if hasattr(part, 'read') else 0
+                        for part in self._parts]
+        self._lengths = [_file_length(part) if hasattr(part, 'read')
+                         else len(part) for part in self._parts]
+        self.seek(0)
+
+    def _add_field(self, boundary, name, value):
+        if not isinstance(value, binary_type):
+            value = text_type(value).encode('utf-8')
+        self._parts.append((
+            '--{b}\r\nContent-Disposition: form-data; '
+            'name="{n}"\r\n\r\n'.format(b=boundary, n=name)
+        ).encode('utf-8') + value + b'\r\n')
+
+    def _add_file(self, boundary, name, fileobj):
+        filename = path.basename(text_type(getattr(fileobj, 'name', name)))
+        self._parts.append((
+            '--{b}\r\nContent-Disposition: form-data; name="{n}"; '
+            'filename="{f}"\r\n\r\n'.format(b=boundary, n=name, f=filename)
+        ).encode('utf-8'))
+        self._parts.append(fileobj)
+        self._parts.append(b'\r\n')
+
+    def __len__(self):
+        return sum(self._lengths)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self)
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        for part, start in zip(self._parts, self._starts):
+            if hasattr(part, 'read'):
+                part.seek(start)
+        while self._position < offset:
+            if len(self.read(min(offset - self._position, 65536))) == 0:
+                break
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self) - self._position
+        pieces = []
+        while size > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if hasattr(part, 'read'):
+                piece = part.read(size)
+            else:
+                piece = part[self._offset:self._offset + size]
+                self._offset += len(piece)
+            if len(piece) == 0:
+                self._index += 1
+                self._offset = 0
+                continue
+            pieces.append(piece)
+            size -= len(piece)
+            self._position += len(piece)
+        return b''.join(pieces)
+
+
 class _Comms(object):
     """Comms controls the interaction between the python client and the
     Steno3D website.
@@ -148,6 +413,265 @@ class _Comms(object):
         self.user = User()
         self._base_url = PRODUCTION_BASE_URL
         self._hard_devel_key = None
+        self._session = None
+        self.pool_size = POOL_SIZE
+        self.retries = RETRIES
+        self.backoff_factor = BACKOFF_FACTOR
+        self.timeout = None
+        self.chunk_size = CHUNK_SIZE
+        self.delta_uploads = DELTA_UPLOADS
+        self.compression = COMPRESSION
+        self.auto_partition = AUTO_PARTITION
+        self.texture_pixels = TEXTURE_PIXELS
+        self.jpeg_textures = JPEG_TEXTURES
+
+    @property
+    def session(self):
+        """requests.Session that keeps connections to Steno3D alive"""
+        if getattr(self, '_session', None) is None:
+            retry = Retry(
+                total=self.retries,
+                backoff_factor=self.backoff_factor,
+                status_forcelist=RETRY_STATUS,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size,
+                max_retries=retry
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(
+                {'client': 'steno3dpy:{}'.format(__version__)}
+            )
+            self._session = session
+        return self._session
+
+    def configure(self, pool_size=None, retries=None, backoff_factor=None,
+                  timeout=None, chunk_size=None, delta_uploads=None,
+                  compression=None, auto_partition=None,
+                  texture_pixels=None, jpeg_textures=None):
+        """Configure the HTTP connection pool used for all requests
+
+        Optional arguments:
+            pool_size      - Maximum number of connections kept alive per
+                             host (Default: 10)
+            retries        - Number of times a request is retried after a
+                             connection error or 5xx response (Default: 3)
+            backoff_factor - Retry delays grow as
+                             backoff_factor * 2 ** (retry - 1) seconds
+                             (Default: 0.5)
+            timeout        - Seconds to wait for the server to connect and
+                             respond, or a (connect, read) tuple. None waits
+                             forever (Default: None)
+            chunk_size     - Files larger than this many bytes are sent in
+                             resumable parts of this size rather than in
+                             one request. Set to 0 to disable
+                             (Default: disabled)
+            delta_uploads  - If True, files that changed in place are sent
+                             as only their changed blocks. Only enable
+                             this for servers that accept deltas
+                             (Default: False)
+            compression    - Codec used to compress array payloads,
+                             'zlib' or 'zstd' (which needs the zstandard
+                             package). Set to False to send raw arrays.
+                             Only enable this for servers that accept
+                             compressed payloads (Default: False)
+            auto_partition - If True, Surface, Point and Line resources
+                             with files over the file size limit are
+                             allowed, and are split into pieces under
+                             the limit when their project is uploaded
+                             (Default: False)
+            texture_pixels - Texture images with more pixels than this
+                             are downsampled to fit when uploaded. Set
+                             to 0 to send images at full resolution
+                             (Default: full resolution)
+            jpeg_textures  - If True, JPEG texture images are sent as
+                             JPEG, and large opaque PNG images are sent
+                             as JPEG if Pillow is installed. Otherwise
+                             all textures are sent as PNG
+                             (Default: False)
+
+        Session cookies are kept; the connection pool is rebuilt on the
+        next request.
+        """
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if retries is not None:
+            self.retries = retries
+        if backoff_factor is not None:
+            self.backoff_factor = backoff_factor
+        if timeout is not None:
+            self.timeout = timeout
+        if chunk_size is not None:
+            self.chunk_size = chunk_size or None
+        if delta_uploads is not None:
+            self.delta_uploads = delta_uploads
+        if compression is not None:
+            if compression:
+                check_codec(compression)
+            self.compression = compression or None
+        if auto_partition is not None:
+            self.auto_partition = auto_partition
+        if texture_pixels is not None:
+            self.texture_pixels = texture_pixels or None
+        if jpeg_textures is not None:
+            self.jpeg_textures = jpeg_textures
+        if getattr(self, '_session', None) is not None:
+            cookies = self._session.cookies
+            self._session.close()
+            self._session = None
+            self.session.cookies.update(cookies)
+
+    def _reset_session(self):
+        """Close pooled connections and drop cookies"""
+        if getattr(self, '_session', None) is not None:
+            self._session.close()
+        self._session = None
+
+    def delta_files(self, data, files, previous):
+        """Drop unchanged files and reduce changed ones to deltas
+
+        `previous` maps file names to the (size, block hashes) of their
+        last upload. Files that match are removed. If delta_uploads is on,
+        a file of the same size with some changed blocks is replaced by
+        '<name>Delta', holding only those blocks, with '<name>DeltaBlocks'
+        and '<name>DeltaBlockSize' fields to place them. Returns the new
+        (data, files, hashes), where hashes maps every given file name to
+        its current (size, block hashes); pass it to sent_hashes after
+        the upload.
+
+        Files are hashed here only if they have previous hashes to
+        compare with. Others are hashed as they are sent.
+        """
+        data = dict(data) if data else {}
+        remaining = {}
+        hashes = {}
+        for name, fileprop in dict(files).items():
+            old = previous.get(name)
+            if old is None:
+                hashes[name] = _HashingStream(fileprop.file)
+                remaining[name] = fileprop._replace(file=hashes[name])
+                continue
+            hashes[name] = (_file_length(fileprop.file),
+                            block_hashes(fileprop.file))
+            if old == hashes[name]:
+                fileprop.file.close()
+                continue
+            if not self.delta_uploads or old[0] != hashes[name][0]:
+                remaining[name] = fileprop
+                continue
+            changed = zip(old[1], hashes[name][1])
+            blocks = [i for i, (a, b) in enumerate(changed) if a != b]
+            data[name + 'DeltaBlocks'] = ','.join(str(b) for b in blocks)
+            data[name + 'DeltaBlockSize'] = DELTA_BLOCK_SIZE
+            remaining[name + 'Delta'] = FileProp(
+                _BlockStream(fileprop.file, blocks, DELTA_BLOCK_SIZE),
+                fileprop.dtype
+            )
+        return data, remaining, hashes
+
+    def chunk_files(self, data, files):
+        """Send files larger than chunk_size as chunked uploads
+
+        Each large file is replaced in the returned data by a
+        '<name>Upload' field holding its upload uid (and a '<name>Type'
+        field for its dtype). Returns the new (data, files).
+        """
+        data = dict(data) if data else {}
+        remaining = {}
+        for name, fileprop in dict(files).items():
+            if (not self.chunk_size or
+                    _file_length(fileprop.file) <= self.chunk_size):
+                remaining[name] = fileprop
+                continue
+            fileprop = self.compress(fileprop)
+            data[name + 'Upload'] = self.chunked_upload(fileprop.file, name)
+            data[name + 'Type'] = fileprop.dtype
+            if fileprop.encoding is not None:
+                data[name + 'Encoding'] = fileprop.encoding
+            fileprop.file.close()
+        return data, remaining
+
+    def compress(self, fileprop):
+        """Compressed FileProp for an array payload if compression is on
+
+        Images, already encoded payloads and everything sent while
+        compression is off are returned unchanged.
+        """
+        if (not self.compression or fileprop.encoding is not None or
+                fileprop.dtype not in COMPRESSIBLE_TYPES):
+            return fileprop
+        stream = CompressedStream(fileprop.file, fileprop.dtype,
+                                  self.compression)
+        return FileProp(stream, fileprop.dtype, stream.encoding)
+
+    def chunked_upload(self, fileobj, name='file'):
+        """Upload a file-like object in parts of chunk_size bytes
+
+        An upload is started with the server and every part is sent with
+        its MD5 checksum. If a part fails, the server is asked which parts
+        it has acknowledged and only the missing or corrupt parts are sent
+        again, for up to `retries` more rounds. Returns the upload uid.
+        """
+        chunk_size = self.chunk_size
+        start = fileobj.tell()
+        size = _file_length(fileobj)
+        n_parts = max(1, -(-size // chunk_size))
+        resp = self.post('api/upload', data={
+            'name': name,
+            'size': size,
+            'partSize': chunk_size,
+            'parts': n_parts,
+        })
+        if resp['status_code'] != 200:
+            raise IOError('Failed to start chunked upload: {}'.format(name))
+        upload_uid = resp['json']['uid']
+        checksums = {}
+        for attempt in range(self.retries + 1):
+            try:
+                acked = self._acknowledged_parts(upload_uid) if attempt else {}
+                for index in range(n_parts):
+                    if (index in checksums and
+                            acked.get(index) == checksums[index]):
+                        continue
+                    fileobj.seek(start + index*chunk_size)
+                    checksums[index] = self._upload_part(
+                        upload_uid, index, fileobj.read(chunk_size)
+                    )
+                return upload_uid
+            except IOError:
+                if attempt == self.retries:
+                    raise
+
+    def _upload_part(self, upload_uid, index, part):
+        """Send one part of a chunked upload; return its checksum"""
+        checksum = b64encode(md5(part).digest()).decode('utf-8')
+        resp = self.session.put(
+            '{base}api/upload/{uid}/{index}'.format(
+                base=self.base_url, uid=upload_uid, index=index
+            ),
+            data=part,
+            headers={
+                'sshKey': self.user.devel_key,
+                'Content-Type': 'application/octet-stream',
+                'Content-MD5': checksum,
+            },
+            timeout=self.timeout
+        )
+        if resp.status_code != 200:
+            raise IOError('Upload of part {} failed'.format(index))
+        return checksum
+
+    def _acknowledged_parts(self, upload_uid):
+        """Map of part index to checksum for parts the server holds"""
+        resp = self.get('api/upload/{}'.format(upload_uid))
+        if resp['status_code'] != 200:
+            raise IOError('Failed to query upload: {}'.format(upload_uid))
+        return {int(index): checksum for index, checksum
+                in resp['json']['parts'].items()}
 
     @property
     def host(self):
@@ -286,9 +810,10 @@ class _Comms(object):
     def _version_ok(self):
         """Check current Steno3D client version in the database"""
         try:
-            resp = requests.post(
+            resp = self.session.post(
                 self.base_url + 'api/client/steno3dpy',
-                dict(version=__version__)
+                dict(version=__version__),
+                timeout=self.timeout
             )
         except requests.ConnectionError:
             print(NOT_CONNECTED)
@@ -340,10 +865,10 @@ class _Comms(object):
             print(BAD_API_KEY.format(base_url=self.base_url))
             return
         try:
-            resp = requests.get(
+            resp = self.session.get(
                 self.base_url + 'api/me',
-                headers={'sshKey': devel_key,
-                         'client': 'steno3dpy:{}'.format(__version__)}
+                headers={'sshKey': devel_key},
+                timeout=self.timeout
             )
         except requests.ConnectionError:
             print(NOT_CONNECTED)
@@ -354,7 +879,6 @@ class _Comms(object):
             return
         self.user.login_with_json(resp.json())
         self.user.set_key(devel_key)
-        self._cookies = dict(resp.cookies)
         print(
             'Welcome to Steno3D! You are logged in as @{name}'.format(
                 name=self.user.username
@@ -376,45 +900,53 @@ class _Comms(object):
             _Comms.get('signout')
             print('Goodbye, @{}.'.format(self.user.username))
         self._base_url = PRODUCTION_BASE_URL
+        self._reset_session()
         self.user.logout()
 
     @staticmethod
     def post(url, data=None, files=None):
         """Post data and files to the steno3d online endpoint"""
-        return _Comms._communicate(requests.post, url, data, files)
+        return _Comms._communicate('post', url, data, files)
 
     @staticmethod
     def put(url, data=None, files=None):
         """Put data and files to the steno3d online endpoint"""
-        return _Comms._communicate(requests.put, url, data, files)
+        return _Comms._communicate('put', url, data, files)
 
     @staticmethod
     def get(url):
         """Make a get request from a steno3d online endpoint"""
-        return _Comms._communicate(requests.get, url, None, None)
+        return _Comms._communicate('get', url, None, None)
 
     @staticmethod
-    def _communicate(request_fcn, url, data, files):
+    def _communicate(method, url, data, files):
         """Post data and files to the steno3d online endpoint"""
         data = {} if data is None else data
-        files = {} if files is None else files
+        files = {} if files is None else dict(files)
         filedict = {}
-        for filename in files:
+        for filename in list(files):
             if hasattr(files[filename], 'dtype'):
+                files[filename] = Comms.compress(files[filename])
                 filedict[filename] = files[filename].file
                 filedict[filename + 'Type'] = files[filename].dtype
+                if files[filename].encoding is not None:
+                    filedict[filename + 'Encoding'] = files[filename].encoding
             else:
                 filedict[filename] = files[filename]
-        req = request_fcn(
+        headers = {'sshKey': Comms.user.devel_key}
+        if len(filedict) > 0:
+            data = _MultipartStream(
+                data.items() if isinstance(data, dict) else data,
+                filedict.items()
+            )
+            headers['Content-Type'] = data.content_type
+        req = Comms.session.request(
+            method,
             Comms.base_url + url,
             data=data,
-            files=filedict,
-            headers={'sshKey': Comms.user.devel_key,
-                     'client': 'steno3dpy:{}'.format(__version__)},
-            cookies=Comms._cookies
+            headers=headers,
+            timeout=Comms.timeout
         )
-        if req.status_code < 210:
-            Comms._cookies.update(req.cookies)
         for key in files:
             files[key].file.close()
 
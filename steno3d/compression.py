@@ -0,0 +1,242 @@
+"""compression.py contains the optional compressed encoding for array
+payloads
+
+Serialized arrays are split into blocks. Each block is filtered so its
+bytes compress well, then compressed on a thread pool, and written as a
+frame: a little-endian uint32 raw length, a uint32 compressed length and
+the compressed bytes. Frames are independent, so they can be decoded in
+parallel as the response streams in.
+
+Filters depend on the array type. Float arrays are byte-shuffled, so the
+sign and exponent bytes of neighbouring values sit together. Int arrays
+are delta-encoded within each block before the shuffle, which turns the
+slowly increasing indices of vertices and segments into small numbers.
+
+The encoding of a payload is named by its filter and codec, for example
+'shuffle-zlib' or 'delta-shuffle-zstd'. zlib is always available; zstd
+requires the `zstandard` package.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from struct import Struct
+from tempfile import SpooledTemporaryFile
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BLOCK_SIZE = 1048576
+SPOOL_SIZE = 67108864
+LEVELS = {'zlib': 1, 'zstd': 3}
+FRAME_HEADER = Struct('<II')
+
+
+def codecs():
+    """Names of the compression codecs available in this environment"""
+    return [codec for codec in LEVELS
+            if codec != 'zstd' or zstandard is not None]
+
+
+def check_codec(codec):
+    """Raise ValueError if codec cannot be used here"""
+    if codec not in LEVELS:
+        raise ValueError('{}: compression must be one of {}'.format(
+            codec, ', '.join(sorted(LEVELS))
+        ))
+    if codec not in codecs():
+        raise ValueError(
+            '{}: compression requires the zstandard package'.format(codec)
+        )
+
+
+def encoding_name(dtype, codec):
+    """Encoding used for a payload of dtype compressed with codec"""
+    if np.dtype(dtype).kind in ('i', 'u'):
+        return 'delta-shuffle-' + codec
+    return 'shuffle-' + codec
+
+
+def _parse(encoding):
+    """Split an encoding name into (delta, codec)"""
+    parts = encoding.split('-')
+    if (parts[-1] not in LEVELS or
+            parts[:-1] not in (['shuffle'], ['delta', 'shuffle'])):
+        raise ValueError('{}: unknown payload encoding'.format(encoding))
+    check_codec(parts[-1])
+    return parts[0] == 'delta', parts[-1]
+
+
+def _compressor(codec, level):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda raw: zlib.compress(raw, level)
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        decompressor = zstandard.ZstdDecompressor()
+        return lambda frame, size: decompressor.decompress(
+            frame, max_output_size=size
+        )
+    return lambda frame, size: zlib.decompress(frame)
+
+
+def encode_block(raw, dtype, delta, compress):
+    """Filter and compress one block of serialized values"""
+    values = np.frombuffer(raw, dtype)
+    if delta and len(values) > 1:
+        values = np.concatenate([values[:1], np.diff(values)])
+    shuffled = values.view(np.uint8).reshape(-1, values.itemsize).T
+    frame = compress(np.ascontiguousarray(shuffled).tobytes())
+    return FRAME_HEADER.pack(len(raw), len(frame)) + frame
+
+
+def decode_block(frame, size, dtype, delta, decompress):
+    """Decompress and unfilter one frame into an array of dtype"""
+    raw = np.frombuffer(decompress(frame, size), np.uint8)
+    if len(raw) != size:
+        raise IOError('Compressed frame has the wrong length.')
+    values = np.ascontiguousarray(
+        raw.reshape(dtype.itemsize, -1).T
+    ).view(dtype).reshape(-1)
+    if delta:
+        values = np.cumsum(values, dtype=dtype)
+    return values
+
+
+def ordered_map(func, items, workers=None):
+    """Yield func(item) for each item, in order, from a thread pool
+
+    At most a few items per worker are read ahead, so items produced
+    lazily (such as blocks read from a stream) are never all in memory.
+    """
+    workers = cpu_count() if workers is None else workers
+    if workers < 2:
+        for item in items:
+            yield func(item)
+        return
+    pool = ThreadPool(workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= 2*workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class CompressedStream(object):
+    """Read-only file-like object with the compressed encoding of a
+    serialized array stream
+
+    The source is read a block at a time and blocks are compressed on
+    `workers` threads. Multipart request bodies need their length up
+    front, so compressed frames are spooled (in memory up to SPOOL_SIZE,
+    then to a temporary file) the first time the stream is read or sized;
+    the uncompressed array is never held in memory.
+    """
+
+    def __init__(self, fileobj, dtype, codec='zlib', level=None,
+                 block_size=BLOCK_SIZE, workers=None):
+        check_codec(codec)
+        self.fileobj = fileobj
+        self.dtype = np.dtype(dtype)
+        self.codec = codec
+        self.level = LEVELS[codec] if level is None else level
+        self.block_size = block_size - block_size % self.dtype.itemsize
+        self.workers = workers
+        self.encoding = encoding_name(self.dtype, codec)
+        self.name = getattr(fileobj, 'name', 'array.dat')
+        self.closed = False
+        self._spool = None
+
+    def _encoded(self):
+        if self._spool is None:
+            spool = SpooledTemporaryFile(SPOOL_SIZE)
+            delta = self.encoding.startswith('delta')
+            compress = _compressor(self.codec, self.level)
+
+            def blocks():
+                while True:
+                    raw = self.fileobj.read(self.block_size)
+                    if len(raw) == 0:
+                        break
+                    yield raw
+
+            def encode(raw):
+                return encode_block(raw, self.dtype, delta, compress)
+
+            for frame in ordered_map(encode, blocks(), self.workers):
+                spool.write(frame)
+            self._length = spool.tell()
+            spool.seek(0)
+            self._spool = spool
+        return self._spool
+
+    def __len__(self):
+        self._encoded()
+        return self._length
+
+    def tell(self):
+        return self._encoded().tell()
+
+    def seek(self, offset, whence=0):
+        return self._encoded().seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._encoded().read(size)
+
+    def close(self):
+        self.closed = True
+        self.fileobj.close()
+        if self._spool is not None:
+            self._spool.close()
+
+
+def iter_frames(chunks):
+    """Split a stream of byte chunks into (raw size, frame) pairs"""
+    buff = bytearray()
+    for chunk in chunks:
+        buff.extend(chunk)
+        start = 0
+        while len(buff) - start >= FRAME_HEADER.size:
+            size, length = FRAME_HEADER.unpack_from(buff, start)
+            end = start + FRAME_HEADER.size + length
+            if len(buff) < end:
+                break
+            yield size, bytes(buff[start + FRAME_HEADER.size:end])
+            start = end
+        del buff[:start]
+    if len(buff) > 0:
+        raise IOError('Compressed array ends in a partial frame.')
+
+
+def decode_stream(chunks, dtype, encoding, workers=None):
+    """Yield the decoded arrays of each frame in a stream of byte chunks
+
+    Frames are decompressed on `workers` threads as chunks arrive.
+    """
+    dtype = np.dtype(dtype)
+    delta, codec = _parse(encoding)
+    decompress = _decompressor(codec)
+
+    def decode(item):
+        return decode_block(item[1], item[0], dtype, delta, decompress)
+
+    return ordered_map(decode, iter_frames(chunks), workers)
@@ -11,7 +11,9 @@ from numpy import ndarray
 from traitlets import observe, validate
 
 from .base import BaseData
-from .traits import Array, String
+from .cache import cache_key
+from .lazy import GridView, LazyArray
+from .traits import Array, String, serialized_nbytes
 
 
 class DataArray(BaseData):
@@ -38,11 +40,36 @@ class DataArray(BaseData):
         if array is not None:
             self.array = array
 
+    @classmethod
+    def from_grid(cls, grid, order='c', **kwargs):
+        """Create a DataArray from an N-d grid of cell or node values
+
+        `grid` is an array with one axis per grid dimension, or a lazy
+        source of one, such as a .npy path or h5py Dataset. Its values
+        are flattened in `order` ('c' or 'f'), which is also used as the
+        DataArray order. Values are read from the source slab by slab
+        when they are uploaded, so the grid does not need to fit in
+        memory. For order 'f', an on-disk source should also be stored
+        in Fortran order (see GridView).
+        """
+        view = GridView(grid, order)
+        return cls(
+            array=LazyArray(view, view.shape, view.dtype),
+            order=order,
+            **kwargs
+        )
+
+    @property
+    def grid_shape(self):
+        """Shape of the grid the array was created from, if known"""
+        source = getattr(self.array, 'source', None)
+        return getattr(source, 'grid_shape', None)
+
     def _nbytes(self, arr=None):
         if arr is None or (isinstance(arr, string_types) and arr == 'array'):
             arr = self.array
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('DataArray cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
@@ -82,7 +109,10 @@ class DataArray(BaseData):
             array=Array.download(
                 url=json['array'],
                 shape=json['arraySize']//4,
-                dtype=json['arrayType']
+                dtype=json['arrayType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'array'),
+                encoding=json.get('arrayEncoding')
             )
         )
         return data
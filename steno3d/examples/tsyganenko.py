@@ -10,6 +10,7 @@ from .base import BaseExample, exampleproperty
 from ..data import DataArray
 from ..line import Mesh1D, Line
 from ..project import Project
+from ..textio import GrowableArray, Lines, iter_chunks, map_file, numbers
 
 
 class Tsyganenko(BaseExample):
@@ -32,17 +33,30 @@ class Tsyganenko(BaseExample):
 
     @staticmethod
     def read_file(fname):
-        verts = []
-        segs = []
-        data = []
-        with open(fname, 'r') as f:
-            for line in f:
-                items = line.split()
-                verts.append([float(i) for i in items[1:4]])
-                data.append(float(items[4]))
-                if items[0] != '1':
-                    segs.append([len(verts)-2, len(verts)-1])
-        return verts, segs, data
+        """Read the field line vertices, segments and field magnitudes
+
+        Each line of the file is a flag (1 at the start of a field
+        line), x, y, z and the field magnitude. The file is read a
+        block of lines at a time.
+        """
+        verts = GrowableArray((3,))
+        segs = GrowableArray((2,), dtype=np.int64)
+        data = GrowableArray()
+        for _, chunk in iter_chunks(map_file(fname)):
+            lines = Lines(chunk)
+            mask = lines.tokens > 0
+            if not mask.any():
+                continue
+            width = lines.tokens[mask][0]
+            if (lines.tokens[mask] != width).any() or width < 5:
+                raise ValueError('{}: Lines must all have the same number '
+                                 'of values, at least 5'.format(fname))
+            rows = numbers(lines.text(mask)).reshape(-1, width)
+            index = len(verts) + np.flatnonzero(rows[:, 0] != 1)
+            segs.append(np.column_stack([index - 1, index]))
+            verts.append(rows[:, 1:4])
+            data.append(rows[:, 4])
+        return verts.array, segs.array, data.array
 
     @classmethod
     def get_project(self):
@@ -0,0 +1,964 @@
+"""geofiles.py contains the built-in parsers for common geoscience
+exports: GOCAD objects, Surpac string files, drillhole CSV tables and
+elevation rasters (ESRI ASCII grids and GeoTIFFs)
+
+Like the mesh file parsers (see steno3d.meshfiles), text files are read
+through a memory map a chunk of lines at a time with vectorized
+tokenizing (see steno3d.textio). Importing steno3d.parsers makes the
+parsers available as steno3d.parsers.gocad, steno3d.parsers.surpac,
+steno3d.parsers.drillholes, steno3d.parsers.asc and steno3d.parsers.tif.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os.path import basename, dirname, isfile, join, splitext
+
+import numpy as np
+
+from .data import DataArray
+from .line import Line, Mesh1D
+from .parsers import BaseParser, ParseError
+from .point import Mesh0D, Point
+from .project import Project
+from .rasters import BAND_SIZE
+from .surface import Mesh2D, Surface
+from .textio import CHUNK_SIZE, GrowableArray, Lines, _strings, iter_chunks
+from .textio import map_file, numbers, to_numbers
+from .volume import Mesh3DGrid, Volume
+
+
+def _title(file_name):
+    return splitext(basename(file_name))[0]
+
+
+def _new_project(project, file_name):
+    if project is None:
+        project = Project(description='Project imported from ' +
+                          basename(file_name))
+    return project
+
+
+def _node_data(named):
+    return [dict(location='N', data=DataArray(title=name, array=array))
+            for name, array in named]
+
+
+class _Records(object):
+    """Numeric records of one kind gathered from many chunks: the line
+    number, number of values and flat values of each record"""
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, numbers_, widths, values):
+        self.parts.append((numbers_, widths, values))
+
+    def arrays(self, dtype):
+        if not self.parts:
+            return (np.zeros(0, np.int64), np.zeros(0, np.int64),
+                    np.zeros(0, dtype))
+        line, widths, values = (np.concatenate(part)
+                                for part in zip(*self.parts))
+        starts = np.cumsum(widths) - widths
+        order = np.argsort(line, kind='stable')
+        rows = np.repeat(starts[order], widths[order]) + np.arange(
+            widths.sum()
+        ) - np.repeat(np.cumsum(widths[order]) - widths[order],
+                      widths[order])
+        return line[order], widths[order], values[rows]
+
+
+def _column(values, widths, index, fill=np.nan):
+    """Value `index` of each record, or fill where a record is short"""
+    starts = np.cumsum(widths) - widths
+    column = np.full(len(widths), fill, dtype=np.float64)
+    has = widths > index
+    column[has] = values[starts[has] + index]
+    return column
+
+
+class gocad(BaseParser):
+    """class gocad
+
+    Parser class for GOCAD ASCII objects: TSurf (.ts) surfaces, PLine
+    (.pl) lines and VSet (.vs) point sets, and Voxet (.vo) grids
+
+    A file may hold several objects; each becomes a Surface, Line,
+    Point or Volume titled with its name. Vertex properties become node
+    data and ATOM vertices are shared with the vertex they reference.
+    Depths are negated for objects with ZPOSITIVE Depth. Voxets must
+    have axes along x, y and z; their property files are read through a
+    memory map.
+    """
+
+    extensions = ('ts', 'pl', 'vs', 'vo')
+
+    _keywords = (('vertex', ('VRTX', 'PVRTX'), np.float64),
+                 ('atom', ('ATOM', 'PATOM'), np.int64),
+                 ('triangle', ('TRGL',), np.int64),
+                 ('segment', ('SEG',), np.int64))
+
+    def parse(self, project=None, **kwargs):
+        """function parse
+
+        Parses the GOCAD file into a Steno3D project with a resource for
+        each object in the file.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        project = _new_project(project, self.file_name)
+        try:
+            if self.file_name.endswith('.vo'):
+                self._parse_voxet(project)
+            else:
+                self._parse_objects(project)
+        except (ValueError, IOError) as err:
+            if isinstance(err, ParseError):
+                raise
+            raise ParseError('{}: {}'.format(self.file_name, err))
+        return (project,)
+
+    def _read(self):
+        """Header lines (line number, text) and numeric records"""
+        headers = {key: [] for key in ('GOCAD', 'name:', 'PROPERTIES',
+                                       'ZPOSITIVE')}
+        records = {key: _Records() for key, _, _ in self._keywords}
+        line = 0
+        for _, chunk in iter_chunks(map_file(self.file_name)):
+            lines = Lines(chunk)
+            number = line + np.arange(len(lines))
+            line += len(lines)
+            for word, found in headers.items():
+                mask = (lines.prefix(word) if word.endswith(':')
+                        else lines.keyword(word))
+                found += [(number[i], lines.line(i))
+                          for i in np.flatnonzero(mask)]
+            for key, words, dtype in self._keywords:
+                for word in words:
+                    mask = lines.keyword(word)
+                    if not mask.any():
+                        continue
+                    widths = lines.tokens[mask] - 1
+                    records[key].add(number[mask], widths, numbers(
+                        lines.text(mask, skip=len(word)), dtype,
+                        count=widths.sum()
+                    ))
+        arrays = {key: records[key].arrays(dtype)
+                  for key, _, dtype in self._keywords}
+        return headers, arrays
+
+    def _parse_objects(self, project):
+        headers, arrays = self._read()
+        starts = np.array([number for number, _ in headers['GOCAD']])
+        if len(starts) == 0:
+            raise ParseError('{}: No GOCAD object found'.format(
+                self.file_name
+            ))
+        bounds = np.r_[starts, np.iinfo(np.int64).max]
+
+        def in_object(key, index):
+            """Widths and values of the records in one object"""
+            line, widths, values = arrays[key]
+            lo, hi = np.searchsorted(line, bounds[index:index + 2])
+            offsets = np.r_[0, np.cumsum(widths)]
+            return widths[lo:hi], values[offsets[lo]:offsets[hi]]
+
+        def header(word, index, default=None):
+            for number, text in headers[word]:
+                if bounds[index] <= number < bounds[index + 1]:
+                    return text
+            return default
+
+        for index, (_, text) in enumerate(headers['GOCAD']):
+            words = text.split()
+            kind = words[1] if len(words) > 1 else ''
+            name = header('name:', index)
+            title = (name[len('name:'):].strip() if name else
+                     '{} {}'.format(_title(self.file_name), index + 1))
+            vertices, node_data, lookup = self._vertices(
+                in_object('vertex', index), in_object('atom', index),
+                header('PROPERTIES', index, '').split()[1:]
+            )
+            if 'depth' in header('ZPOSITIVE', index, '').lower():
+                vertices[:, 2] *= -1
+            if kind == 'TSurf':
+                triangles = self._cells(in_object('triangle', index), 3,
+                                        lookup)
+                Surface(project, title=title, data=node_data,
+                        mesh=Mesh2D(vertices=vertices, triangles=triangles))
+            elif kind == 'PLine':
+                segments = self._cells(in_object('segment', index), 2,
+                                       lookup)
+                Line(project, title=title, data=node_data,
+                     mesh=Mesh1D(vertices=vertices, segments=segments))
+            elif kind == 'VSet':
+                Point(project, title=title, data=node_data,
+                      mesh=Mesh0D(vertices=vertices))
+            else:
+                raise ParseError('{}: Unsupported GOCAD object type '
+                                 '{}'.format(self.file_name, kind))
+
+    @staticmethod
+    def _vertices(records, atoms, names):
+        """Vertices, node data and a function mapping vertex ids to
+        indices for one object"""
+        widths, values = records
+        if (widths < 4).any():
+            raise ValueError('Vertices need an id and x, y and z')
+        vertices = np.column_stack([_column(values, widths, i)
+                                    for i in (1, 2, 3)])
+        ids = _column(values, widths, 0).astype(np.int64)
+        n_extra = int(widths.max()) - 4 if len(widths) else 0
+        names = list(names) + ['Property {}'.format(i + 1)
+                               for i in range(len(names), n_extra)]
+        node_data = _node_data(
+            (names[i], _column(values, widths, 4 + i))
+            for i in range(n_extra)
+        )
+        atom_widths, atom_values = atoms
+        if (atom_widths != 2).any():
+            raise ValueError('ATOM records need an id and a vertex id')
+        order = np.argsort(ids, kind='stable')
+
+        def find(wanted, known, known_index):
+            position = np.minimum(np.searchsorted(known, wanted),
+                                  max(len(known) - 1, 0))
+            if len(wanted) and (len(known) == 0 or
+                                (known[position] != wanted).any()):
+                raise ValueError('Reference to an undefined vertex')
+            return known_index[position]
+
+        atom_ids, atom_refs = atom_values[0::2], atom_values[1::2]
+        all_ids = np.r_[ids, atom_ids]
+        all_index = np.r_[np.arange(len(ids)),
+                          find(atom_refs, ids[order], order)]
+        if len(all_ids) and np.ptp(all_ids) < 4 * len(all_ids) + 1024:
+            # Ids are usually dense, so a table beats a sorted search
+            low = all_ids.min()
+            table = np.full(np.ptp(all_ids) + 1, -1, np.int64)
+            table[all_ids - low] = all_index
+
+            def lookup(wanted):
+                position = wanted - low
+                inside = (position >= 0) & (position < len(table))
+                found = table[np.where(inside, position, 0)]
+                if not (inside & (found >= 0)).all():
+                    raise ValueError('Reference to an undefined vertex')
+                return found
+        else:
+            all_order = np.argsort(all_ids, kind='stable')
+
+            def lookup(wanted):
+                return find(wanted, all_ids[all_order],
+                            all_index[all_order])
+
+        return vertices, node_data, lookup
+
+    @staticmethod
+    def _cells(records, width, lookup):
+        widths, values = records
+        if (widths != width).any():
+            raise ValueError('Cells need {} vertex ids'.format(width))
+        return lookup(values).reshape(-1, width)
+
+    def _parse_voxet(self, project):
+        header = {}
+        properties = {}
+        with open(self.file_name, 'rb') as fileobj:
+            for line in fileobj:
+                words = line.decode('utf-8', 'replace').split()
+                if words and words[0].startswith('name:'):
+                    header['name:'] = line.decode('utf-8', 'replace')
+                if len(words) < 2:
+                    continue
+                if words[0].startswith('PROP') and words[1].isdigit():
+                    prop = properties.setdefault(int(words[1]), {})
+                    prop[words[0]] = ' '.join(words[2:]).strip('"')
+                else:
+                    header[words[0]] = words[1:]
+        try:
+            axes = {key: np.array(header['AXIS_' + key], dtype=float)
+                    for key in ('O', 'U', 'V', 'W', 'N')}
+        except KeyError as err:
+            raise ValueError('Missing voxet axis {}'.format(err))
+        lo = np.array(header.get('AXIS_MIN', [0, 0, 0]), dtype=float)
+        hi = np.array(header.get('AXIS_MAX', [1, 1, 1]), dtype=float)
+        shape = axes['N'].astype(int)
+        origin = axes['O'] + sum(lo[i] * axes[key]
+                                 for i, key in enumerate('UVW'))
+        widths, flips = [], []
+        for i, key in enumerate('UVW'):
+            axis = axes[key] * (hi[i] - lo[i])
+            if np.count_nonzero(axis) != 1 or axis[i] == 0:
+                raise ValueError('Only voxets with axes along x, y and z '
+                                 'are supported')
+            step = axis[i] / max(shape[i] - 1, 1)
+            # Values sit at nodes; each becomes a cell centred on it
+            origin[i] += min(axis[i], 0) - abs(step) / 2
+            widths.append(np.full(shape[i], abs(step)))
+            flips.append(axis[i] < 0)
+        data = []
+        for number in sorted(properties):
+            prop = properties[number]
+            dtype = self._voxet_dtype(prop)
+            file_name = join(dirname(self.file_name), prop['PROP_FILE'])
+            values = map_file(file_name, int(prop.get('PROP_OFFSET', 0)))
+            count = int(np.prod(shape))
+            if len(values) < count * dtype.itemsize:
+                raise ValueError('{}: too few values'.format(file_name))
+            values = values[:count * dtype.itemsize].view(dtype)
+            values = values.reshape(shape, order='F')
+            for axis in np.flatnonzero(flips):
+                values = np.flip(values, axis)
+            values = values.astype(np.float64).ravel(order='F')
+            if 'PROP_NO_DATA_VALUE' in prop:
+                values[values == float(prop['PROP_NO_DATA_VALUE'])] = np.nan
+            data.append(dict(location='CC', data=DataArray(
+                title=prop.get('PROPERTY', 'Property {}'.format(number)),
+                array=values, order='f'
+            )))
+        name = header.get('name:', '').strip()[len('name:'):].strip()
+        Volume(project, title=name or _title(self.file_name), data=data,
+               mesh=Mesh3DGrid(h1=widths[0], h2=widths[1], h3=widths[2],
+                               x0=origin))
+
+    @staticmethod
+    def _voxet_dtype(prop):
+        size = int(prop.get('PROP_ESIZE', 4))
+        kind = prop.get('PROP_ETYPE', 'IEEE').upper()
+        if size == 1:
+            return np.dtype('u1')
+        if kind == 'IEEE':
+            return np.dtype('>f{}'.format(size))
+        return np.dtype('>i{}'.format(size))
+
+
+class surpac(BaseParser):
+    """class surpac
+
+    Parser class for Surpac .str string files
+
+    The file becomes a Line: each run of records with the same non-zero
+    string number is a polyline, and records with string number 0
+    separate them. Records are string number, y, x, z; the string
+    number is kept as node data and description fields are ignored.
+
+    The file is read a chunk of lines at a time, and iter_parse yields
+    a Line for the whole strings of each chunk, so memory use is bounded
+    by the chunk size. Files smaller than one chunk become a single
+    Line; further Lines are numbered after the first.
+    """
+
+    extensions = ('str',)
+
+    def iter_parse(self, project=None, chunk_size=CHUNK_SIZE, **kwargs):
+        """function iter_parse
+
+        Parses the Surpac string file into a Steno3D project, yielding
+        a Line for each chunk of the file.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            chunk_size - Bytes of the file read at a time
+
+        Output:
+            generator of the Steno3D Lines, each already in the project
+        """
+        project = _new_project(project, self.file_name)
+        title = None
+        line = 0
+        count = 0
+        records = GrowableArray((4,))
+        for _, chunk in iter_chunks(map_file(self.file_name), chunk_size):
+            lines = Lines(chunk)
+            number = line + np.arange(len(lines))
+            line += len(lines)
+            if title is None and len(lines):
+                title = lines.line(0).split(',')[0].strip() or \
+                    _title(self.file_name)
+            # The first line is the header and the second the axis record
+            mask = (number >= 2) & (lines.tokens > 0)
+            try:
+                records.append(self._records(lines, np.flatnonzero(mask)))
+            except ValueError as err:
+                raise ParseError('{}: {}'.format(self.file_name, err))
+            block = records.take()
+            # Strings may go on into the next chunk; keep the last one
+            string = block[:, 0]
+            ends = np.flatnonzero((string[:-1] == 0) |
+                                  (string[:-1] != string[1:])) + 1
+            end = ends[-1] if len(ends) else 0
+            records.append(block[end:])
+            if self._line(project, block[:end], title, count):
+                count += 1
+                yield project.resources[-1]
+        if self._line(project, records.take(), title, count):
+            yield project.resources[-1]
+
+    @staticmethod
+    def _line(project, records, title, count):
+        """Add a Line for whole strings of records, if it has any
+        points"""
+        string = records[:, 0]
+        points = np.flatnonzero(string != 0)
+        if len(points) == 0:
+            return False
+        # Consecutive records of one string are joined
+        joined = np.flatnonzero((string[:-1] != 0) &
+                                (string[:-1] == string[1:]))
+        index = np.full(len(records), -1)
+        index[points] = np.arange(len(points))
+        Line(
+            project,
+            title=title if count == 0 else '{} {}'.format(title, count + 1),
+            mesh=Mesh1D(vertices=records[points][:, [2, 1, 3]],
+                        segments=np.column_stack([index[joined],
+                                                  index[joined + 1]])),
+            data=_node_data([('String', string[points])])
+        )
+        return True
+
+    @staticmethod
+    def _records(lines, index):
+        """First four comma-separated fields of the indexed lines"""
+        if len(index) == 0:
+            return np.zeros((0, 4))
+        separators = np.flatnonzero(lines.chunk == ord(','))
+        starts, ends = lines.starts[index], lines.ends[index]
+        first = np.searchsorted(separators, starts)
+        counts = np.searchsorted(separators, ends) - first
+        if (counts < 3).any():
+            raise ValueError('Records need a string number, y, x and z')
+        bounds = separators[np.minimum(first[:, None] + np.arange(4),
+                                       len(separators) - 1)]
+        bounds[:, 3] = np.where(counts > 3, bounds[:, 3], ends)
+        field_starts = np.column_stack([starts, bounds[:, :3] + 1])
+        return np.column_stack([
+            to_numbers(_strings(lines.chunk, field_starts[:, i],
+                                bounds[:, i]))
+            for i in range(4)
+        ])
+
+
+_HOLE_NAMES = ('holeid', 'hole_id', 'hole', 'bhid', 'dhid', 'id')
+_COLUMN_NAMES = {
+    'x': ('x', 'east', 'easting', 'xcollar', 'x_collar'),
+    'y': ('y', 'north', 'northing', 'ycollar', 'y_collar'),
+    'z': ('z', 'rl', 'elev', 'elevation', 'zcollar', 'z_collar'),
+    'depth': ('depth', 'at', 'distance', 'surv_depth'),
+    'azimuth': ('azimuth', 'azi', 'az', 'brg', 'bearing'),
+    'dip': ('dip', 'inclination', 'incl'),
+    'from': ('from', 'depth_from', 'mfrom', 'from_m'),
+    'to': ('to', 'depth_to', 'mto', 'to_m'),
+}
+
+
+def _read_csv(file_name):
+    """Lower-case column names and a dict of byte string columns"""
+    names = None
+    columns = []
+    for _, chunk in iter_chunks(map_file(file_name)):
+        lines = Lines(chunk)
+        mask = lines.tokens > 0
+        if names is None:
+            header = np.flatnonzero(mask)
+            if len(header) == 0:
+                continue
+            names = [name.strip().strip('"\'').lower()
+                     for name in lines.line(header[0]).split(',')]
+            mask[header[0]] = False
+        fields = lines.fields(mask)
+        if fields and len(fields) != len(names):
+            raise ValueError('Rows have {} fields but the header has '
+                             '{}'.format(len(fields), len(names)))
+        if fields:
+            columns.append(fields)
+    if names is None:
+        raise ValueError('Empty file')
+    if not columns:
+        return names, {name: np.zeros(0, 'S1') for name in names}
+    return names, {name: np.concatenate([part[i] for part in columns])
+                   for i, name in enumerate(names)}
+
+
+def _find_column(names, wanted):
+    candidates = _HOLE_NAMES if wanted == 'hole' else _COLUMN_NAMES[wanted]
+    for name in candidates:
+        if name in names:
+            return name
+    raise ValueError('No {} column (one of {})'.format(
+        wanted, ', '.join(candidates)
+    ))
+
+
+def _directions(azimuth, dip):
+    """Unit vectors for azimuths clockwise from north and dips in
+    degrees, negative downwards"""
+    azimuth, dip = np.radians(azimuth), np.radians(dip)
+    return np.column_stack([np.sin(azimuth) * np.cos(dip),
+                            np.cos(azimuth) * np.cos(dip), np.sin(dip)])
+
+
+class drillholes(BaseParser):
+    """class drillholes
+
+    Parser class for drillhole collar, survey and assay .csv tables
+
+    The file to parse is the collar table (hole id, x, y, z). Survey
+    (hole id, depth, azimuth, dip) and assay (hole id, from, to,
+    values) tables are given to parse() or found next to it by
+    replacing 'collar' in the file name with 'survey' and 'assay'.
+    When AllParsers expands a directory, the survey and assay tables
+    found this way are not parsed as collar tables of their own.
+    Columns are found by common header names. Holes are desurveyed with
+    the balanced tangential method; dips are negative downwards and
+    holes without surveys are vertical.
+
+    The collars become a Point and the assay intervals a Line with a
+    segment per interval and the numeric assay columns as cell data.
+    Without assays the Line traces each hole through its survey
+    stations. Quoted fields containing commas are not supported.
+    """
+
+    extensions = ('csv',)
+
+    def parse(self, project=None, survey=None, assay=None, **kwargs):
+        """function parse
+
+        Parses the collar file and its survey and assay tables into a
+        Steno3D project with a Point for the collars and a Line for the
+        holes.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            survey - Survey table file name
+            assay - Assay table file name
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        project = _new_project(project, self.file_name)
+        survey = survey or self._related(self.file_name, 'survey')
+        assay = assay or self._related(self.file_name, 'assay')
+        # Errors are prefixed with the name of the table being read
+        table = self.file_name
+        try:
+            holes, collars = self._read_collars()
+            table = survey or table
+            stations = self._read_survey(survey, holes, collars)
+            title = _title(self.file_name)
+            Point(project, title=title + ' collars',
+                  mesh=Mesh0D(vertices=collars))
+            if assay is not None:
+                table = assay
+                vertices, segments, data = self._read_assay(assay, holes,
+                                                            stations)
+            else:
+                vertices, segments, data = self._traces(stations)
+        except (ValueError, IOError) as err:
+            if isinstance(err, ParseError):
+                raise
+            raise ParseError('{}: {}'.format(table, err))
+        Line(project, title=title, mesh=Mesh1D(vertices=vertices,
+                                               segments=segments),
+             data=[dict(location='CC', data=DataArray(title=name,
+                                                      array=values))
+                   for name, values in data])
+        return (project,)
+
+    @classmethod
+    def companions(cls, file_name):
+        """The survey and assay tables found next to a collar table"""
+        return [related for related in (cls._related(file_name, 'survey'),
+                                        cls._related(file_name, 'assay'))
+                if related is not None]
+
+    @staticmethod
+    def _related(file_name, word):
+        name = basename(file_name)
+        if 'collar' not in name.lower():
+            return None
+        start = name.lower().index('collar')
+        for new in (word, word + 's', word.upper(), word.capitalize()):
+            candidate = join(dirname(file_name),
+                             name[:start] + new + name[start + 6:])
+            if isfile(candidate):
+                return candidate
+        return None
+
+    def _read_collars(self):
+        names, columns = _read_csv(self.file_name)
+        holes = columns[_find_column(names, 'hole')]
+        collars = np.column_stack([
+            to_numbers(columns[_find_column(names, key)])
+            for key in 'xyz'
+        ])
+        order = np.argsort(holes, kind='stable')
+        if (holes[order][1:] == holes[order][:-1]).any():
+            raise ValueError('Hole ids are repeated in the collar table')
+        return holes[order], collars[order]
+
+    @staticmethod
+    def _hole_index(holes, ids):
+        index = np.minimum(np.searchsorted(holes, ids), len(holes) - 1)
+        if len(ids) and (holes[index] != ids).any():
+            raise ValueError('Hole {} is not in the collar table'.format(
+                ids[holes[index] != ids][0].decode()
+            ))
+        return index
+
+    def _read_survey(self, file_name, holes, collars):
+        """Desurveyed stations sorted by hole and depth: (hole, depth,
+        position, direction)"""
+        if file_name is None:
+            hole = np.zeros(0, np.int64)
+            depth = np.zeros(0)
+            directions = np.zeros((0, 3))
+        else:
+            names, columns = _read_csv(file_name)
+            hole = self._hole_index(holes,
+                                    columns[_find_column(names, 'hole')])
+            depth, azimuth, dip = (
+                to_numbers(columns[_find_column(names, key)])
+                for key in ('depth', 'azimuth', 'dip')
+            )
+            directions = _directions(azimuth, dip)
+        # Every hole needs a station at the collar, pointing as its first
+        # survey does (or straight down)
+        order = np.lexsort((depth, hole))
+        first = np.full(len(holes), -1)
+        first[hole[order][::-1]] = order[::-1]
+        collar_directions = np.tile([0., 0, -1], (len(holes), 1))
+        has = first >= 0
+        collar_directions[has] = directions[first[has]]
+        need = ~has
+        need[has] = depth[first[has]] > 0
+        hole = np.r_[np.flatnonzero(need), hole]
+        depth = np.r_[np.zeros(need.sum()), depth]
+        directions = np.vstack([collar_directions[need], directions])
+        order = np.lexsort((depth, hole))
+        hole, depth = hole[order], depth[order]
+        directions = directions[order]
+        same = hole[1:] == hole[:-1]
+        steps = np.where(
+            same[:, None],
+            (depth[1:] - depth[:-1])[:, None] *
+            (directions[1:] + directions[:-1]) / 2, 0
+        )
+        travelled = np.vstack([np.zeros((1, 3)), np.cumsum(steps, axis=0)])
+        starts = np.flatnonzero(np.r_[True, ~same])
+        start_of = np.repeat(starts, np.diff(np.r_[starts, len(hole)]))
+        positions = collars[hole] + travelled - travelled[start_of]
+        return hole, depth, positions, directions
+
+    @staticmethod
+    def _locate(stations, hole, depth):
+        """Positions at the given depths down the given holes"""
+        s_hole, s_depth, s_positions, s_directions = stations
+        span = max(np.abs(s_depth).max() if len(s_depth) else 0,
+                   np.abs(depth).max() if len(depth) else 0) * 2 + 1
+        keys = s_hole * span + s_depth
+        index = np.searchsorted(keys, hole * span + depth, side='right') - 1
+        index = np.maximum(index, 0)
+        # Interpolate between stations, or go on straight past the last
+        nxt = np.minimum(index + 1, len(s_hole) - 1)
+        inside = (s_hole[nxt] == hole) & (nxt != index)
+        direction = s_directions[index].copy()
+        length = (s_depth[nxt] - s_depth[index])[inside]
+        direction[inside] = np.where(
+            length[:, None] > 0,
+            (s_positions[nxt] - s_positions[index])[inside] /
+            np.where(length > 0, length, 1)[:, None],
+            direction[inside]
+        )
+        return (s_positions[index] +
+                (depth - s_depth[index])[:, None] * direction)
+
+    def _read_assay(self, file_name, holes, stations):
+        names, columns = _read_csv(file_name)
+        hole_name = _find_column(names, 'hole')
+        hole = self._hole_index(holes, columns[hole_name])
+        depths = [to_numbers(columns[_find_column(names, key)])
+                  for key in ('from', 'to')]
+        ends = [self._locate(stations, hole, depth) for depth in depths]
+        vertices = np.column_stack(ends).reshape(-1, 3)
+        segments = np.arange(len(vertices)).reshape(-1, 2)
+        skip = set([hole_name, _find_column(names, 'from'),
+                    _find_column(names, 'to')])
+        data = []
+        for name in names:
+            if name in skip:
+                continue
+            try:
+                data.append((name, to_numbers(columns[name])))
+            except ValueError:
+                # Text columns such as lithology codes
+                continue
+        return vertices, segments, data
+
+    @staticmethod
+    def _traces(stations):
+        hole, _, positions, _ = stations
+        joined = np.flatnonzero(hole[1:] == hole[:-1])
+        return positions, np.column_stack([joined, joined + 1]), []
+
+
+def _raster_surface(project, file_name, raster, header, max_cells,
+                    texture, shape=None):
+    try:
+        return Surface.from_raster(
+            project, raster, cell_size=header['cell_size'],
+            origin=header['origin'], nodata=header.get('nodata'),
+            max_cells=max_cells, texture=texture, shape=shape,
+            title=_title(file_name)
+        )
+    except ValueError as err:
+        raise ParseError('{}: {}'.format(file_name, err))
+
+
+class asc(BaseParser):
+    """class asc
+
+    Parser class for ESRI ASCII grid (.asc) elevation rasters
+
+    The grid becomes a Surface with a Mesh2DGrid (see
+    Surface.from_raster) and by default a shaded relief texture. The
+    values are read a block of lines at a time, so with max_cells the
+    whole raster is never held in memory.
+    """
+
+    extensions = ('asc',)
+
+    def parse(self, project=None, max_cells=None, texture=True, **kwargs):
+        """function parse
+
+        Parses the grid into a Steno3D project with one Surface.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            max_cells - Largest number of grid cells; blocks of values
+                        are averaged to fit
+            texture - True for a shaded relief texture, False for none,
+                      or a PNG image to drape over the grid
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        project = _new_project(project, self.file_name)
+        header, offset = self._read_header()
+        shape = (header['nrows'], header['ncols'])
+        _raster_surface(project, self.file_name, self._bands(offset, shape),
+                        header, max_cells, texture, shape)
+        return (project,)
+
+    def _read_header(self):
+        values = {}
+        offset = 0
+        with open(self.file_name, 'rb') as fileobj:
+            for line in fileobj:
+                words = line.decode('ascii', 'replace').split()
+                if not words or not words[0][0].isalpha():
+                    break
+                try:
+                    values[words[0].lower()] = float(words[1])
+                except (IndexError, ValueError):
+                    raise ParseError('{}: Invalid header line {}'.format(
+                        self.file_name, line.strip()
+                    ))
+                offset += len(line)
+        try:
+            size = values.get('cellsize')
+            cell_size = (size, size) if size is not None else \
+                (values['dx'], values['dy'])
+            header = dict(nrows=int(values['nrows']),
+                          ncols=int(values['ncols']), cell_size=cell_size,
+                          nodata=values.get('nodata_value'))
+            if 'xllcenter' in values:
+                header['origin'] = (values['xllcenter'] - cell_size[0] / 2,
+                                    values['yllcenter'] - cell_size[1] / 2)
+            else:
+                header['origin'] = (values['xllcorner'], values['yllcorner'])
+        except KeyError as err:
+            raise ParseError('{}: Missing header value {}'.format(
+                self.file_name, err
+            ))
+        return header, offset
+
+    def _bands(self, offset, shape):
+        """Yield the values a chunk at a time as whole rows"""
+        values = GrowableArray()
+        for _, chunk in iter_chunks(map_file(self.file_name, offset),
+                                    BAND_SIZE):
+            try:
+                values.append(numbers(chunk.tobytes()))
+            except ValueError as err:
+                raise ParseError('{}: {}'.format(self.file_name, err))
+            rows = values.take()
+            whole = len(rows) // shape[1] * shape[1]
+            values.append(rows[whole:])
+            yield rows[:whole]
+        if len(values):
+            raise ParseError('{}: The last row is incomplete'.format(
+                self.file_name
+            ))
+
+
+# Numpy types of TIFF field types
+_TIFF_TYPES = {1: 'u1', 2: 'S1', 3: 'u2', 4: 'u4', 5: 'u4', 6: 'i1',
+               8: 'i2', 9: 'i4', 10: 'i4', 11: 'f4', 12: 'f8', 16: 'u8',
+               17: 'i8', 18: 'u8'}
+_TIFF_SAMPLES = {1: 'u', 2: 'i', 3: 'f'}
+
+
+class tif(BaseParser):
+    """class tif
+
+    Parser class for GeoTIFF (.tif) elevation rasters
+
+    Single band, uncompressed, striped TIFF and BigTIFF files are
+    supported; the pixel values are memory-mapped and read a band of
+    rows at a time. Georeferencing comes from the model pixel scale and
+    tiepoint or an axis-aligned model transformation; without it, pixels
+    are 1 unit wide with the lower left corner at 0, 0. The raster
+    becomes a Surface with a Mesh2DGrid (see Surface.from_raster) and
+    by default a shaded relief texture.
+    """
+
+    extensions = ('tif', 'tiff')
+
+    def parse(self, project=None, max_cells=None, texture=True, **kwargs):
+        """function parse
+
+        Parses the raster into a Steno3D project with one Surface.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            max_cells - Largest number of grid cells; blocks of pixels
+                        are averaged to fit
+            texture - True for a shaded relief texture, False for none,
+                      or a PNG image to drape over the grid
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        project = _new_project(project, self.file_name)
+        buf = map_file(self.file_name)
+        try:
+            tags, endian = self._read_tags(buf)
+            header, raster, shape = self._raster(buf, tags, endian)
+        except (ValueError, KeyError, IndexError, TypeError) as err:
+            raise ParseError('{}: Invalid TIFF file ({})'.format(
+                self.file_name, err
+            ))
+        _raster_surface(project, self.file_name, raster, header, max_cells,
+                        texture, shape)
+        return (project,)
+
+    def _read_tags(self, buf):
+        """The tags of the first image, as numpy arrays, and the byte
+        order"""
+        endian = {b'II': '<', b'MM': '>'}.get(buf[:2].tobytes())
+        if endian is None:
+            raise ParseError('{}: Not a TIFF file'.format(self.file_name))
+        version = int(np.frombuffer(buf[2:4], endian + 'u2')[0])
+        if version == 42:
+            size, first = 4, np.frombuffer(buf[4:8], endian + 'u4')[0]
+        elif version == 43:
+            size, first = 8, np.frombuffer(buf[8:16], endian + 'u8')[0]
+        else:
+            raise ParseError('{}: Not a TIFF file'.format(self.file_name))
+        count_type = endian + ('u2' if size == 4 else 'u8')
+        entry = np.dtype([('tag', endian + 'u2'), ('type', endian + 'u2'),
+                          ('count', endian + 'u{}'.format(size)),
+                          ('value', 'V{}'.format(size))])
+        first = int(first)
+        count_size = np.dtype(count_type).itemsize
+        n_entries = int(np.frombuffer(buf[first:first + count_size],
+                                      count_type)[0])
+        start = first + count_size
+        entries = np.frombuffer(
+            buf[start:start + n_entries * entry.itemsize], entry
+        )
+        tags = {}
+        for tag, kind, count, value in entries.tolist():
+            if kind not in _TIFF_TYPES:
+                continue
+            dtype = np.dtype(endian + _TIFF_TYPES[kind])
+            count *= 2 if kind in (5, 10) else 1
+            nbytes = int(count) * dtype.itemsize
+            if nbytes <= size:
+                data = bytes(value)[:nbytes]
+            else:
+                offset = int(np.frombuffer(bytes(value),
+                                           endian + 'u{}'.format(size))[0])
+                data = buf[offset:offset + nbytes].tobytes()
+            tags[tag] = np.frombuffer(data, dtype)
+        return tags, endian
+
+    def _raster(self, buf, tags, endian):
+        """The georeferencing, the raster (or its bands) and its shape"""
+        if int(tags.get(259, [1])[0]) != 1:
+            raise ParseError('{}: Only uncompressed TIFFs are '
+                             'supported'.format(self.file_name))
+        if 322 in tags or 273 not in tags:
+            raise ParseError('{}: Only striped TIFFs are '
+                             'supported'.format(self.file_name))
+        if int(tags.get(277, [1])[0]) != 1:
+            raise ParseError('{}: Only single band TIFFs are '
+                             'supported'.format(self.file_name))
+        shape = (int(tags[257][0]), int(tags[256][0]))
+        dtype = np.dtype('{}{}{}'.format(
+            endian, _TIFF_SAMPLES[int(tags.get(339, [1])[0])],
+            int(tags.get(258, [8])[0]) // 8
+        ))
+        offsets = tags[273].astype(np.int64)
+        row_bytes = shape[1] * dtype.itemsize
+        if (np.diff(offsets) == int(tags.get(278, [shape[0]])[0]) *
+                row_bytes).all():
+            raster = np.ndarray(shape, dtype, buf, offsets[0])
+        else:
+            # Scattered strips are read one at a time
+            raster = (np.frombuffer(buf[offset:offset + count], dtype)
+                      for offset, count in zip(offsets,
+                                               tags[279].astype(np.int64)))
+        return self._georeference(tags, shape), raster, shape
+
+    def _georeference(self, tags, shape):
+        header = dict(cell_size=(1., 1.), origin=(0., 0.))
+        if 42113 in tags:
+            nodata = tags[42113].tobytes().strip(b'\x00 ')
+            if nodata:
+                header['nodata'] = float(nodata)
+        if 33550 in tags and 33922 in tags:
+            dx, dy = tags[33550][:2].astype(float)
+            i, j, _, x, y = tags[33922][:5].astype(float)
+            left, top = x - i * dx, y + j * dy
+        elif 34264 in tags:
+            matrix = tags[34264].astype(float).reshape(4, 4)
+            if matrix[0, 1] or matrix[1, 0]:
+                raise ParseError('{}: Rotated rasters are not '
+                                 'supported'.format(self.file_name))
+            dx, dy = matrix[0, 0], -matrix[1, 1]
+            left, top = matrix[0, 3], matrix[1, 3]
+        else:
+            return header
+        keys = tags.get(34735, np.zeros(4, int)).astype(int)
+        keys = keys[4:4 + 4 * keys[3]].reshape(-1, 4)
+        if ((keys[:, 0] == 1025) & (keys[:, 3] == 2)).any():
+            # The tiepoint is a pixel centre, not its corner
+            left, top = left - dx / 2, top + dy / 2
+        header['cell_size'] = (dx, dy)
+        header['origin'] = (left, top - shape[0] * dy)
+        return header
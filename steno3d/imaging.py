@@ -0,0 +1,287 @@
+"""imaging.py contains the texture image pipeline: reading image sizes
+from file headers, downsampling to a pixel budget and encoding for upload
+
+Images that need no change are sent as they are, without decoding or
+copying them. Others are downsampled with an area-averaging filter and
+encoded as PNG, or as JPEG for large opaque images when JPEG textures
+are enabled (see `steno3d.client.Comms.configure`).
+
+PNG images are decoded with pypng, a row at a time, encoded with zlib and
+reduced by whole-number factors with a box filter (the mean of each
+block of pixels). If Pillow is installed, it is used instead: it also
+reads and writes JPEG and resamples to the exact budget with a Lanczos
+filter.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from io import BytesIO
+from struct import pack, unpack
+from threading import Lock
+import zlib
+
+import numpy as np
+import png
+
+from .rasters import block_means
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+
+# Opaque images with more pixels than this become JPEGs, when allowed
+JPEG_PIXELS = 1048576
+JPEG_QUALITY = 90
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start of frame markers; the others in C0-CF are not frames
+_JPEG_FRAMES = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+# Held while Pillow's decompression bomb limit is lifted
+_PILLOW_LOCK = Lock()
+# PNG color types by number of planes
+_PNG_COLORS = {1: 0, 2: 4, 3: 2, 4: 6}
+
+ImageInfo = namedtuple('ImageInfo', ['format', 'width', 'height', 'alpha'])
+
+
+def image_info(fileobj):
+    """Format ('png' or 'jpg'), width, height and whether the image has
+    transparency, read from the file header only
+
+    The file is left at its start. Raises ValueError for other files.
+    """
+    fileobj.seek(0)
+    try:
+        start = fileobj.read(8)
+        if start == PNG_SIGNATURE:
+            return _png_info(fileobj)
+        if start[:2] == b'\xff\xd8':
+            fileobj.seek(2)
+            return _jpeg_info(fileobj)
+        raise ValueError('Not a PNG or JPEG image')
+    finally:
+        fileobj.seek(0)
+
+
+def _png_info(fileobj):
+    length, kind = unpack('>I4s', fileobj.read(8))
+    if kind != b'IHDR' or length < 13:
+        raise ValueError('PNG image does not start with a header')
+    width, height, _, color = unpack('>IIBB', fileobj.read(10))
+    alpha = color in (4, 6)
+    fileobj.seek(length - 10 + 4, 1)
+    # Transparency may also come from a tRNS chunk before the data
+    while not alpha:
+        header = fileobj.read(8)
+        if len(header) < 8:
+            break
+        length, kind = unpack('>I4s', header)
+        if kind in (b'IDAT', b'IEND'):
+            break
+        alpha = kind == b'tRNS'
+        fileobj.seek(length + 4, 1)
+    return ImageInfo('png', width, height, alpha)
+
+
+def _jpeg_info(fileobj):
+    while True:
+        marker = fileobj.read(2)
+        if len(marker) < 2 or marker[:1] != b'\xff':
+            raise ValueError('JPEG image has no frame header')
+        kind = bytearray(marker)[1]
+        if kind == 0xFF:
+            fileobj.seek(-1, 1)
+            continue
+        if kind in (0x01,) or 0xD0 <= kind <= 0xD7:
+            continue
+        length, = unpack('>H', fileobj.read(2))
+        if kind in _JPEG_FRAMES:
+            height, width = unpack('>xHH', fileobj.read(5))
+            return ImageInfo('jpg', width, height, False)
+        fileobj.seek(length - 2, 1)
+
+
+def reduction_factor(width, height, max_pixels):
+    """Smallest whole-number factor that brings width x height pixels
+    within max_pixels"""
+    factor = max(int(np.sqrt(width * height / max_pixels)), 1)
+    while -(-width // factor) * -(-height // factor) > max_pixels:
+        factor += 1
+    return factor
+
+
+def png_rows(fileobj):
+    """Width, height, planes, bit depth and an iterator over the rows,
+    as flat uint8 or uint16 arrays, of a PNG
+
+    Palettes are expanded and bit depths under 8 scaled to 8.
+    """
+    width, height, rows, meta = png.Reader(file=fileobj).asDirect()
+    bitdepth = meta['bitdepth']
+    dtype = np.uint16 if bitdepth > 8 else np.uint8
+
+    def scaled():
+        for row in rows:
+            row = np.asarray(row, dtype)
+            if bitdepth < 8:
+                row = row * (255 // (2 ** bitdepth - 1))
+            yield row
+
+    return width, height, meta['planes'], max(bitdepth, 8), scaled()
+
+
+def _png_pixels(fileobj, factor):
+    """Pixels of a PNG as a (rows, columns, planes) array, reduced by
+    factor with a box filter, and the bit depth"""
+    width, height, planes, bitdepth, rows = png_rows(fileobj)
+    dtype = np.uint16 if bitdepth > 8 else np.uint8
+    out = np.empty((-(-height // factor), -(-width // factor), planes),
+                   dtype)
+    band = np.empty((factor, width * planes), dtype)
+    filled = 0
+    out_row = 0
+    for row in rows:
+        band[filled] = row
+        filled += 1
+        if filled == factor or out_row * factor + filled == height:
+            pixels = band[:filled].reshape(filled, width, planes)
+            for plane in range(planes):
+                out[out_row, :, plane] = np.round(
+                    block_means(pixels[:, :, plane], factor)[0]
+                )
+            out_row += 1
+            filled = 0
+    return out, bitdepth
+
+
+def encode_png(pixels, bitdepth=8):
+    """PNG of a (rows, columns, planes) array of 1 to 4 planes (grey,
+    grey and alpha, RGB or RGBA) with a bit depth of 8 or 16
+
+    Rows are not filtered, as with pypng; compression releases the GIL,
+    so images can be encoded on several threads at once.
+    """
+    rows, cols, planes = pixels.shape
+    data = np.zeros((rows, 1 + cols * planes * bitdepth // 8), np.uint8)
+    data[:, 1:] = np.ascontiguousarray(
+        pixels, '>u2' if bitdepth == 16 else np.uint8
+    ).reshape(rows, -1).view(np.uint8)
+    output = BytesIO()
+    output.write(PNG_SIGNATURE)
+    _png_chunk(output, b'IHDR', pack('>IIBBBBB', cols, rows, bitdepth,
+                                     _PNG_COLORS[planes], 0, 0, 0))
+    _png_chunk(output, b'IDAT', zlib.compress(data))
+    _png_chunk(output, b'IEND', b'')
+    output.seek(0)
+    return output
+
+
+def _png_chunk(output, kind, data):
+    output.write(pack('>I', len(data)))
+    output.write(kind)
+    output.write(data)
+    output.write(pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+
+def pillow_open(fileobj):
+    """Open an image with Pillow, without its decompression bomb limit
+
+    Large orthophotos are expected here, not decompression bombs. The
+    limit is a process global that Pillow checks when opening, so it is
+    lifted only while holding a lock, and threads encoding textures at
+    the same time never see it restored mid-open.
+    """
+    with _PILLOW_LOCK:
+        limit = PILImage.MAX_IMAGE_PIXELS
+        PILImage.MAX_IMAGE_PIXELS = None
+        try:
+            return PILImage.open(fileobj)
+        finally:
+            PILImage.MAX_IMAGE_PIXELS = limit
+
+
+def _pillow_image(fileobj, info, max_pixels):
+    """The image opened with Pillow and resampled within max_pixels"""
+    image = pillow_open(fileobj)
+    if max_pixels is not None and info.width * info.height > max_pixels:
+        scale = np.sqrt(max_pixels / (info.width * info.height))
+        size = (max(int(info.width * scale), 1),
+                max(int(info.height * scale), 1))
+        # JPEGs can be decoded at a fraction of their size directly
+        image.draft(image.mode, size)
+        image = image.resize(size, PILImage.LANCZOS, reducing_gap=3.)
+    else:
+        image.load()
+    if image.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        image = image.convert('RGBA' if info.alpha else 'RGB')
+    return image
+
+
+def check_texture(info, max_pixels=None, jpeg=False):
+    """Raise ValueError if an image with this ImageInfo cannot be
+    encoded by encode_texture with these settings
+
+    Without Pillow, JPEGs can only be sent as they are: JPEG textures
+    must be enabled and the image must be within max_pixels.
+    """
+    if PILImage is not None or info.format != 'jpg':
+        return
+    if not jpeg or (max_pixels is not None and
+                    info.width * info.height > max_pixels):
+        raise ValueError(
+            'JPEG textures need Pillow to be converted or downsampled; '
+            'install Pillow or enable JPEG textures with '
+            'steno3d.client.Comms.configure(jpeg_textures=True)'
+        )
+
+
+def encode_texture(image, max_pixels=None, jpeg=False):
+    """Encode an image file for upload as (file, format)
+
+    `image` is a BytesIO holding a PNG or JPEG. If it is within
+    max_pixels, and in an allowed format, its own bytes are returned
+    without a copy. Otherwise it is downsampled to fit and encoded as
+    PNG. If `jpeg` is True, JPEGs are kept as JPEG, and with Pillow
+    installed, opaque images of more than JPEG_PIXELS pixels are
+    encoded as JPEG too.
+    """
+    info = image_info(image)
+    check_texture(info, max_pixels, jpeg)
+    pixels = info.width * info.height
+    fits = max_pixels is None or pixels <= max_pixels
+    # JPEGs stay JPEGs; large opaque PNGs become JPEGs if Pillow can
+    # encode them
+    use_jpeg = jpeg and not info.alpha and (
+        info.format == 'jpg' and (fits or PILImage is not None) or
+        pixels > JPEG_PIXELS and PILImage is not None
+    )
+    if fits and info.format == ('jpg' if use_jpeg else 'png'):
+        # A BytesIO of the same bytes; closing it leaves the image open
+        return _named(BytesIO(image.getvalue()), info.format), info.format
+    if PILImage is not None:
+        resized = _pillow_image(image, info, max_pixels)
+        image.seek(0)
+        output = BytesIO()
+        if use_jpeg:
+            resized.save(output, 'JPEG', quality=JPEG_QUALITY)
+        else:
+            resized.save(output, 'PNG')
+    else:
+        factor = 1 if fits else reduction_factor(info.width, info.height,
+                                                 max_pixels)
+        output = encode_png(*_png_pixels(image, factor))
+        image.seek(0)
+    output.seek(0)
+    fmt = 'jpg' if use_jpeg else 'png'
+    return _named(output, fmt), fmt
+
+
+def _named(fileobj, fmt):
+    fileobj.name = 'texture_copy.' + fmt
+    return fileobj
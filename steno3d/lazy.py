@@ -0,0 +1,171 @@
+"""lazy.py contains LazyArray, an array whose values stay on disk (or
+are computed) until they are needed for validation or upload, and
+GridView, which presents an N-d grid source as a 1-d array
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+from six import string_types
+
+
+class LazyArray(object):
+    """Array read from its source only when its values are needed
+
+    Array traits accept any of these sources and wrap them in a
+    LazyArray:
+
+    * the path of a .npy file, which is opened memory-mapped
+    * an np.memmap
+    * an array-like with shape, dtype and slicing, such as an h5py
+      Dataset
+    * a callable that returns an array. It is called once, when the
+      values are first needed, and the array it returns is kept for
+      later reads. Give shape and dtype to defer the call until then;
+      otherwise it is called here to find them.
+
+    Shape and dtype are available without reading values. Values are
+    read a block of rows at a time with `iter_chunks`.
+    """
+
+    def __init__(self, source, shape=None, dtype=None):
+        self._values = None
+        if isinstance(source, LazyArray):
+            shape = source.shape if shape is None else shape
+            dtype = source.dtype if dtype is None else dtype
+            self._values = source._values
+            source = source.source
+        if isinstance(source, string_types):
+            source = np.load(source, mmap_mode='r')
+        if not (callable(source) or self.is_source(source)):
+            raise TypeError('{}: not an array source'.format(source))
+        self.source = source
+        if shape is None or dtype is None:
+            if callable(source):
+                if self._values is None:
+                    self._values = np.asarray(source())
+                values = self._values
+            else:
+                values = source
+            shape = values.shape if shape is None else shape
+            dtype = values.dtype if dtype is None else dtype
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @staticmethod
+    def is_source(value):
+        """True if value is array-like but not an in-memory ndarray"""
+        if isinstance(value, np.memmap):
+            return True
+        if isinstance(value, (np.ndarray, list, tuple)):
+            return False
+        return all(hasattr(value, attr)
+                   for attr in ('shape', 'dtype', '__getitem__'))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return 'LazyArray(shape={}, dtype={})'.format(self.shape, self.dtype)
+
+    def resolve(self):
+        """Sliceable source of the values"""
+        if not callable(self.source):
+            return self.source
+        if self._values is None:
+            values = np.asarray(self.source())
+            if values.shape != self.shape:
+                raise ValueError(
+                    'Lazy array source returned shape {}, expected '
+                    '{}'.format(values.shape, self.shape)
+                )
+            self._values = values
+        return self._values
+
+    def iter_chunks(self, rows):
+        """Yield ndarrays of up to `rows` leading-axis rows in order"""
+        values = self.resolve()
+        for start in range(0, len(self), rows):
+            yield np.asarray(values[start:start + rows])
+
+    def __getitem__(self, key):
+        return np.asarray(self.resolve()[key])
+
+    def __array__(self, dtype=None):
+        values = np.asarray(self.resolve()[...])
+        return values if dtype is None else values.astype(dtype)
+
+
+class GridView(object):
+    """One-dimensional view of an N-d array source in C or Fortran order
+
+    The view has the same values as `np.ravel(source, order)` but reads
+    the source in slabs: rows along the first axis for C order, planes
+    along the last axis for Fortran order. A slice of the view reads only
+    the slabs it covers, so a grid larger than memory can be serialized
+    a chunk at a time. The source may be an ndarray or anything
+    LazyArray accepts; a callable source is called once, here.
+
+    Slabs are contiguous only when the source is stored in the same
+    order. Fortran-order planes of a C-ordered file on disk are gathered
+    a few values from every row, reading the whole file for each chunk,
+    so store grids to be read in Fortran order in Fortran order, e.g.
+    `np.save(file_name, np.asfortranarray(grid))`; `np.load` of that
+    file with `mmap_mode='r'` gives a Fortran-ordered memmap.
+    """
+
+    def __init__(self, source, order='c'):
+        order = order.lower()
+        if order not in ('c', 'f'):
+            raise ValueError('{}: order must be c or f'.format(order))
+        if not isinstance(source, np.ndarray):
+            source = LazyArray(source).resolve()
+        self.source = source
+        self.order = order
+        self.grid_shape = tuple(source.shape)
+        self.shape = (int(np.prod(self.grid_shape)),)
+        self.dtype = np.dtype(source.dtype)
+        if order == 'c':
+            self._slab = int(np.prod(self.grid_shape[1:]))
+        else:
+            self._slab = int(np.prod(self.grid_shape[:-1]))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if key is Ellipsis:
+            key = slice(None)
+        if not isinstance(key, slice):
+            index = range(len(self))[key]
+            return self[index:index + 1][0]
+        start, stop, step = key.indices(len(self))
+        if step < 0:
+            raise IndexError('GridView does not support negative steps')
+        if step != 1:
+            return self[start:stop][::step]
+        if stop <= start or self._slab == 0:
+            return np.zeros(0, self.dtype)
+        first = start // self._slab
+        last = -(-stop // self._slab)
+        if self.order == 'c':
+            block = np.asarray(self.source[first:last]).reshape(-1)
+        else:
+            block = np.asarray(self.source[..., first:last]).ravel(order='F')
+        offset = first * self._slab
+        return block[start - offset:stop - offset]
@@ -5,18 +5,20 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from numpy import max as npmax
-from numpy import min as npmin
 from numpy import ndarray
 from six import string_types
 from traitlets import observe, validate
 
 from .base import BaseMesh
 from .base import CompositeResource
+from .cache import cache_key
 from .data import DataArray
+from .lazy import LazyArray
+from .meshops import optimize_cells, simplify_polylines
 from .options import ColorOptions
 from .options import Options
 from .traits import Array, HasSteno3DTraits, KeywordInstance, Repeated, String
+from .traits import array_range, serialized_nbytes
 
 
 class _Mesh1DOptions(Options):
@@ -70,8 +72,8 @@ class Mesh1D(BaseMesh):
             return self._nbytes('segments') + self._nbytes('vertices')
         if isinstance(arr, string_types) and arr in ('segments', 'vertices'):
             arr = getattr(self, arr)
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('Mesh1D cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
@@ -85,20 +87,57 @@ class Mesh1D(BaseMesh):
 
     @validate('segments')
     def _validate_seg(self, proposal):
-        if npmin(proposal['value']) < 0:
+        lo, hi = array_range(proposal['value'])
+        if lo < 0:
             raise ValueError('Segments may only have positive integers')
-        if npmax(proposal['value']) >= len(proposal['owner'].vertices):
+        if hi >= len(proposal['owner'].vertices):
             raise ValueError('Segments expects more vertices than provided')
         proposal['owner']._validate_file_size('segments', proposal['value'])
         return proposal['value']
 
     @validate('vertices')
     def _validate_vert(self, proposal):
-        if npmax(proposal['owner'].segments) >= len(proposal['value']):
+        _, hi = array_range(proposal['owner'].segments)
+        if hi >= len(proposal['value']):
             raise ValueError('Segments expects more vertices than provided')
         proposal['owner']._validate_file_size('vertices', proposal['value'])
         return proposal['value']
 
+    def optimize(self, tolerance=0., reorder=True):
+        """Weld coincident vertices, drop degenerate segments and unused
+        vertices, and reorder both for locality
+
+        Vertices closer than about `tolerance` are welded (see
+        steno3d.meshops.weld); with 0 only identical vertices are. Returns
+        (node_index, cell_index), the indices of the original vertices
+        and segments that were kept, in their new order. Use
+        Line.optimize to remap the data along with the mesh.
+        """
+        vertices, segments, node_index, cell_index = optimize_cells(
+            self.vertices, self.segments, tolerance, reorder
+        )
+        # New indices never exceed the old vertex count, so segments
+        # go first to keep the pair valid at every step
+        self.segments = segments
+        self.vertices = vertices
+        return node_index, cell_index
+
+    def decimate(self, target=None, tolerance=None):
+        """Simplify polylines to about `target` segments, or by removing
+        vertices within `tolerance` of the simplified line
+
+        Uses the Douglas-Peucker algorithm (see
+        steno3d.meshops.simplify_polylines). Returns (node_index,
+        cell_index) as Mesh1D.optimize does. Use Line.decimate to carry
+        the data along.
+        """
+        vertices, segments, node_index, cell_index = simplify_polylines(
+            self.vertices, self.segments, target, tolerance
+        )
+        self.segments = segments
+        self.vertices = vertices
+        return node_index, cell_index
+
     def _get_dirty_files(self, force=False):
         files = super(Mesh1D, self)._get_dirty_files(force)
         dirty = self._dirty_traits
@@ -118,12 +157,18 @@ class Mesh1D(BaseMesh):
             vertices=Array.download(
                 url=json['vertices'],
                 shape=(json['verticesSize']//12, 3),
-                dtype=json['verticesType']
+                dtype=json['verticesType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'vertices'),
+                encoding=json.get('verticesEncoding')
             ),
             segments=Array.download(
                 url=json['segments'],
                 shape=(json['segmentsSize']//8, 2),
-                dtype=json['segmentsType']
+                dtype=json['segmentsType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'segments'),
+                encoding=json.get('segmentsEncoding')
             ),
             opts=json['meta']
         )
@@ -147,6 +192,8 @@ class _LineBinder(HasSteno3DTraits):
 
 class Line(CompositeResource):
     """Contains all the information about a 1D line set"""
+    _cells = 'segments'
+
     mesh = KeywordInstance(
         help='Mesh',
         klass='Mesh1D'
@@ -162,9 +209,49 @@ class Line(CompositeResource):
         allow_none=True
     )
 
+    def _can_partition(self):
+        return True
+
     def _nbytes(self):
         return self.mesh._nbytes() + sum(d.data._nbytes() for d in self.data)
 
+    def optimize(self, tolerance=0., reorder=True):
+        """Optimize the mesh (see Mesh1D.optimize) and remap node and
+        cell data to match
+
+        Returns (node_index, cell_index) as Mesh1D.optimize does.
+        """
+        node_index, cell_index = self.mesh.optimize(tolerance, reorder)
+        self._remap_data(node_index, cell_index)
+        return node_index, cell_index
+
+    def decimate(self, target=None, max_bytes=None, tolerance=None):
+        """Simplify the Mesh1D to `target` segments, to within
+        `tolerance`, or until the line serializes to at most
+        `max_bytes`, and remap the data to match
+
+        Node data follows the kept vertices; each new segment takes the
+        cell data of the first segment it replaces. Returns (node_index,
+        cell_index) into the original mesh.
+        """
+        if [target, max_bytes, tolerance].count(None) != 2:
+            raise ValueError('Specify exactly one of target, max_bytes or '
+                             'tolerance')
+        if max_bytes is not None:
+            return self._decimate_until(self.mesh.decimate, self._nbytes,
+                                        max_bytes)
+        node_index, cell_index = self.mesh.decimate(target, tolerance)
+        self._remap_data(node_index, cell_index)
+        return node_index, cell_index
+
+    def fit(self, file_size_limit=None):
+        """Simplify the Mesh1D until every mesh and data file is within
+        the file size limit (by default, that of the logged in user)
+
+        Returns (node_index, cell_index) as Line.decimate does.
+        """
+        return self._fit(self.mesh.decimate, file_size_limit)
+
     @validate('data')
     def _validate_data(self, proposal):
         """Check if resource is built correctly"""
@@ -0,0 +1,548 @@
+"""meshfiles.py contains the built-in parsers for common triangle mesh
+files: Wavefront OBJ, PLY and STL
+
+Binary files are read straight from a memory map with numpy record
+views; ASCII files are tokenized a chunk of lines at a time (see
+steno3d.textio). Importing steno3d.parsers makes the parsers available
+as steno3d.parsers.obj, steno3d.parsers.ply and steno3d.parsers.stl.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os.path import basename, getsize, splitext
+
+import numpy as np
+
+from .data import DataArray
+from .line import Line, Mesh1D
+from .parsers import BaseParser, ParseError
+from .project import Project
+from .surface import Mesh2D, Surface
+from .textio import Lines, fan_triangles, iter_chunks, map_file, numbers
+from .textio import _SPACE
+
+
+def _title(file_name):
+    return splitext(basename(file_name))[0]
+
+
+def _check_indices(file_name, cells, n_vertices):
+    if len(cells) > 0 and (cells.min() < 0 or cells.max() >= n_vertices):
+        raise ParseError('{}: Vertex index out of range'.format(file_name))
+
+
+def _surface(project, title, vertices, triangles, node_data=None,
+             cell_data=None):
+    """Surface from parsed arrays, with dicts of named node and cell
+    data arrays"""
+    data = [dict(location=location, data=DataArray(title=name, array=array))
+            for location, named in (('N', node_data), ('CC', cell_data))
+            for name, array in sorted((named or {}).items())]
+    return Surface(project, title=title, data=data, mesh=Mesh2D(
+        vertices=vertices, triangles=triangles
+    ))
+
+
+def _slash_tails(text):
+    """Blank everything from a '/' to the end of its word, so 'v/vt/vn'
+    becomes 'v'"""
+    if b'/' not in text:
+        return text
+    text = np.frombuffer(text, np.uint8).copy()
+    slash = text == ord('/')
+    boundary = slash | _SPACE[text]
+    last = np.maximum.accumulate(np.where(boundary, np.arange(len(text)),
+                                          0))
+    text[slash[last]] = ord(' ')
+    return text.tobytes()
+
+
+class obj(BaseParser):
+    """class obj
+
+    Parser class for Wavefront .obj ASCII object files
+
+    Vertices ('v'), faces ('f') and polylines ('l') are read; faces
+    become one Surface (polygons are split into triangle fans) and
+    polylines one Line. Texture coordinates, normals, groups and
+    materials are ignored.
+    """
+
+    extensions = ('obj',)
+
+    def parse(self, project=None, **kwargs):
+        """function parse
+
+        Parses the .obj file into a Steno3D project, adding a Surface
+        for the faces and a Line for the polylines it contains.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        if project is None:
+            project = Project(description='Project imported from ' +
+                              basename(self.file_name))
+        vertices, faces, polylines = [], [], []
+        n_vertices = 0
+        try:
+            for _, chunk in iter_chunks(map_file(self.file_name)):
+                lines = Lines(chunk)
+                is_vertex = lines.keyword('v')
+                before = n_vertices + np.cumsum(is_vertex) - is_vertex
+                vertices.append(self._read_vertices(lines, is_vertex))
+                n_vertices += len(vertices[-1])
+                for word, cells in (('f', faces), ('l', polylines)):
+                    mask = lines.keyword(word)
+                    if mask.any():
+                        cells.append(self._read_cells(lines, mask,
+                                                      before[mask]))
+        except ValueError as err:
+            raise ParseError('{}: {}'.format(self.file_name, err))
+        vertices = (np.vstack(vertices) if vertices
+                    else np.zeros((0, 3)))
+        title = _title(self.file_name)
+        if faces:
+            values = np.concatenate([face[0] for face in faces])
+            counts = np.concatenate([face[1] for face in faces])
+            if (counts < 3).any():
+                raise ParseError('{}: Faces need at least 3 '
+                                 'vertices'.format(self.file_name))
+            triangles = fan_triangles(values, counts)[0]
+            _check_indices(self.file_name, triangles, len(vertices))
+            _surface(project, title, vertices, triangles)
+        if polylines:
+            values = np.concatenate([line[0] for line in polylines])
+            counts = np.concatenate([line[1] for line in polylines])
+            offsets = np.cumsum(counts) - counts
+            line = np.repeat(np.arange(len(counts)), counts - 1)
+            step = np.arange(len(line)) - np.repeat(
+                np.cumsum(counts - 1) - (counts - 1), counts - 1
+            )
+            segments = np.column_stack([values[offsets[line] + step],
+                                        values[offsets[line] + step + 1]])
+            _check_indices(self.file_name, segments, len(vertices))
+            Line(project, title=title, mesh=Mesh1D(
+                vertices=vertices, segments=segments
+            ))
+        return (project,)
+
+    @staticmethod
+    def _read_vertices(lines, mask):
+        widths = lines.tokens[mask] - 1
+        if len(widths) == 0:
+            return np.zeros((0, 3))
+        values = numbers(lines.text(mask, skip=1), count=widths.sum())
+        if (widths == widths[0]).all() and widths[0] >= 3:
+            return values.reshape(-1, widths[0])[:, :3]
+        # Mixed optional w or color columns: take the first three of each
+        if (widths < 3).any():
+            raise ValueError('Vertices need x, y and z')
+        starts = np.cumsum(widths) - widths
+        return values[starts[:, None] + np.arange(3)]
+
+    @staticmethod
+    def _read_cells(lines, mask, before):
+        """Flat zero-based vertex indices and the count per line"""
+        counts = lines.tokens[mask] - 1
+        text = _slash_tails(lines.text(mask, skip=1))
+        values = numbers(text, dtype=np.int64, count=counts.sum())
+        # Positive indices count from 1; negative ones back from the
+        # last vertex read so far
+        relative = np.repeat(before, counts)
+        values = np.where(values < 0, relative + values, values - 1)
+        return values, counts
+
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+class _PlyElement(object):
+    """An element of a PLY header: its name, count and properties
+
+    Properties are (name, type) for scalars and (name, (count type,
+    item type)) for lists; at most one list is supported.
+    """
+
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []
+
+    @property
+    def list_index(self):
+        lists = [i for i, (_, kind) in enumerate(self.properties)
+                 if isinstance(kind, tuple)]
+        if len(lists) > 1:
+            raise ValueError('Element {} has more than one list '
+                             'property'.format(self.name))
+        return lists[0] if lists else None
+
+    @property
+    def integral(self):
+        """Whether every property holds integers"""
+        kinds = []
+        for _, kind in self.properties:
+            kinds += list(kind) if isinstance(kind, tuple) else [kind]
+        return all(np.dtype(kind).kind in 'iu' for kind in kinds)
+
+    def dtype(self, endian, list_length=None):
+        """Record dtype, with lists of the given length"""
+        fields = []
+        for name, kind in self.properties:
+            if isinstance(kind, tuple):
+                fields.append(('_count', endian + kind[0]))
+                fields.append((name, endian + kind[1], (list_length,)))
+            else:
+                fields.append((name, endian + kind))
+        return np.dtype(fields)
+
+
+class ply(BaseParser):
+    """class ply
+
+    Parser class for ASCII and binary (little or big endian) .ply files
+
+    The vertex and face elements become a Surface; polygons are split
+    into triangle fans. Vertex properties other than x, y and z become
+    node data and scalar face properties become cell data. Faces are
+    optional, so a point-only file gives a Surface without triangles.
+    """
+
+    extensions = ('ply',)
+
+    def parse(self, project=None, **kwargs):
+        """function parse
+
+        Parses the .ply file into a Steno3D project with one Surface.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        if project is None:
+            project = Project(description='Project imported from ' +
+                              basename(self.file_name))
+        try:
+            fmt, elements, offset = self._read_header()
+            if fmt == 'ascii':
+                records = self._read_ascii(elements, offset)
+            else:
+                endian = '<' if fmt == 'binary_little_endian' else '>'
+                records = self._read_binary(elements, offset, endian)
+        except ValueError as err:
+            raise ParseError('{}: {}'.format(self.file_name, err))
+        if 'vertex' not in records:
+            raise ParseError('{}: No vertex element'.format(self.file_name))
+        vertex = records['vertex']
+        if any(axis not in vertex for axis in 'xyz'):
+            raise ParseError('{}: Vertices need x, y and z '
+                             'properties'.format(self.file_name))
+        vertices = np.column_stack([vertex.pop(axis) for axis in 'xyz'])
+        node_data = {name: values.astype(np.float64)
+                     for name, values in vertex.items()}
+        cell_data = {}
+        triangles = np.zeros((0, 3), int)
+        if 'face' in records:
+            face = records['face']
+            key = ('vertex_indices' if 'vertex_indices' in face
+                   else 'vertex_index')
+            if key not in face:
+                raise ParseError('{}: Faces need a vertex_indices '
+                                 'list'.format(self.file_name))
+            values, counts = face.pop(key)
+            if (counts < 3).any():
+                raise ParseError('{}: Faces need at least 3 '
+                                 'vertices'.format(self.file_name))
+            triangles, polygon = fan_triangles(values.astype(np.int64),
+                                               counts)
+            _check_indices(self.file_name, triangles, len(vertices))
+            cell_data = {name: values[polygon].astype(np.float64)
+                         for name, values in face.items()
+                         if not isinstance(values, tuple)}
+        _surface(project, _title(self.file_name), vertices, triangles,
+                 node_data, cell_data)
+        return (project,)
+
+    def _read_header(self):
+        with open(self.file_name, 'rb') as fileobj:
+            if fileobj.readline().strip() != b'ply':
+                raise ValueError('Not a PLY file')
+            fmt = None
+            elements = []
+            while True:
+                line = fileobj.readline()
+                if not line:
+                    raise ValueError('Missing end_header')
+                words = line.decode('ascii', 'replace').split()
+                if not words or words[0] in ('comment', 'obj_info'):
+                    continue
+                if words[0] == 'end_header':
+                    break
+                if words[0] == 'format':
+                    fmt = words[1]
+                elif words[0] == 'element':
+                    elements.append(_PlyElement(words[1], int(words[2])))
+                elif words[0] == 'property' and elements:
+                    if words[1] == 'list':
+                        kind = (_PLY_TYPES[words[2]], _PLY_TYPES[words[3]])
+                    else:
+                        kind = _PLY_TYPES[words[1]]
+                    elements[-1].properties.append((words[-1], kind))
+                else:
+                    raise ValueError('Invalid header line: ' +
+                                     line.decode('ascii', 'replace'))
+            offset = fileobj.tell()
+        if fmt not in ('ascii', 'binary_little_endian', 'binary_big_endian'):
+            raise ValueError('Unsupported format {}'.format(fmt))
+        return fmt, elements, offset
+
+    @staticmethod
+    def _columns(element, records, lists=None):
+        """Dict of property arrays; lists are (flat values, counts)"""
+        columns = {}
+        for name, kind in element.properties:
+            if isinstance(kind, tuple):
+                columns[name] = lists
+            else:
+                columns[name] = records[name]
+        return columns
+
+    def _read_binary(self, elements, offset, endian):
+        buf = map_file(self.file_name)
+        records = {}
+        for element in elements:
+            if element.list_index is None:
+                dtype = element.dtype(endian)
+                end = offset + dtype.itemsize * element.count
+                if end > len(buf):
+                    raise ValueError('File ends inside element ' +
+                                     element.name)
+                rows = np.frombuffer(buf[offset:end], dtype)
+                records[element.name] = self._columns(element, rows)
+                offset = end
+                continue
+            rows, lists, offset = self._read_binary_lists(
+                buf, element, offset, endian
+            )
+            records[element.name] = self._columns(element, rows, lists)
+        return records
+
+    @staticmethod
+    def _read_binary_lists(buf, element, offset, endian):
+        """Read records with one list property in runs of equal length
+
+        Each run reads as many records as possible assuming they all
+        have the list length of the first, then stops at the first that
+        does not. Files where every face has the same size take a
+        single run.
+        """
+        count_at = element.dtype(endian, 0).fields['_count'][1]
+        count_type = np.dtype(endian + element.properties[
+            element.list_index][1][0])
+        runs, counts = [], []
+        done = 0
+        while done < element.count:
+            length = int(np.frombuffer(buf[offset + count_at:offset +
+                                           count_at + count_type.itemsize],
+                                       count_type)[0])
+            dtype = element.dtype(endian, length)
+            available = min(element.count - done,
+                            (len(buf) - offset) // dtype.itemsize)
+            if available < 1:
+                raise ValueError('File ends inside element ' + element.name)
+            rows = np.frombuffer(buf[offset:offset + available *
+                                     dtype.itemsize], dtype)
+            wrong = np.flatnonzero(rows['_count'] != length)
+            if len(wrong) > 0:
+                rows = rows[:wrong[0]]
+            runs.append(rows)
+            counts.append(np.full(len(rows), length))
+            done += len(rows)
+            offset += len(rows) * dtype.itemsize
+        name = element.properties[element.list_index][0]
+        values = np.concatenate([rows[name].reshape(-1) for rows in runs])
+        counts = np.concatenate(counts) if counts else np.zeros(0, int)
+        scalars = {}
+        for prop, kind in element.properties:
+            if not isinstance(kind, tuple):
+                scalars[prop] = np.concatenate([rows[prop] for rows in runs])
+        return scalars, (values, counts), offset
+
+    def _read_ascii(self, elements, offset):
+        """Read elements from the body a chunk of lines at a time"""
+        line_starts = np.cumsum([0] + [e.count for e in elements])
+        parts = [[] for _ in elements]
+        # Integers parse much faster than floats
+        dtypes = [np.int64 if element.integral else np.float64
+                  for element in elements]
+        line = 0
+        for _, chunk in iter_chunks(map_file(self.file_name, offset)):
+            lines = Lines(chunk)
+            number = line + np.arange(len(lines))
+            line += len(lines)
+            for i in range(len(elements)):
+                mask = ((number >= line_starts[i]) &
+                        (number < line_starts[i + 1]))
+                if mask.any():
+                    parts[i].append((lines.tokens[mask], numbers(
+                        lines.text(mask), dtypes[i],
+                        count=lines.tokens[mask].sum()
+                    )))
+        records = {}
+        for element, part in zip(elements, parts):
+            tokens = np.concatenate([p[0] for p in part]) if part else \
+                np.zeros(0, int)
+            values = np.concatenate([p[1] for p in part]) if part else \
+                np.zeros(0)
+            if len(tokens) != element.count:
+                raise ValueError('File ends inside element ' + element.name)
+            records[element.name] = self._ascii_columns(element, tokens,
+                                                        values)
+        return records
+
+    def _ascii_columns(self, element, tokens, values):
+        starts = np.cumsum(tokens) - tokens
+        list_index = element.list_index
+        if list_index is None:
+            width = len(element.properties)
+            if (tokens != width).any():
+                raise ValueError('Wrong number of values in element ' +
+                                 element.name)
+            rows = {name: values[i::width].astype(kind)
+                    for i, (name, kind) in enumerate(element.properties)}
+            return self._columns(element, rows)
+        counts = values[starts + list_index].astype(np.int64)
+        if (tokens != len(element.properties) + counts).any():
+            raise ValueError('Wrong number of values in element ' +
+                             element.name)
+        rows = {}
+        for i, (name, kind) in enumerate(element.properties):
+            if i < list_index:
+                rows[name] = values[starts + i].astype(kind)
+            elif i > list_index:
+                rows[name] = values[starts + counts + i].astype(kind)
+        items = np.repeat(starts + list_index + 1 - (np.cumsum(counts) -
+                                                     counts), counts)
+        items = values[items + np.arange(counts.sum())]
+        return self._columns(element, rows, (items, counts))
+
+
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)),
+                        ('attribute', '<u2')])
+
+
+class stl(BaseParser):
+    """class stl
+
+    Parser class for binary and ASCII stereolithography .stl files
+
+    Each solid becomes a Surface. STL stores three separate vertices
+    per triangle; by default identical vertices are welded so the
+    surface is connected.
+    """
+
+    extensions = ('stl',)
+
+    def parse(self, project=None, weld=True, **kwargs):
+        """function parse
+
+        Parses the .stl file into a Steno3D project with a Surface per
+        solid.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            weld - Merge identical vertices (default True)
+
+        Output:
+            tuple containing the Steno3D project
+        """
+        if project is None:
+            project = Project(description='Project imported from ' +
+                              basename(self.file_name))
+        try:
+            if self._is_binary():
+                solids = [(_title(self.file_name), self._read_binary())]
+            else:
+                solids = self._read_ascii()
+        except ValueError as err:
+            raise ParseError('{}: {}'.format(self.file_name, err))
+        for title, corners in solids:
+            triangles = np.arange(len(corners)).reshape(-1, 3)
+            surface = _surface(project, title, corners, triangles)
+            if weld:
+                surface.mesh.optimize(reorder=False)
+        return (project,)
+
+    def _is_binary(self):
+        size = getsize(self.file_name)
+        if size < 84:
+            return False
+        with open(self.file_name, 'rb') as fileobj:
+            fileobj.seek(80)
+            count = int(np.frombuffer(fileobj.read(4), '<u4')[0])
+        return size == 84 + count * _STL_RECORD.itemsize
+
+    def _read_binary(self):
+        records = np.frombuffer(map_file(self.file_name, 84), _STL_RECORD)
+        return records['vertices'].reshape(-1, 3).astype(np.float64)
+
+    def _read_ascii(self):
+        """Solid titles and corner vertices, three per triangle"""
+        solids = []
+        corners = []
+        for _, chunk in iter_chunks(map_file(self.file_name)):
+            lines = Lines(chunk)
+            starts = np.flatnonzero(lines.keyword('solid'))
+            is_vertex = lines.keyword('vertex')
+            # Split the chunk at the solid lines
+            bounds = np.r_[0, starts, len(lines)]
+            for i in range(len(bounds) - 1):
+                mask = is_vertex.copy()
+                mask[:bounds[i]] = False
+                mask[bounds[i + 1]:] = False
+                if i > 0:
+                    if corners:
+                        solids.append(corners)
+                    corners = [self._solid_title(lines, bounds[i])]
+                elif not corners:
+                    corners = [_title(self.file_name)]
+                if mask.any():
+                    if (lines.tokens[mask] != 4).any():
+                        raise ValueError('Vertices need x, y and z')
+                    corners.append(numbers(
+                        lines.text(mask, skip=len('vertex')),
+                        count=3 * mask.sum()
+                    ).reshape(-1, 3))
+        if corners:
+            solids.append(corners)
+        result = []
+        for solid in solids:
+            points = (np.vstack(solid[1:]) if len(solid) > 1
+                      else np.zeros((0, 3)))
+            if len(points) % 3:
+                raise ValueError('Facets need three vertices')
+            if len(points) > 0:
+                result.append((solid[0], points))
+        return result
+
+    def _solid_title(self, lines, index):
+        line = lines.chunk[lines.first[index]:lines.ends[index]]
+        words = line.tobytes().decode('ascii', 'replace').split(None, 1)
+        return words[1].strip() if len(words) > 1 else \
+            _title(self.file_name)
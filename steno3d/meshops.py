@@ -0,0 +1,495 @@
+"""meshops.py contains vectorized operations on vertex and cell arrays,
+used to clean up meshes before upload
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+MORTON_BITS = 21
+_HASH_PRIMES = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F),
+                np.uint64(0x165667B19E3779F9))
+
+
+def _row_hashes(rows):
+    """64-bit hash of each row of an (n, k) array of 8-byte values"""
+    words = np.ascontiguousarray(rows).view(np.uint64)
+    hashes = np.zeros(len(rows), np.uint64)
+    with np.errstate(over='ignore'):
+        for i in range(words.shape[1]):
+            hashes ^= words[:, i]
+            hashes *= _HASH_PRIMES[i % len(_HASH_PRIMES)]
+            hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+def group_rows(rows):
+    """Find identical rows of a 2-d array
+
+    Returns (first, inverse): `first` holds the index of the first
+    occurrence of each distinct row, in ascending order, and `inverse`
+    maps every row to its position in `first`, so `rows[first][inverse]`
+    equals `rows`.
+
+    Rows are grouped by a hash and sorted once; the grouping is then
+    verified, falling back to an exact (slower) sort if hashes collide.
+    """
+    rows = np.asarray(rows)
+    if rows.dtype.itemsize != 8:
+        rows = rows.astype(np.float64 if rows.dtype.kind == 'f'
+                           else np.int64)
+    if rows.dtype.kind == 'f':
+        # -0.0 and 0.0 are the same coordinate
+        rows = rows + 0.
+    if len(rows) == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    hashes = _row_hashes(rows)
+    order = np.argsort(hashes)
+    sorted_hashes = hashes[order]
+    new_group = np.empty(len(rows), bool)
+    new_group[0] = True
+    np.not_equal(sorted_hashes[1:], sorted_hashes[:-1], out=new_group[1:])
+    first = np.minimum.reduceat(order, np.flatnonzero(new_group))
+    rank = np.argsort(first)
+    first = first[rank]
+    group = np.empty(len(rank), np.intp)
+    group[rank] = np.arange(len(rank))
+    inverse = np.empty(len(rows), np.intp)
+    inverse[order] = group[np.cumsum(new_group) - 1]
+    if not all(np.array_equal(rows[first, i][inverse], rows[:, i])
+               for i in range(rows.shape[1])):
+        _, first, inverse = np.unique(rows, axis=0, return_index=True,
+                                      return_inverse=True)
+        inverse = inverse.reshape(-1)
+    return first, inverse
+
+
+def weld(vertices, tolerance=0.):
+    """Merge coincident vertices
+
+    With tolerance 0, only identical vertices are merged. Otherwise
+    vertices are snapped to a grid with spacing `tolerance` and those
+    that land on the same grid point are merged. Returns (first, inverse)
+    as for group_rows; the first vertex of each group represents it.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if tolerance > 0 and len(vertices) > 0:
+        keys = np.floor(
+            (vertices - vertices.min(axis=0)) / tolerance + .5
+        ).astype(np.int64)
+        return group_rows(keys)
+    return group_rows(vertices)
+
+
+def morton_order(points):
+    """Indices that sort points along a Z-order (Morton) curve
+
+    Points close in space end up close in the ordering, which keeps
+    consecutive cells and vertices near each other in the arrays.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return np.zeros(0, np.intp)
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, np.finfo(float).tiny)
+    scaled = (points - lo) / extent * (2**MORTON_BITS - 1)
+    codes = np.zeros(len(points), np.uint64)
+    for axis in range(points.shape[1]):
+        x = np.nan_to_num(scaled[:, axis]).astype(np.uint64)
+        for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+                            (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+                            (2, 0x1249249249249249)):
+            x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+        codes |= x << np.uint64(axis)
+    return np.argsort(codes)
+
+
+def compact(cells, n_vertices):
+    """Drop vertices no cell uses
+
+    Returns (node_index, cells): the indices of the used vertices, in
+    order, and the cells renumbered to index them.
+    """
+    used = np.zeros(n_vertices, bool)
+    used[cells] = True
+    renumber = np.cumsum(used) - 1
+    return np.flatnonzero(used), renumber[cells]
+
+
+def optimize_cells(vertices, cells, tolerance=0., reorder=True):
+    """Clean up a mesh of cells (triangles, segments) that index vertices
+
+    In order, this:
+
+    * welds coincident vertices (see `weld`)
+    * drops degenerate cells, which use a vertex more than once
+    * drops vertices no cell uses
+    * if `reorder`, sorts vertices along a Morton curve and cells by
+      their lowest vertex, for locality
+
+    Returns (vertices, cells, node_index, cell_index). `node_index` and
+    `cell_index` give, for each output vertex and cell, the index of the
+    input vertex or cell it came from, so node and cell data are remapped
+    as `data[node_index]` and `data[cell_index]`.
+    """
+    vertices = np.asarray(vertices)
+    cells = np.asarray(cells)
+    first, inverse = weld(vertices, tolerance)
+    cells = inverse[cells]
+    cell_index = np.arange(len(cells))
+
+    columns = [cells[:, i] for i in range(cells.shape[1])]
+    keep = np.ones(len(cells), bool)
+    for i, column in enumerate(columns):
+        for other in columns[i + 1:]:
+            keep &= column != other
+    cells, cell_index = cells[keep], cell_index[keep]
+
+    kept, cells = compact(cells, len(first))
+    node_index = first[kept]
+
+    if reorder and len(cells) > 0:
+        vertex_order = morton_order(vertices[node_index])
+        node_index = node_index[vertex_order]
+        renumber = np.empty(len(vertex_order), np.intp)
+        renumber[vertex_order] = np.arange(len(vertex_order))
+        cells = renumber[cells]
+        lowest = cells[:, 0].copy()
+        for i in range(1, cells.shape[1]):
+            np.minimum(lowest, cells[:, i], out=lowest)
+        cell_order = np.argsort(lowest)
+        cells, cell_index = cells[cell_order], cell_index[cell_order]
+
+    return vertices[node_index], cells, node_index, cell_index
+
+
+BOUNDARY_WEIGHT = 1000.
+_QUADRIC_TERMS = ((0, 0), (0, 1), (0, 2), (0, 3), (1, 1), (1, 2), (1, 3),
+                  (2, 2), (2, 3), (3, 3))
+
+
+def _plane_quadrics(normals, offsets, weights):
+    """Weighted quadrics of planes n.x + d = 0
+
+    A quadric is stored as the ten terms of the upper triangle of its
+    symmetric 4x4 matrix, as rows of a (10, n) array.
+    """
+    planes = [normals[:, 0], normals[:, 1], normals[:, 2], offsets]
+    return np.array([planes[i] * planes[j] * weights
+                     for i, j in _QUADRIC_TERMS])
+
+
+def _quadric_error(quadrics, points):
+    """Value of each quadric at the matching point"""
+    x = np.ascontiguousarray(points.T)
+    error = quadrics[9].copy()
+    term = np.empty(len(points))
+    for k, (i, j) in enumerate(_QUADRIC_TERMS[:9]):
+        np.multiply(quadrics[k], x[i], out=term)
+        if j != 3:
+            term *= x[j]
+        if i != j:
+            term *= 2
+        error += term
+    return error
+
+
+def _face_normals(vertices, triangles):
+    """Unit normals and areas of triangles; degenerate ones get zeros"""
+    a = vertices[triangles[:, 0]]
+    normals = np.cross(vertices[triangles[:, 1]] - a,
+                       vertices[triangles[:, 2]] - a)
+    length = np.sqrt((normals**2).sum(axis=1))
+    normals /= np.where(length > 0, length, 1)[:, None]
+    return normals, length / 2
+
+
+def _edges(triangles, n_vertices):
+    """Unique edges of triangles as (lo, hi, boundary, face) arrays
+
+    Each edge is given once with lo < hi. Boundary edges belong to a
+    single triangle; for those, face is that triangle and (lo, hi)
+    follows its winding.
+    """
+    pairs = triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    lo = pairs.min(axis=1)
+    hi = pairs.max(axis=1)
+    _, first, counts = np.unique(
+        lo.astype(np.int64) * n_vertices + hi, return_index=True,
+        return_counts=True
+    )
+    boundary = counts == 1
+    lo, hi = lo[first], hi[first]
+    lo[boundary] = pairs[first[boundary], 0]
+    hi[boundary] = pairs[first[boundary], 1]
+    return lo, hi, boundary, first // 3
+
+
+def _vertex_quadrics(vertices, triangles, edges):
+    """Sum of the quadrics of the faces (and boundary edges) at each
+    vertex"""
+    n_vertices = len(vertices)
+    normals, areas = _face_normals(vertices, triangles)
+    offsets = -(normals * vertices[triangles[:, 0]]).sum(axis=1)
+    face_quadrics = _plane_quadrics(normals, offsets, areas)
+    corners = triangles.reshape(-1)
+    quadrics = np.array([np.bincount(corners, np.repeat(terms, 3),
+                                     n_vertices)
+                         for terms in face_quadrics])
+
+    # Boundary edges get a steep plane perpendicular to their face, so
+    # collapses keep the outline in place
+    lo, hi, boundary, faces = edges
+    lo, hi, faces = lo[boundary], hi[boundary], faces[boundary]
+    start = vertices[lo]
+    direction = vertices[hi] - start
+    edge_normals = np.cross(direction, normals[faces])
+    length = np.sqrt((edge_normals**2).sum(axis=1))
+    edge_normals /= np.where(length > 0, length, 1)[:, None]
+    edge_quadrics = _plane_quadrics(
+        edge_normals, -(edge_normals * start).sum(axis=1),
+        BOUNDARY_WEIGHT * (direction**2).sum(axis=1)
+    )
+    ends = np.concatenate([lo, hi])
+    for k, terms in enumerate(edge_quadrics):
+        quadrics[k] += np.bincount(ends, np.tile(terms, 2), n_vertices)
+    return quadrics
+
+
+def _match(lo, hi, priority, n_vertices, rounds=4):
+    """Indices of a set of edges, no two sharing a vertex, favouring
+    low priority
+
+    In each round every free vertex picks its lowest priority edge to
+    another free vertex, and edges picked by both ends are matched.
+    """
+    free = np.ones(n_vertices, bool)
+    candidates = np.arange(len(lo))
+    matched = []
+    for _ in range(rounds):
+        candidates = candidates[free[lo[candidates]] & free[hi[candidates]]]
+        if len(candidates) == 0:
+            break
+        best = np.full(n_vertices, len(lo))
+        np.minimum.at(best, lo[candidates], priority[candidates])
+        np.minimum.at(best, hi[candidates], priority[candidates])
+        picked = candidates[
+            (best[lo[candidates]] == priority[candidates]) &
+            (best[hi[candidates]] == priority[candidates])
+        ]
+        free[lo[picked]] = False
+        free[hi[picked]] = False
+        matched.append(picked)
+    return np.concatenate(matched) if matched else candidates
+
+
+def _collapse_pass(vertices, triangles, n_collapses):
+    """Choose up to n_collapses independent, cheap edge collapses
+
+    The collapses form a matching (see _match) among the cheapest
+    edges by quadric error, so no two share a vertex. Collapses that
+    would turn a triangle over are skipped. Returns (keep, remove,
+    positions) arrays for the collapses to apply.
+    """
+    edges = _edges(triangles, len(vertices))
+    quadrics = _vertex_quadrics(vertices, triangles, edges)
+    lo, hi = edges[0], edges[1]
+    edge_quadrics = quadrics[:, lo] + quadrics[:, hi]
+    candidates = [vertices[lo], vertices[hi],
+                  (vertices[lo] + vertices[hi]) / 2]
+    errors = np.array([_quadric_error(edge_quadrics, points)
+                       for points in candidates])
+    choice = errors.argmin(axis=0)
+    cost = np.choose(choice, errors)
+
+    # Only the cheapest edges are eligible. Among them, matching uses a
+    # random priority: ranking by cost alone matches few edges, because
+    # cost varies smoothly across the surface
+    n_eligible = min(len(lo), max(n_collapses, len(lo) // 4))
+    eligible = np.argpartition(cost, n_eligible - 1)[:n_eligible]
+    priority = np.random.RandomState(len(lo)).permutation(n_eligible)
+    chosen = eligible[_match(lo[eligible], hi[eligible], priority,
+                             len(vertices))]
+    if len(chosen) > n_collapses:
+        chosen = chosen[np.argpartition(cost[chosen], n_collapses - 1)
+                        [:n_collapses]]
+    keep, remove = lo[chosen], hi[chosen]
+    positions = np.choose(choice[chosen][:, None],
+                          [points[chosen] for points in candidates])
+
+    # Reject collapses that turn any remaining triangle over
+    remap = np.arange(len(vertices))
+    remap[remove] = keep
+    moved = np.zeros(len(vertices), bool)
+    moved[keep] = True
+    moved[remove] = True
+    old = triangles[moved[triangles].any(axis=1)]
+    new = remap[old]
+    live = ((new[:, 0] != new[:, 1]) & (new[:, 1] != new[:, 2]) &
+            (new[:, 0] != new[:, 2]))
+    old, new = old[live], new[live]
+    moved_vertices = vertices.copy()
+    moved_vertices[keep] = positions
+    old_normals, _ = _face_normals(vertices, old)
+    new_normals, _ = _face_normals(moved_vertices, new)
+    flipped = (old_normals * new_normals).sum(axis=1) <= 0
+    rejected = np.zeros(len(vertices), bool)
+    rejected[new[flipped]] = True
+    valid = ~rejected[keep]
+    return keep[valid], remove[valid], positions[valid]
+
+
+def decimate_triangles(vertices, triangles, target):
+    """Reduce a triangle mesh to about `target` triangles
+
+    Edges are collapsed in order of quadric error (Garland and
+    Heckbert): the summed squared distance of the merged vertex from
+    the planes of the faces around it. Boundary edges carry an extra
+    steep quadric so outlines are kept. Each pass collapses a matching
+    of cheap edges at once, so the work is vectorized; the result is
+    close to, not exactly, sequential quadric decimation.
+
+    Returns (vertices, triangles, node_index, cell_index) as
+    optimize_cells does. A merged vertex keeps the index of one of its
+    original vertices.
+    """
+    vertices = np.array(vertices, dtype=np.float64)
+    triangles = np.asarray(triangles)
+    cell_index = np.arange(len(triangles))
+    while len(triangles) > target:
+        # Interior collapses remove two triangles each
+        n_collapses = max(1, (len(triangles) - target) // 2)
+        keep, remove, positions = _collapse_pass(vertices, triangles,
+                                                 n_collapses)
+        if len(keep) == 0:
+            break
+        remap = np.arange(len(vertices))
+        remap[remove] = keep
+        vertices[keep] = positions
+        triangles = remap[triangles]
+        live = ((triangles[:, 0] != triangles[:, 1]) &
+                (triangles[:, 1] != triangles[:, 2]) &
+                (triangles[:, 0] != triangles[:, 2]))
+        triangles, cell_index = triangles[live], cell_index[live]
+
+    node_index, triangles = compact(triangles, len(vertices))
+    return vertices[node_index], triangles, node_index, cell_index
+
+
+def _point_segment_distances(points, starts, ends):
+    """Distance from each point to the segment from start to end"""
+    direction = ends - starts
+    length2 = (direction**2).sum(axis=1)
+    along = ((points - starts) * direction).sum(axis=1)
+    along = np.clip(along / np.where(length2 > 0, length2, 1), 0, 1)
+    nearest = starts + along[:, None] * direction
+    return np.sqrt(((points - nearest)**2).sum(axis=1))
+
+
+def simplify_polylines(vertices, segments, target=None, tolerance=None):
+    """Reduce line segments with the Douglas-Peucker algorithm
+
+    Segments are grouped into polylines: runs of consecutive segments
+    where each ends at the vertex the next starts from, and that vertex
+    has no other segments. Ends of polylines are always kept. Every
+    interior vertex is ranked by the Douglas-Peucker distance at which it
+    would be kept; all polylines are processed together, one level of
+    the recursion at a time.
+
+    Vertices within `tolerance` of the simplified line are removed, or,
+    with `target`, the highest ranked vertices are kept so about
+    `target` segments remain. Returns (vertices, segments, node_index,
+    cell_index) as optimize_cells does; each new segment takes the
+    index of the first original segment it replaces.
+    """
+    if (target is None) == (tolerance is None):
+        raise ValueError('Specify exactly one of target or tolerance')
+    vertices = np.asarray(vertices, dtype=np.float64)
+    segments = np.asarray(segments)
+    n_segments = len(segments)
+    if n_segments == 0:
+        return (np.zeros((0, 3)), segments, np.zeros(0, np.intp),
+                np.zeros(0, np.intp))
+    degree = np.bincount(segments.reshape(-1), minlength=len(vertices))
+    joined = ((segments[:-1, 1] == segments[1:, 0]) &
+              (degree[segments[:-1, 1]] == 2))
+    run_starts = np.flatnonzero(np.r_[True, ~joined])
+    # Polyline points: each run's first vertex, then every segment end
+    points = np.insert(segments[:, 1], run_starts, segments[run_starts, 0])
+    run = np.repeat(np.arange(len(run_starts)),
+                    np.diff(np.r_[run_starts, n_segments]) + 1)
+    first_points = run_starts + np.arange(len(run_starts))
+    last_points = np.r_[first_points[1:] - 1, len(points) - 1]
+
+    rank = np.zeros(len(points))
+    rank[first_points] = np.inf
+    rank[last_points] = np.inf
+    lo, hi = first_points, last_points
+    limit = np.full(len(lo), np.inf)
+    coords = vertices[points]
+    while len(lo) > 0:
+        open_ = hi - lo > 1
+        lo, hi, limit = lo[open_], hi[open_], limit[open_]
+        if len(lo) == 0:
+            break
+        counts = hi - lo - 1
+        offsets = np.r_[0, np.cumsum(counts)[:-1]]
+        interval = np.repeat(np.arange(len(lo)), counts)
+        inner = np.arange(counts.sum()) - offsets[interval] + \
+            lo[interval] + 1
+        distance = _point_segment_distances(
+            coords[inner], coords[lo[interval]], coords[hi[interval]]
+        )
+        farthest = np.maximum.reduceat(distance, offsets)
+        is_max = distance == farthest[interval]
+        _, pick = np.unique(interval[is_max], return_index=True)
+        split = inner[is_max][pick]
+        limit = np.minimum(farthest, limit)
+        rank[split] = limit
+        lo, hi = np.r_[lo, split], np.r_[split, hi]
+        limit = np.r_[limit, limit]
+
+    if tolerance is not None:
+        kept = rank > tolerance
+    else:
+        n_keep = min(len(points), max(0, target) + len(run_starts))
+        kept = np.zeros(len(points), bool)
+        kept[np.argsort(-rank, kind='stable')[:n_keep]] = True
+        kept[first_points] = True
+        kept[last_points] = True
+    kept = np.flatnonzero(kept)
+    same_run = run[kept[:-1]] == run[kept[1:]]
+    new_segments = np.column_stack([points[kept[:-1]][same_run],
+                                    points[kept[1:]][same_run]])
+    cell_index = kept[:-1][same_run] - run[kept[:-1]][same_run]
+
+    node_index, new_segments = compact(new_segments, len(vertices))
+    return vertices[node_index], new_segments, node_index, cell_index
+
+
+def kd_partition(points, fits):
+    """Split points into spatially compact groups
+
+    Starting from all points, a group for which `fits(indices)` is False
+    is split at the median along the longest side of its bounding box,
+    as in a k-d tree, until every group fits or holds a single point.
+    Returns a list of index arrays in tree order.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    groups = []
+    stack = [np.arange(len(points))]
+    while stack:
+        index = stack.pop()
+        if len(index) < 2 or fits(index):
+            groups.append(index)
+            continue
+        coords = points[index]
+        axis = np.argmax(coords.max(axis=0) - coords.min(axis=0))
+        half = len(index) // 2
+        order = np.argpartition(coords[:, axis], half)
+        stack += [index[order[half:]], index[order[:half]]]
+    return groups
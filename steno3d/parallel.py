@@ -0,0 +1,66 @@
+"""parallel.py contains the worker pool helpers used to run independent
+steno3d network tasks concurrently
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+from sys import exc_info
+from traceback import format_exception
+
+
+def _capture(func):
+    """Wrap func so exceptions are returned rather than raised"""
+    def func_wrapper(item):
+        try:
+            return func(item), None
+        except Exception:
+            return None, ''.join(format_exception(*exc_info()))
+    return func_wrapper
+
+
+def parallel_map(func, items, workers=None, callback=None):
+    """function parallel_map
+
+    Inputs:
+        func     - Function applied to each item
+        items    - Sequence of items
+        workers  - Number of threads. If None or less than 2, items are
+                   processed in order on the calling thread.
+        callback - Optional function called on the calling thread as
+                   callback(item, result) each time an item succeeds
+
+    Output:
+        tuple (results, errors) where results is a list in the same
+        order as items (None for failed items) and errors is a list of
+        (item, formatted traceback) for every item that raised.
+    """
+    items = list(items)
+    wrapped = _capture(func)
+
+    def indexed(index):
+        return index, wrapped(items[index])
+
+    if workers is None or workers < 2 or len(items) < 2:
+        completed = (indexed(i) for i in range(len(items)))
+        pool = None
+    else:
+        pool = ThreadPool(min(workers, len(items)))
+        completed = pool.imap_unordered(indexed, range(len(items)))
+    outputs = [None]*len(items)
+    try:
+        for index, output in completed:
+            outputs[index] = output
+            if callback is not None and output[1] is None:
+                callback(items[index], output[0])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    results = [out[0] for out in outputs]
+    errors = [(item, out[1]) for item, out in zip(items, outputs)
+              if out[1] is not None]
+    return results, errors
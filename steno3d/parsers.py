@@ -8,19 +8,40 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from io import BytesIO as _BytesIO
+from multiprocessing import Pool as _Pool
+from os import listdir as _listdir
 from os.path import expanduser as _expanduser
+from os.path import isdir as _isdir
 from os.path import isfile as _isfile
+from os.path import join as _join
 from os.path import realpath as _realpath
+from sys import exc_info as _exc_info
+from traceback import format_exception_only as _format_exception_only
 
 from future.utils import with_metaclass as _with_metaclass
+from numpy import asarray as _asarray
+from numpy import ndarray as _ndarray
 from six import string_types as _string_types
 
+from .lazy import LazyArray as _LazyArray
 from .project import Project as _Project
 from .traits import HasSteno3DTraits as _HasSteno3DTraits
 from .traits import String as _String
 from .traits import KeywordInstance as _KWInst
 
 
+def _function(method):
+    """The function behind a method, on Python 2 or 3"""
+    return getattr(method, '__func__', method)
+
+
+# Modules of the parsers that ship with steno3d, and those parsers by
+# name. Parsers from other packages take precedence over them.
+_BUILTIN_MODULES = ('steno3d.meshfiles', 'steno3d.geofiles')
+_BUILTIN_PARSERS = dict()
+
+
 class _ParserMetaClass(_HasSteno3DTraits.__class__):
     """metaclass ParserMetaclass
 
@@ -46,12 +67,22 @@ class _ParserMetaClass(_HasSteno3DTraits.__class__):
                 "any additional keyword input. Please perform other " \
                 "initialization tasks for the {name} parser in " \
                 "_initialize()".format(name=name)
-            assert 'parse' in attrs and callable(attrs['parse']), \
-                "Parser class {name} must contain a parse() method"
+            assert any(callable(attrs.get(method))
+                       for method in ('parse', 'iter_parse')), \
+                "Parser class {name} must contain a parse() or " \
+                "iter_parse() method".format(name=name)
         new_class = super(_ParserMetaClass, mcs).__new__(
             mcs, name, bases, attrs
         )
+        if attrs.get('__module__') in _BUILTIN_MODULES:
+            _BUILTIN_PARSERS[name] = new_class
+            # A parser package of the same name takes precedence
+            if name in globals():
+                return new_class
         globals()[name] = new_class
+        # Extensions are mapped again to include the new parser
+        if 'AllParsers' in globals():
+            AllParsers.extensions = None
         return new_class
 
 
@@ -125,6 +156,22 @@ class BaseParser(_with_metaclass(_ParserMetaClass,
         additional startup tasks
         """
 
+    @classmethod
+    def companions(cls, file_name):
+        """function companions
+
+        Input:
+            file_name - A file this parser reads
+
+        Output:
+            list of other files this parser reads along with file_name
+
+        When a directory is expanded for AllParsers.parse_many, the
+        companions of its files are not parsed on their own. By default
+        there are none.
+        """
+        return []
+
     def parse(self, project=None, **kwargs):
         """function parse
 
@@ -137,8 +184,55 @@ class BaseParser(_with_metaclass(_ParserMetaClass,
 
         Output:
             tuple of Steno3D project(s) parsed from file_name
+
+        Parsers that implement iter_parse() instead get this for free.
+        """
+        if _function(type(self).iter_parse) is \
+                _function(BaseParser.iter_parse):
+            raise NotImplementedError()
+        if project is None:
+            project = _Project(
+                description='Project imported from ' + self.file_name
+            )
+        for _ in self.iter_parse(project, **kwargs):
+            pass
+        return (project,)
+
+    def iter_parse(self, project=None, **kwargs):
+        """function iter_parse
+
+        Parses the file provided at parser instantiation into a
+        Steno3D project, yielding each resource as soon as it is
+        complete.
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+
+        Output:
+            generator of the Steno3D resources parsed from file_name,
+            each already in the project
+
+        Streaming parsers implement this instead of parse(). They read
+        the file a block at a time, collecting arrays with
+        steno3d.textio.GrowableArray, and add a resource for each
+        block, so memory use is bounded by the block size rather than
+        the file size. Each resource may be uploaded while the rest of
+        the file is parsed:
+
+            for resource in parser.iter_parse(project):
+                project.upload()
+
+        For parsers that only implement parse(), the resources it adds
+        are yielded once it finishes.
         """
-        raise NotImplementedError()
+        known = set(id(res) for res in project.resources) \
+            if project is not None else set()
+        for proj in self.parse(project, **kwargs):
+            for res in proj.resources:
+                if id(res) not in known:
+                    known.add(id(res))
+                    yield res
 
 
 class _AllParserMetaClass(_HasSteno3DTraits.__class__):
@@ -180,51 +274,228 @@ class AllParsers(_with_metaclass(_AllParserMetaClass,
     """
 
     def __new__(cls, file_name, **kwargs):
+        return cls._parser_class(file_name)(file_name, **kwargs)
+
+    @classmethod
+    def _extension_map(cls):
+        """Map of extensions to parser classes (or, for extensions with
+        several parsers, a string of their names)
+
+        Parsers from other packages are mapped first; a built-in parser
+        is used only for extensions that none of them supports.
+        """
         if getattr(cls, 'extensions', None) is None:
-            cls.extensions = dict()
-            parser_keys = [
-                k for k in globals()
+            extensions = dict()
+            parsers = [
+                globals()[k] for k in globals()
                 if (k != 'BaseParser' and
                     issubclass(type(globals()[k]), _ParserMetaClass))
             ]
-            if len(parser_keys) == 0:
+            if len(parsers) == 0:
                 raise ParseError(
                     '\nNo parsers imported! For more information on how to '
                     'use parsers, please see\n'
                     'https://python.steno3d.com/en/latest/content/parsers.html'
                 )
-            for k in parser_keys:
-                for ext in globals()[k].extensions:
-                    if ext not in cls.extensions:
-                        cls.extensions[ext] = globals()[k]
-                    elif issubclass(type(cls.extensions[ext]),
-                                    _ParserMetaClass):
-                        cls.extensions[ext] = (cls.extensions[ext].__name__ +
-                                               ', ' + globals()[k].__name__)
-                    else:
-                        cls.extensions[ext] = (cls.extensions[ext] +
-                                               ', ' + globals()[k].__name__)
+            builtins = set(_BUILTIN_PARSERS.values())
+            for group in ([p for p in parsers if p not in builtins],
+                          [p for p in _BUILTIN_PARSERS.values()]):
+                claimed = set(extensions)
+                for parser in group:
+                    for ext in parser.extensions:
+                        if ext in claimed:
+                            continue
+                        if ext not in extensions:
+                            extensions[ext] = parser
+                        elif issubclass(type(extensions[ext]),
+                                        _ParserMetaClass):
+                            extensions[ext] = (extensions[ext].__name__ +
+                                               ', ' + parser.__name__)
+                        else:
+                            extensions[ext] = (extensions[ext] + ', ' +
+                                               parser.__name__)
+            cls.extensions = extensions
+        return cls.extensions
+
+    @classmethod
+    def _parser_class(cls, file_name):
+        """The parser class for file_name, chosen by extension"""
+        extensions = cls._extension_map()
         fnsplit = file_name.split('.')
-        for ext in cls.extensions:
+        for ext in extensions:
             if len(fnsplit) > 1 and fnsplit[-1] == ext:
-                if issubclass(type(cls.extensions[ext]), _ParserMetaClass):
-                    return cls.extensions[ext](file_name, **kwargs)
+                if issubclass(type(extensions[ext]), _ParserMetaClass):
+                    return extensions[ext]
 
                 raise ParseError(
                     '{ext}: file type supported by more than one parser. '
                     'Please specify one of ({parsers})'.format(
                         ext=ext,
-                        parsers=cls.extensions[ext]
+                        parsers=extensions[ext]
                     )
                 )
 
         raise ParseError(
             '{bad}: unsupported file extensions. Must be in ({ok})'.format(
                 bad=fnsplit[-1] if len(fnsplit) > 1 else file_name,
-                ok=', '.join(list(cls.extensions))
+                ok=', '.join(list(extensions))
             )
         )
 
+    @classmethod
+    def parse_many(cls, paths, project=None, workers=None, **kwargs):
+        """function parse_many
+
+        Parses many files into a single Steno3D project, choosing the
+        parser for each file by extension.
+
+        Input:
+            paths - File names; a directory stands for all the files in
+                    it with a supported extension, except those another
+                    file's parser reads with it (see
+                    BaseParser.companions)
+
+        Optional input:
+            project - Preexisting project to add resources to. If not
+                      provided, a new project will be created.
+            workers - Number of processes. If None or less than 2, files
+                      are parsed in order in this process.
+            Any other keyword arguments are passed to each parse()
+
+        Output:
+            tuple (project, errors) where errors is a list of
+            (file_name, message) for every file that failed. Failed
+            files add nothing to the project and do not stop the others.
+
+        Files are parsed in worker processes, which send back their
+        resources as plain arrays and values; the resources are then
+        rebuilt here, in the order of paths.
+        """
+        if project is None:
+            project = _Project(
+                description='Project imported from parsed files'
+            )
+        jobs, errors = [], []
+        for file_name in cls._expand_paths(paths):
+            try:
+                jobs.append((cls._parser_class(file_name), file_name,
+                             kwargs))
+            except ParseError as err:
+                errors.append((file_name, str(err)))
+        if workers is None or workers < 2 or len(jobs) < 2:
+            results = (_parse_payloads(job) for job in jobs)
+            pool = None
+        else:
+            pool = _Pool(min(workers, len(jobs)))
+            results = pool.imap(_parse_payloads, jobs)
+        try:
+            for job, (payloads, error) in zip(jobs, results):
+                if error is None:
+                    # Resources are built in a scratch project and only
+                    # moved over once every one of the file has built
+                    scratch = _Project()
+                    try:
+                        built = [_build_payload(payload, scratch)
+                                 for payload in payloads]
+                    except Exception:
+                        error = _error_message()
+                    else:
+                        for resource in built:
+                            resource.project = [project]
+                        continue
+                errors.append((job[1], error))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return project, errors
+
+    @classmethod
+    def _expand_paths(cls, paths):
+        if isinstance(paths, _string_types):
+            paths = [paths]
+        extensions = cls._extension_map()
+        for path in paths:
+            path = _expanduser(path)
+            if not _isdir(path):
+                yield path
+                continue
+            found = [_join(path, name) for name in sorted(_listdir(path))
+                     if (name.split('.')[-1] in extensions and
+                         _isfile(_join(path, name)))]
+            skip = set()
+            for file_name in found:
+                parser = extensions[file_name.split('.')[-1]]
+                if isinstance(parser, _ParserMetaClass):
+                    skip.update(parser.companions(file_name))
+            for file_name in found:
+                if file_name not in skip:
+                    yield file_name
+
+
+class _Payload(object):
+    """Picklable stand-in for a Steno3D object: its class and the plain
+    values of its traits"""
+
+    def __init__(self, cls, values):
+        self.cls = cls
+        self.values = values
+
+
+class _FileBytes(object):
+    """Picklable contents of a file-like trait value, e.g. an image"""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def _payload(value):
+    if isinstance(value, _HasSteno3DTraits):
+        return _Payload(value.__class__, {
+            name: _payload(getattr(value, name))
+            for name in value._non_deprecated_traits()
+            if name in value._trait_values and
+            name not in value._backref_traits
+        })
+    if isinstance(value, list):
+        return [_payload(item) for item in value]
+    if isinstance(value, (_ndarray, _LazyArray)):
+        return _asarray(value)
+    if hasattr(value, 'read') and hasattr(value, 'seek'):
+        value.seek(0)
+        return _FileBytes(value.read())
+    return value
+
+
+def _build_payload(value, project=None):
+    if isinstance(value, _Payload):
+        kwargs = {name: _build_payload(item)
+                  for name, item in value.values.items()}
+        if project is not None:
+            kwargs['project'] = project
+        return value.cls(**kwargs)
+    if isinstance(value, list):
+        return [_build_payload(item) for item in value]
+    if isinstance(value, _FileBytes):
+        return _BytesIO(value.data)
+    return value
+
+
+def _error_message():
+    return ''.join(_format_exception_only(*_exc_info()[:2])).strip()
+
+
+def _parse_payloads(job):
+    """Parse one file; returns (resource payloads, None) or (None,
+    error message)"""
+    parser_class, file_name, kwargs = job
+    try:
+        projects = parser_class(file_name).parse(**kwargs)
+        return [_payload(resource) for proj in projects
+                for resource in proj.resources], None
+    except Exception:
+        return None, _error_message()
+
 
 class ParseError(IOError):
     """class ParseError
@@ -232,6 +503,11 @@ class ParseError(IOError):
     Custom exception to raise for errors during file parsing
     """
 
+
+# Built-in parsers register themselves on import
+from . import meshfiles as _meshfiles  # noqa: E402,F401
+from . import geofiles as _geofiles  # noqa: E402,F401
+
 try:
     del absolute_import, division, print_function, unicode_literals
 except NameError:
@@ -7,16 +7,21 @@ from __future__ import unicode_literals
 
 from six import string_types
 
-from numpy import ndarray
+from numpy import asarray, ndarray
 from traitlets import observe, validate
 
 from .base import BaseMesh
 from .base import CompositeResource
+from .cache import cache_key
 from .data import DataArray
+from .lazy import LazyArray
 from .options import ColorOptions
 from .options import Options
+from .spatial import (GridIndex, aggregate, check_aggregate, poisson_thin,
+                      voxel_downsample)
 from .texture import Texture2DImage
 from .traits import Array, HasSteno3DTraits, KeywordInstance, Repeated, String
+from .traits import serialized_nbytes
 
 
 class _Mesh0DOptions(Options):
@@ -49,11 +54,56 @@ class Mesh0D(BaseMesh):
         if arr is None or (isinstance(arr, string_types) and
                            arr == 'vertices'):
             arr = self.vertices
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('Mesh0D cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
+    def grid_index(self, cell_size=None):
+        """Spatial index of the vertices (see steno3d.spatial.GridIndex)
+
+        The index is kept until the vertices are replaced.
+        """
+        cached = getattr(self, '_grid_index', None)
+        if (cached is None or cached[0] is not self.vertices or
+                cell_size not in (None, cached[1].cell_size)):
+            cached = (self.vertices,
+                      GridIndex(asarray(self.vertices), cell_size))
+            self._grid_index = cached
+        return cached[1]
+
+    def query_box(self, lo, hi):
+        """Indices of the vertices inside the axis-aligned box lo-hi"""
+        return self.grid_index().query_box(lo, hi)
+
+    def query_radius(self, center, radius):
+        """Indices of the vertices within radius of center"""
+        return self.grid_index().query_radius(center, radius)
+
+    def downsample(self, voxel_size):
+        """Replace the vertices in each cubic voxel of side voxel_size by
+        their centroid
+
+        Returns the index of the new vertex for each original vertex.
+        Use Point.downsample to combine the data as well.
+        """
+        self.vertices, groups = voxel_downsample(asarray(self.vertices),
+                                                 voxel_size)
+        return groups
+
+    def thin(self, radius, seed=None):
+        """Keep a random subset of vertices no two of which are within
+        radius, with every removed vertex within radius of a kept one
+
+        Returns (index, groups): the indices of the kept vertices and,
+        for each original vertex, the new vertex that replaced it (see
+        steno3d.spatial.poisson_thin). Use Point.thin to carry the data
+        along.
+        """
+        index, groups = poisson_thin(asarray(self.vertices), radius, seed)
+        self.vertices = asarray(self.vertices)[index]
+        return index, groups
+
     @observe('vertices')
     def _reject_large_files(self, change):
         try:
@@ -84,7 +134,10 @@ class Mesh0D(BaseMesh):
             vertices=Array.download(
                 url=json['vertices'],
                 shape=(json['verticesSize']//12, 3),
-                dtype=json['verticesType']
+                dtype=json['verticesType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'vertices'),
+                encoding=json.get('verticesEncoding')
             ),
             opts=json['meta']
         )
@@ -128,6 +181,45 @@ class Point(CompositeResource):
         allow_none=True
     )
 
+    def _can_partition(self):
+        return True
+
+    def _combine_data(self, groups, how):
+        n_groups = self.mesh.nN
+        for binder in self.data:
+            binder.data.array = aggregate(asarray(binder.data.array),
+                                          groups, n_groups, how)
+
+    def downsample(self, voxel_size, how='mean'):
+        """Downsample the Mesh0D to one point per voxel (see
+        Mesh0D.downsample) and combine the data of the points in each
+        voxel
+
+        `how` is 'mean', 'max', 'min' or 'first'. Returns the index of
+        the new point for each original point.
+        """
+        check_aggregate(how)
+        groups = self.mesh.downsample(voxel_size)
+        self._combine_data(groups, how)
+        return groups
+
+    def thin(self, radius, how=None, seed=None):
+        """Thin the Mesh0D so no two points are within radius (see
+        Mesh0D.thin)
+
+        With `how` None, kept points keep their own data; otherwise it
+        is 'mean', 'max', 'min' or 'first' over each kept point and the
+        points it replaced. Returns (index, groups) as Mesh0D.thin does.
+        """
+        if how is not None:
+            check_aggregate(how)
+        index, groups = self.mesh.thin(radius, seed)
+        if how is None:
+            self._remap_data(index)
+        else:
+            self._combine_data(groups, how)
+        return index, groups
+
     def _nbytes(self):
         return (self.mesh._nbytes() +
                 sum(d.data._nbytes() for d in self.data) +
@@ -7,11 +7,13 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from os import path
 
 from traitlets import observe, Undefined, validate
 
-from .base import CompositeResource, UserContent
+from .base import CompositeResource, UserContent, split_long_uid
 from .client import Comms, needs_login, plot
+from .parallel import parallel_map
 from .traits import _REGISTRY, Bool, KeywordInstance, Repeated
 
 
@@ -54,8 +56,23 @@ class Project(UserContent):
         return url
 
     @needs_login
-    def upload(self, sync=False, verbose=True, print_url=True):
-        """Upload the project"""
+    def upload(self, sync=False, verbose=True, print_url=True, workers=None):
+        """Upload the project
+
+        If `workers` is greater than 1, independent resources are uploaded
+        concurrently on that many threads: first all meshes, data and
+        textures, then the composite resources, then the project itself.
+
+        If `sync` is True, later changes are uploaded as they are made. If
+        `sync` is a number of seconds, changes are instead collected for
+        that long and uploaded together on a background thread, one
+        request per changed resource. See also `batch()` and `flush()`.
+
+        If auto_partition is on (see `steno3d.client.Comms.configure`),
+        oversized resources are first split with `partition_resources`.
+        """
+        if Comms.auto_partition:
+            self.partition_resources()
         if getattr(self, '_upload_data', None) is None:
             assert self.validate()
 
@@ -68,12 +85,71 @@ class Project(UserContent):
                   'projects that are already uploaded. To make '
                   'these changes, please use the dashboard on '
                   'steno3d.com.')
-        self._upload(sync, verbose)
+        if workers is None or workers < 2:
+            self._upload(sync, verbose)
+        else:
+            self._upload_concurrent(sync, verbose, workers)
         self._trigger_ACL_fix()
         if print_url:
             print(self._url)
         return self._url
 
+    def _upload_concurrent(self, sync, verbose, workers):
+        """Upload the project tree stage by stage on a thread pool"""
+        if getattr(self, '_uploading', False):
+            return
+        assert self.validate()
+        resources = self._dirty_instances('resources')
+        leaves = []
+        for res in resources:
+            for leaf in res._dirty_leaves():
+                if not any(leaf is added for added in leaves):
+                    leaves += [leaf]
+        self._upload_stage(leaves, sync, verbose, workers, '        ')
+        self._upload_stage(resources, sync, verbose, workers, '    ')
+        self._upload(sync, verbose, recurse=False)
+
+    @staticmethod
+    def _upload_stage(contents, sync, verbose, workers, tab_level):
+        """Upload independent contents, raising once if any fail"""
+        def upload_one(content):
+            content._upload(sync, verbose, tab_level, recurse=False)
+
+        _, errors = parallel_map(upload_one, contents, workers)
+        if len(errors) > 0:
+            raise Exception(
+                'Upload failed for {num} of {tot} resource(s):\n'.format(
+                    num=len(errors),
+                    tot=len(contents)
+                ) + '\n'.join(
+                    '{cls}: {title}\n{err}'.format(
+                        cls=content._resource_class,
+                        title=content.title,
+                        err=err
+                    ) for content, err in errors
+                )
+            )
+
+    def partition_resources(self, file_size_limit=None):
+        """Replace every Surface, Point or Line with a mesh or data file
+        over file_size_limit (by default, that of the logged in user) by
+        pieces within it
+
+        See CompositeResource.partition. Returns the new resources list.
+        """
+        if file_size_limit is None:
+            file_size_limit = Comms.user.file_size_limit
+        resources = []
+        for res in self.resources:
+            if (res._can_partition() and
+                    max(res._file_sizes()) > file_size_limit):
+                resources += res.partition(file_size_limit)
+            else:
+                resources += [res]
+        if len(resources) != len(self.resources):
+            self.resources = resources
+        return self.resources
+
     def _trigger_ACL_fix(self):
         self._put({})
 
@@ -132,9 +208,8 @@ class Project(UserContent):
             self.resources = post_post
 
     def _upload_dirty(self, sync=False, verbose=True, tab_level=''):
-        dirty = self._dirty
-        if 'resources' in dirty:
-            [r._upload(sync, verbose, tab_level) for r in self.resources]
+        [r._upload(sync, verbose, tab_level)
+         for r in self._dirty_instances('resources')]
 
     def _get_dirty_data(self, force=False, initialize=False):
         datadict = super(Project, self)._get_dirty_data(force)
@@ -195,7 +270,16 @@ class Project(UserContent):
         return plot(self._url)
 
     @classmethod
-    def _build(cls, uid, copy=True, tab_level=''):
+    def _build(cls, uid, copy=True, tab_level='', memmap_dir=None,
+               workers=None, progress=None):
+        if memmap_dir is not None:
+            memmap_dir = path.realpath(path.expanduser(memmap_dir))
+            if not path.isdir(memmap_dir):
+                raise ValueError(
+                    '{}: memmap_dir must be an existing directory'.format(
+                        memmap_dir
+                    )
+                )
         print('Downloading project', end=': ')
         json = cls._json_from_uid(uid)
         title = '' if json['title'] is None else json['title']
@@ -232,15 +316,34 @@ class Project(UserContent):
             description=desc,
             resources=[]
         )
-        for longuid in json['resourceUids']:
-            res_string = longuid.split('Resource')[-1].split(':')[0]
-            res_class = _REGISTRY[res_string]
-            proj.resources += [res_class._build(
-                src=longuid.split(':')[1],
-                copy=copy,
-                tab_level=tab_level + '    ',
-                project=proj
-            )]
+        if workers is None and progress is None:
+            # Resources that refer to the same child share it, as they
+            # do when downloaded in parallel
+            prefetched = {}
+            for longuid in json['resourceUids']:
+                res_string = longuid.split('Resource')[-1].split(':')[0]
+                res_class = _REGISTRY[res_string]
+                proj.resources += [res_class._build(
+                    src=longuid.split(':')[1],
+                    copy=copy,
+                    tab_level=tab_level + '    ',
+                    project=proj,
+                    memmap_dir=memmap_dir,
+                    prefetched=prefetched
+                )]
+        else:
+            if progress is None:
+                def progress(count, total, res):
+                    print('{tl}    {cnt}/{tot} Downloaded {cls}: '
+                          '{title}'.format(
+                              tl=tab_level,
+                              cnt=count,
+                              tot=total,
+                              cls=res._resource_class,
+                              title=res.title
+                          ))
+            cls._build_prefetched(proj, json['resourceUids'], copy,
+                                  memmap_dir, workers, progress)
         if not copy:
             proj._public_online = pub
             proj._upload_data = json
@@ -248,5 +351,69 @@ class Project(UserContent):
         print('... Complete!')
         return proj
 
+    @staticmethod
+    def _build_prefetched(proj, long_uids, copy, memmap_dir, workers,
+                          progress):
+        """Download resources on a worker pool, then assemble them
+
+        All resource json is fetched first, then every mesh, texture and
+        data resource is downloaded concurrently. Composite resources are
+        assembled from those on the calling thread, in project order.
+        progress(count, total, resource) is called as each completes.
+        """
+        def raise_errors(errors, total):
+            if len(errors) > 0:
+                raise IOError(
+                    'Download failed for {num} of {tot} resource(s):\n'.format(
+                        num=len(errors),
+                        tot=total
+                    ) + '\n'.join(
+                        '{uid}\n{err}'.format(uid=uid, err=err)
+                        for uid, err in errors
+                    )
+                )
+
+        def fetch_json(long_uid):
+            (class_string, uid) = split_long_uid(long_uid)
+            return _REGISTRY[class_string]._json_from_uid(uid)
+
+        res_jsons, errors = parallel_map(fetch_json, long_uids, workers)
+        raise_errors(errors, len(long_uids))
+
+        child_uids = []
+        for res_json in res_jsons:
+            for long_uid in CompositeResource._child_uids(res_json):
+                if long_uid not in child_uids:
+                    child_uids += [long_uid]
+        total = len(child_uids) + len(long_uids)
+        completed = [0]
+
+        def report(long_uid, res):
+            completed[0] += 1
+            progress(completed[0], total, res)
+
+        def build_child(long_uid):
+            (class_string, uid) = split_long_uid(long_uid)
+            return _REGISTRY[class_string]._build(
+                uid, copy, verbose=False, memmap_dir=memmap_dir
+            )
+
+        children, errors = parallel_map(build_child, child_uids, workers,
+                                        callback=report)
+        raise_errors(errors, len(child_uids))
+        prefetched = dict(zip(child_uids, children))
+
+        for long_uid, res_json in zip(long_uids, res_jsons):
+            res_class = _REGISTRY[split_long_uid(long_uid)[0]]
+            res = res_class._build(
+                src=res_json,
+                copy=copy,
+                verbose=False,
+                project=proj,
+                prefetched=prefetched
+            )
+            proj.resources += [res]
+            report(long_uid, res)
+
 
 __all__ = ['Project']
@@ -20,7 +20,7 @@ def _query(url, queue=10):
         resp = Comms.get('{url}?brief=True&num={n}&cursor={c}'.format(
             url=url, n=queue, c=cursor
         ))
-        rjson = resp.json()
+        rjson = resp['json']
         cursor = rjson['cursor']
         more = rjson['more']
         for proj in rjson['data']:
@@ -58,13 +58,25 @@ def my_projects(n=None, queue=100):
 
 
 @needs_login
-def project_by_uid(uid, copy=None):
-    return Project._build(uid, copy)
+def project_by_uid(uid, copy=None, memmap_dir=None, workers=None,
+                   progress=None):
+    """Download a project by uid
+
+    If memmap_dir is provided, downloaded arrays are saved to files in that
+    directory and memory-mapped rather than loaded into memory.
+
+    If workers is provided, resources are downloaded concurrently on that
+    many threads. progress(count, total, resource) is called as each
+    resource completes; by default a line is printed.
+    """
+    return Project._build(uid, copy, memmap_dir=memmap_dir,
+                          workers=workers, progress=progress)
 
 
 @needs_login
-def last_project(copy=None):
+def last_project(copy=None, memmap_dir=None, workers=None, progress=None):
     try:
-        return project_by_uid(next(_query(MINE, 1))['uid'], copy)
+        return project_by_uid(next(_query(MINE, 1))['uid'], copy,
+                              memmap_dir, workers, progress)
     except StopIteration:
         print('No projects available!')
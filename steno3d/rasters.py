@@ -0,0 +1,128 @@
+"""rasters.py contains helpers for turning large rasters, such as
+digital elevation models, into grid surfaces
+
+Rasters are read a band of rows at a time and reduced to block means,
+so only the downsampled grid is ever held in memory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from io import BytesIO
+
+import numpy as np
+import png
+
+
+# Bytes of raster read at a time
+BAND_SIZE = 16 * 1024 * 1024
+
+
+def block_factor(shape, max_cells=None):
+    """Smallest block size (in raster nodes) that brings a raster of
+    `shape` (rows, columns) within max_cells grid cells"""
+    if max_cells is None:
+        return 1
+    if max_cells < 1:
+        raise ValueError('max_cells must be at least 1')
+    rows, cols = shape
+    factor = max(int(np.sqrt(rows * cols / max_cells)), 1)
+    while ((-(-rows // factor) - 1) * (-(-cols // factor) - 1) >
+           max_cells):
+        factor += 1
+    return factor
+
+
+def block_means(band, factor, nodata=None):
+    """Means of the factor x factor blocks of a (rows, columns) band
+
+    Values equal to nodata, and NaNs, are left out; blocks without
+    values are NaN. Blocks on the last row and column may be smaller.
+    """
+    band = np.asarray(band, dtype=np.float64)
+    if nodata is not None:
+        band = np.where(band == nodata, np.nan, band)
+    rows, cols = band.shape
+    row_pad, col_pad = -rows % factor, -cols % factor
+    if row_pad or col_pad:
+        band = np.pad(band, ((0, row_pad), (0, col_pad)),
+                      constant_values=np.nan)
+    blocks = band.reshape(band.shape[0] // factor, factor, -1, factor)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    means = np.full(count.shape, np.nan)
+    np.divide(total, count, out=means, where=count > 0)
+    return means
+
+
+def block_centers(n_nodes, factor, spacing, start=0.):
+    """Coordinates of the centres of factor-wide blocks of nodes that
+    are `spacing` apart, starting at `start`"""
+    first = np.arange(0, n_nodes, factor)
+    last = np.minimum(first + factor, n_nodes) - 1
+    return start + spacing * (first + last) / 2
+
+
+def iter_bands(raster, factor=1):
+    """Yield bands of whole rows of a 2D array-like, such as a memmap or
+    h5py Dataset, about BAND_SIZE bytes (and a multiple of factor rows)
+    each"""
+    rows, cols = raster.shape
+    itemsize = np.dtype(raster.dtype).itemsize
+    band_rows = factor * max(BAND_SIZE // (cols * itemsize * factor), 1)
+    for start in range(0, rows, band_rows):
+        yield np.asarray(raster[start:start + band_rows])
+
+
+def reduce_raster(bands, shape, factor, nodata=None):
+    """Reduce a raster, given as an iterable of bands of whole rows, to
+    a (rows, columns) array of factor x factor block means"""
+    rows, cols = shape
+    out = []
+    pending = np.zeros((0, cols))
+    seen = 0
+    for band in bands:
+        band = np.asarray(band).reshape(-1, cols)
+        seen += len(band)
+        pending = np.concatenate([pending, band]) if len(pending) else band
+        # Whole blocks of rows, or everything once all rows are in
+        split = len(pending) if seen >= rows else \
+            len(pending) // factor * factor
+        if split:
+            out.append(block_means(pending[:split], factor, nodata))
+            pending = pending[split:]
+    if seen != rows:
+        raise ValueError('Expected {} rows but found {}'.format(rows, seen))
+    if not out:
+        return np.zeros((0, -(-cols // factor)))
+    return np.concatenate(out)
+
+
+def shaded_relief(grid, dx=1., dy=1., azimuth=315., altitude=45.):
+    """Grey shaded relief PNG of a (rows, columns) elevation grid with
+    rows from north to south; missing values are transparent"""
+    grid = np.asarray(grid, dtype=np.float64)
+    filled = np.where(np.isnan(grid), np.nanmean(grid) if
+                      np.isfinite(grid).any() else 0., grid)
+    if min(grid.shape) > 1:
+        dz_dy, dz_dx = np.gradient(filled, dy, dx)
+        dz_dy = -dz_dy
+    else:
+        dz_dx = dz_dy = np.zeros_like(filled)
+    azimuth, altitude = np.radians(azimuth), np.radians(altitude)
+    slope = np.arctan(np.hypot(dz_dx, dz_dy))
+    aspect = np.arctan2(-dz_dx, -dz_dy)
+    shade = (np.sin(altitude) * np.cos(slope) + np.cos(altitude) *
+             np.sin(slope) * np.cos(azimuth - aspect))
+    grey = np.clip(shade * 255, 0, 255).astype(np.uint8)
+    alpha = np.where(np.isnan(grid), 0, 255).astype(np.uint8)
+    pixels = np.dstack([grey, alpha]).reshape(grid.shape[0], -1)
+    output = BytesIO()
+    output.name = 'texture.png'
+    png.Writer(grid.shape[1], grid.shape[0], greyscale=True,
+               alpha=True).write(output, pixels)
+    output.seek(0)
+    return output
@@ -0,0 +1,310 @@
+"""spatial.py contains vectorized spatial tools for point clouds: a grid
+index for box and radius queries, voxel downsampling and Poisson-disk
+thinning
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+
+from .meshops import group_rows
+
+
+POINTS_PER_CELL = 8
+AGGREGATES = ('mean', 'max', 'min', 'first')
+
+
+DENSE_CELLS = 1 << 22
+
+
+def _column_min(points):
+    # Reducing column by column is much faster than along axis 0
+    return np.array([points[:, axis].min()
+                     for axis in range(points.shape[1])])
+
+
+def _column_max(points):
+    return np.array([points[:, axis].max()
+                     for axis in range(points.shape[1])])
+
+
+def _cell_coords(points, origin, cell_size):
+    # Column by column to keep temporaries small on large clouds
+    coords = np.empty(points.shape, np.int64)
+    for axis in range(points.shape[1]):
+        coords[:, axis] = np.floor((points[:, axis] - origin[axis]) /
+                                   cell_size)
+    return coords
+
+
+def _pack(coords, dims):
+    """Single int64 key per cell, or None if the grid is too large"""
+    if np.prod(dims.astype(float)) >= 2.**62:
+        return None
+    return (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+
+
+def _group_cells(coords):
+    """Group points by cell; returns (cell_of_point, n_cells)"""
+    if len(coords) == 0:
+        return np.zeros(0, np.intp), 0
+    dims = _column_max(coords) + 1
+    keys = _pack(coords, dims)
+    if keys is None:
+        first, inverse = group_rows(coords)
+        return inverse, len(first)
+    if np.prod(dims) <= max(DENSE_CELLS, 4 * len(keys)):
+        # Count into every cell of the grid rather than sorting
+        occupied = np.flatnonzero(np.bincount(keys))
+        lookup = np.zeros(occupied[-1] + 1, np.intp)
+        lookup[occupied] = np.arange(len(occupied))
+        return lookup[keys], len(occupied)
+    _, inverse = np.unique(keys, return_inverse=True)
+    return inverse.reshape(-1), inverse.max() + 1
+
+
+def _ranges(starts, counts):
+    """Concatenation of range(start, start + count) for each pair"""
+    counts = np.asarray(counts)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+def check_aggregate(how):
+    """Raise ValueError unless how is one of AGGREGATES"""
+    if how not in AGGREGATES:
+        raise ValueError('{}: how must be one of {}'.format(
+            how, ', '.join(AGGREGATES)
+        ))
+
+
+def aggregate(values, groups, n_groups, how='mean'):
+    """Combine values that share a group
+
+    `groups` gives the group of each value. `how` is 'mean', 'max',
+    'min' or 'first' (the value with the lowest index in each group).
+    Every group must have at least one value.
+    """
+    check_aggregate(how)
+    values = np.asarray(values)
+    if how == 'mean':
+        counts = np.bincount(groups, minlength=n_groups)
+        if values.ndim == 1:
+            return np.bincount(groups, values, n_groups) / counts
+        return np.column_stack([
+            np.bincount(groups, column, n_groups) / counts
+            for column in values.T
+        ])
+    first = np.full(n_groups, len(groups))
+    np.minimum.at(first, groups, np.arange(len(groups)))
+    result = values[first]
+    if how == 'max':
+        np.maximum.at(result, groups, values)
+    elif how == 'min':
+        np.minimum.at(result, groups, values)
+    return result
+
+
+def default_cell_size(points, points_per_cell=POINTS_PER_CELL):
+    """Cell size giving about points_per_cell points per occupied cell
+
+    Point clouds are often close to a surface (terrain, a pit wall), so
+    the two longest sides of the bounding box are used to estimate the
+    spacing.
+    """
+    points = np.asarray(points)
+    if len(points) < 2:
+        return 1.
+    sides = np.sort(np.ptp(points, axis=0))[::-1]
+    area = sides[0] * max(sides[1], sides[0] / len(points))
+    size = np.sqrt(area * points_per_cell / len(points))
+    return size if size > 0 else 1.
+
+
+class GridIndex(object):
+    """Uniform grid over a point cloud for box and radius queries
+
+    Points are sorted once by the key of their cell, ordered x, then y,
+    then z. The cells of a query box in one (x, y) column then have
+    consecutive keys, so each column is a single binary search.
+    """
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64)
+        if cell_size is None:
+            cell_size = default_cell_size(self.points)
+        self.cell_size = float(cell_size)
+        if len(self.points) == 0:
+            self.origin = np.zeros(3)
+            self.dims = np.ones(3, np.int64)
+            coords = np.zeros((0, 3), np.int64)
+        else:
+            self.origin = _column_min(self.points)
+            coords = _cell_coords(self.points, self.origin, self.cell_size)
+            self.dims = _column_max(coords) + 1
+        keys = _pack(coords, self.dims)
+        if keys is None:
+            raise ValueError('Cell size {} is too small for the extent of '
+                             'the points'.format(cell_size))
+        self.order = np.argsort(keys)
+        self.keys = keys[self.order]
+
+    def query_box(self, lo, hi):
+        """Indices of points with lo <= point <= hi, in ascending order"""
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        cell_lo = np.maximum(
+            _cell_coords(lo[None], self.origin, self.cell_size)[0], 0
+        )
+        cell_hi = np.minimum(
+            _cell_coords(hi[None], self.origin, self.cell_size)[0],
+            self.dims - 1
+        )
+        if (cell_hi < cell_lo).any():
+            return np.zeros(0, np.intp)
+        if np.prod(cell_hi[:2] - cell_lo[:2] + 1) > len(self.points):
+            # Faster to check every point than every column
+            index = np.arange(len(self.points))
+        else:
+            x, y = np.meshgrid(np.arange(cell_lo[0], cell_hi[0] + 1),
+                               np.arange(cell_lo[1], cell_hi[1] + 1))
+            columns = np.column_stack([x.ravel(), y.ravel()])
+            first = _pack(np.column_stack([columns, np.full(
+                len(columns), cell_lo[2])]), self.dims)
+            last = _pack(np.column_stack([columns, np.full(
+                len(columns), cell_hi[2])]), self.dims)
+            starts = np.searchsorted(self.keys, first)
+            ends = np.searchsorted(self.keys, last, side='right')
+            index = self.order[_ranges(starts, ends - starts)]
+        points = self.points[index]
+        inside = ((points >= lo) & (points <= hi)).all(axis=1)
+        return np.sort(index[inside])
+
+    def query_radius(self, center, radius):
+        """Indices of points within radius of center, in ascending order"""
+        center = np.asarray(center, dtype=np.float64)
+        index = self.query_box(center - radius, center + radius)
+        distance2 = ((self.points[index] - center)**2).sum(axis=1)
+        return index[distance2 <= radius**2]
+
+
+def voxel_downsample(points, voxel_size):
+    """Replace the points in each voxel by their centroid
+
+    Returns (centroids, groups), where groups gives the output point of
+    each input point; use `aggregate` with it to combine data.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) == 0:
+        return points, np.zeros(0, np.intp)
+    coords = _cell_coords(points, _column_min(points), voxel_size)
+    groups, n_groups = _group_cells(coords)
+    return aggregate(points, groups, n_groups), groups
+
+
+# Cell offsets within two cells, skipping the eight far corners: cells of
+# side r / sqrt(3) at those offsets are at least r apart
+_NEIGHBORS = np.array([
+    (i, j, k) for i in range(-2, 3) for j in range(-2, 3)
+    for k in range(-2, 3)
+    if (i, j, k) != (0, 0, 0) and
+    sum(max(abs(d) - 1, 0)**2 for d in (i, j, k)) < 3
+])
+
+
+def poisson_thin(points, radius, seed=None):
+    """Keep a subset of points no two of which are within radius
+
+    Points are taken in random order, as in Poisson-disk dart throwing,
+    but in vectorized rounds on a grid with cells of side
+    radius / sqrt(3), so each cell keeps at most one point. Every round,
+    each cell offers its next remaining point; offers with no
+    lower-priority offer within radius are kept, and the remaining
+    points within radius of them are removed. The result is maximal:
+    every removed point is within radius of a kept one.
+
+    Work grows with the number of points in neighbouring cells, so very
+    dense clouds are best reduced with `voxel_downsample` first.
+
+    Returns (index, groups): the indices of the kept points, ascending,
+    and for every input point the position in index of the kept point
+    that removed it (or of itself), for use with `aggregate`.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n_points = len(points)
+    if n_points == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    radius2 = radius**2
+    cell_size = radius / np.sqrt(3)
+    coords = _cell_coords(points, _column_min(points), cell_size) + 2
+    dims = coords.max(axis=0) + 3
+    keys = _pack(coords, dims)
+    if keys is None:
+        raise ValueError('Radius {} is too small for the extent of the '
+                         'points'.format(radius))
+    priority = np.random.RandomState(seed).permutation(n_points)
+    order = np.lexsort((priority, keys))
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], n_points]
+    cell_keys = sorted_keys[starts]
+    steps = (_NEIGHBORS[:, 0] * dims[1] +
+             _NEIGHBORS[:, 1]) * dims[2] + _NEIGHBORS[:, 2]
+
+    def neighbors(cells, step):
+        """Positions of cells offset by step, and where they exist"""
+        wanted = cell_keys[cells] + step
+        found = np.minimum(np.searchsorted(cell_keys, wanted),
+                           len(cell_keys) - 1)
+        exists = np.flatnonzero(cell_keys[found] == wanted)
+        return exists, found[exists]
+
+    # Points already kept or removed, by position in order
+    owner = np.full(n_points, -1)
+    cursor = starts.copy()
+    while True:
+        # Move each cell to its next remaining point
+        alive = np.where(owner[order] < 0, np.arange(n_points), n_points)
+        next_alive = np.minimum.accumulate(alive[::-1])[::-1]
+        cursor = np.minimum(next_alive[np.minimum(cursor, n_points - 1)],
+                            ends)
+        offering = np.flatnonzero(cursor < ends)
+        if len(offering) == 0:
+            break
+        offer = order[cursor[offering]]
+        blocked = np.zeros(len(offering), bool)
+        rival_of = np.full(len(cell_keys), -1)
+        rival_of[offering] = offer
+        for step in steps:
+            near, cells = neighbors(offering, step)
+            rival = rival_of[cells]
+            mine = offer[near]
+            close = (rival >= 0) & (priority[rival] < priority[mine])
+            close[close] = ((points[rival[close]] - points[mine[close]])**2
+                            ).sum(axis=1) <= radius2
+            blocked[near[close]] = True
+
+        cells = offering[~blocked]
+        kept = offer[~blocked]
+        # The cell diagonal is radius, so a kept point removes the rest
+        # of its cell
+        members = order[_ranges(starts[cells], ends[cells] - starts[cells])]
+        owner[members] = np.repeat(kept, ends[cells] - starts[cells])
+        cursor[cells] = ends[cells]
+        for step in steps:
+            near, found = neighbors(cells, step)
+            counts = ends[found] - cursor[found]
+            members = order[_ranges(cursor[found], counts)]
+            source = np.repeat(kept[near], counts)
+            close = owner[members] < 0
+            close[close] = ((points[members[close]] -
+                             points[source[close]])**2).sum(axis=1) <= radius2
+            owner[members[close]] = source[close]
+
+    index = np.flatnonzero(owner == np.arange(n_points))
+    position = np.empty(n_points, np.intp)
+    position[index] = np.arange(len(index))
+    return index, position[owner]
@@ -7,20 +7,24 @@ from __future__ import unicode_literals
 
 from json import dumps
 
-from numpy import max as npmax
-from numpy import min as npmin
-from numpy import ndarray
+from numpy import diff, ndarray, ravel
 from six import string_types
 from traitlets import observe, validate
 
 from .base import BaseMesh
 from .base import CompositeResource
+from .cache import cache_key
 from .data import DataArray
+from .lazy import LazyArray
+from .meshops import decimate_triangles, optimize_cells
 from .options import ColorOptions
 from .options import MeshOptions
+from .rasters import (block_centers, block_factor, iter_bands,
+                      reduce_raster, shaded_relief)
 from .texture import Texture2DImage
 from .traits import (Array, HasSteno3DTraits, KeywordInstance, Renamed,
-                     Repeated, String, Union, Vector)
+                     Repeated, String, Union, Vector, array_range,
+                     serialized_nbytes)
 
 
 class _Mesh2DOptions(MeshOptions):
@@ -68,8 +72,8 @@ class Mesh2D(BaseMesh):
             return self._nbytes('vertices') + self._nbytes('triangles')
         if isinstance(arr, string_types) and arr in ('vertices', 'triangles'):
             arr = getattr(self, arr)
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('Mesh2D cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
@@ -83,20 +87,57 @@ class Mesh2D(BaseMesh):
 
     @validate('triangles')
     def _validate_tri(self, proposal):
-        if npmin(proposal['value']) < 0:
+        lo, hi = array_range(proposal['value'])
+        if lo < 0:
             raise ValueError('Triangles may only have positive integers')
-        if npmax(proposal['value']) >= len(proposal['owner'].vertices):
+        if hi >= len(proposal['owner'].vertices):
             raise ValueError('Triangles expects more vertices than provided')
         proposal['owner']._validate_file_size('triangles', proposal['value'])
         return proposal['value']
 
     @validate('vertices')
     def _validate_vert(self, proposal):
-        if npmax(proposal['owner'].triangles) >= len(proposal['value']):
+        _, hi = array_range(proposal['owner'].triangles)
+        if hi >= len(proposal['value']):
             raise ValueError('Triangles expects more vertices than provided')
         proposal['owner']._validate_file_size('vertices', proposal['value'])
         return proposal['value']
 
+    def optimize(self, tolerance=0., reorder=True):
+        """Weld coincident vertices, drop degenerate triangles and unused
+        vertices, and reorder both for locality
+
+        Vertices closer than about `tolerance` are welded (see
+        steno3d.meshops.weld); with 0 only identical vertices are. Returns
+        (node_index, cell_index), the indices of the original vertices
+        and triangles that were kept, in their new order. Use
+        Surface.optimize to remap the data along with the mesh.
+        """
+        vertices, triangles, node_index, cell_index = optimize_cells(
+            self.vertices, self.triangles, tolerance, reorder
+        )
+        # New indices never exceed the old vertex count, so triangles
+        # go first to keep the pair valid at every step
+        self.triangles = triangles
+        self.vertices = vertices
+        return node_index, cell_index
+
+    def decimate(self, target):
+        """Collapse edges until about `target` triangles remain
+
+        Edges are collapsed in order of quadric error, keeping the shape
+        and outline of the surface (see
+        steno3d.meshops.decimate_triangles). Returns (node_index,
+        cell_index) as Mesh2D.optimize does. Use Surface.decimate to
+        carry the data along.
+        """
+        vertices, triangles, node_index, cell_index = decimate_triangles(
+            self.vertices, self.triangles, target
+        )
+        self.triangles = triangles
+        self.vertices = vertices
+        return node_index, cell_index
+
     def _get_dirty_files(self, force=False):
         files = {}
         dirty = self._dirty_traits
@@ -116,12 +157,18 @@ class Mesh2D(BaseMesh):
             vertices=Array.download(
                 url=json['vertices'],
                 shape=(json['verticesSize']//12, 3),
-                dtype=json['verticesType']
+                dtype=json['verticesType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'vertices'),
+                encoding=json.get('verticesEncoding')
             ),
             triangles=Array.download(
                 url=json['triangles'],
                 shape=(json['trianglesSize']//12, 3),
-                dtype=json['trianglesType']
+                dtype=json['trianglesType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'triangles'),
+                encoding=json.get('trianglesEncoding')
             ),
             opts=json['meta']
         )
@@ -184,8 +231,8 @@ class Mesh2DGrid(BaseMesh):
             if getattr(self, arr, None) is None:
                 return 0
             arr = getattr(self, arr)
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('Mesh2DGrid cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
@@ -252,7 +299,10 @@ class Mesh2DGrid(BaseMesh):
             mesh.Z = Array.download(
                 url=json['Z'],
                 shape=json['ZSize']//4,
-                dtype=json['ZType']
+                dtype=json['ZType'],
+                memmap_dir=kwargs.get('memmap_dir'),
+                cache_key=cache_key(json, 'Z'),
+                encoding=json.get('ZEncoding')
             )
 
         return mesh
@@ -275,6 +325,8 @@ class _SurfaceBinder(HasSteno3DTraits):
 
 class Surface(CompositeResource):
     """Contains all the information about a 2D surface"""
+    _cells = 'triangles'
+
     mesh = Union(
         help='Mesh',
         trait_types=[
@@ -298,11 +350,116 @@ class Surface(CompositeResource):
         allow_none=True
     )
 
+    def _can_partition(self):
+        return isinstance(self.mesh, Mesh2D)
+
     def _nbytes(self):
         return (self.mesh._nbytes() +
                 sum(d.data._nbytes() for d in self.data) +
                 sum(t._nbytes() for t in self.textures))
 
+    def optimize(self, tolerance=0., reorder=True):
+        """Optimize the mesh (see Mesh2D.optimize) and remap node and
+        cell data to match
+
+        Returns (node_index, cell_index) as Mesh2D.optimize does.
+        """
+        if not isinstance(self.mesh, Mesh2D):
+            raise ValueError('Only surfaces with a Mesh2D mesh can be '
+                             'optimized')
+        node_index, cell_index = self.mesh.optimize(tolerance, reorder)
+        self._remap_data(node_index, cell_index)
+        return node_index, cell_index
+
+    def decimate(self, target=None, max_bytes=None):
+        """Reduce the Mesh2D to `target` triangles, or until the surface
+        serializes to at most `max_bytes`, and remap the data to match
+
+        Node data follows the vertex each merged vertex kept; cell data
+        follows the surviving triangles. Returns (node_index,
+        cell_index) into the original mesh.
+        """
+        self._check_decimate(target, max_bytes)
+        if max_bytes is None:
+            node_index, cell_index = self.mesh.decimate(target)
+            self._remap_data(node_index, cell_index)
+            return node_index, cell_index
+        textures = sum(tex._nbytes() for tex in self.textures)
+        return self._decimate_until(
+            self.mesh.decimate, lambda: self._nbytes() - textures,
+            max_bytes - textures
+        )
+
+    def fit(self, file_size_limit=None):
+        """Decimate the Mesh2D until every mesh and data file is within
+        the file size limit (by default, that of the logged in user)
+
+        Returns (node_index, cell_index) as Surface.decimate does.
+        """
+        self._check_decimate(0, None)
+        return self._fit(self.mesh.decimate, file_size_limit)
+
+    def _check_decimate(self, target, max_bytes):
+        if not isinstance(self.mesh, Mesh2D):
+            raise ValueError('Only surfaces with a Mesh2D mesh can be '
+                             'decimated')
+        if (target is None) == (max_bytes is None):
+            raise ValueError('Specify exactly one of target or max_bytes')
+
+    @classmethod
+    def from_raster(cls, project, raster, cell_size=1., origin=(0., 0.),
+                    nodata=None, max_cells=None, texture=None, shape=None,
+                    **kwargs):
+        """Create a Surface with a Mesh2DGrid from a raster of
+        elevations, such as a digital elevation model
+
+        `raster` is a 2D array-like with rows from north to south, e.g.
+        a numpy memmap or h5py Dataset, or an iterable of bands of whole
+        rows if `shape` (rows, columns) is given. It is read a band at
+        a time. `cell_size` is the pixel size, or (x size, y size), and
+        `origin` the x, y of the lower left corner of the raster.
+
+        Each pixel becomes a grid node at its centre, or if max_cells
+        is given, each block of pixels needed to keep the grid within
+        that many cells becomes a node at the block mean. Pixels equal
+        to nodata, or NaN, are left out of the means; nodes without any
+        are NaN. `texture` may be True for a shaded relief image with a
+        pixel per node, or a PNG image to drape over the raster extent.
+        Other keyword arguments are passed to the Surface.
+        """
+        if shape is None:
+            shape = raster.shape
+        if len(shape) != 2:
+            raise ValueError('Raster must be 2D, not {}D'.format(len(shape)))
+        rows, cols = shape
+        dx, dy = (list(ravel(cell_size).astype(float)) * 2)[:2]
+        factor = block_factor(shape, max_cells)
+        bands = iter_bands(raster, factor) if hasattr(raster, 'shape') \
+            else raster
+        grid = reduce_raster(bands, shape, factor, nodata)
+        if min(grid.shape) < 2:
+            raise ValueError('Raster must have at least 2 x 2 nodes')
+        x = block_centers(cols, factor, dx, origin[0] + dx / 2)
+        y = block_centers(rows, factor, -dy,
+                          origin[1] + (rows - .5) * dy)[::-1]
+        mesh = Mesh2DGrid(
+            h1=diff(x),
+            h2=diff(y),
+            O=[x[0], y[0], 0.],
+            # Rows run north to south, the grid V axis south to north
+            Z=grid[::-1].T.ravel()
+        )
+        if texture is True:
+            texture = shaded_relief(grid, dx * factor, dy * factor)
+        if texture is not None and texture is not False:
+            kwargs['textures'] = kwargs.get('textures', []) + [
+                Texture2DImage(O=[origin[0], origin[1], 0.],
+                               U=[cols * dx, 0., 0.],
+                               V=[0., rows * dy, 0.],
+                               image=texture)
+            ]
+        return cls(project, mesh=mesh, **kwargs)
+
     @validate('data')
     def _validate_data(self, proposal):
         """Check if resource is built correctly"""
@@ -0,0 +1,117 @@
+"""sync.py contains the background queue that batches uploads of synced
+steno3d content
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+from threading import Condition, Thread
+from time import time
+from traceback import print_exc
+
+
+class SyncQueue(object):
+    """Queue of synced content waiting to be uploaded
+
+    Content is uploaded on a background thread once its sync window has
+    passed. Scheduling content that is already waiting does not extend
+    the window, so every change made within the window goes out in a
+    single upload. While a batch is open, nothing is uploaded.
+    """
+
+    def __init__(self):
+        self._cond = Condition()
+        self._pending = {}
+        self._batches = 0
+        self._busy = 0
+        self._thread = None
+
+    @property
+    def batching(self):
+        """True while a batch() block is open"""
+        return self._batches > 0
+
+    def schedule(self, content, delay=0):
+        """Upload content in the background after delay seconds"""
+        with self._cond:
+            deadline = time() + delay
+            key = id(content)
+            if key in self._pending:
+                deadline = min(deadline, self._pending[key][0])
+            self._pending[key] = (deadline, content)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+
+    @contextmanager
+    def batch(self):
+        """Hold all synced uploads until the block exits"""
+        with self._cond:
+            self._batches += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._batches -= 1
+                if self._batches == 0:
+                    self._expire()
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Upload all pending content now and wait until it is sent
+
+        Returns False if the timeout passed before everything was sent.
+        """
+        end = None if timeout is None else time() + timeout
+        with self._cond:
+            self._expire()
+            self._cond.notify_all()
+            while len(self._pending) > 0 or self._busy > 0:
+                remaining = None if end is None else end - time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _expire(self):
+        """Make all pending content due immediately"""
+        now = time()
+        for key, (deadline, content) in list(self._pending.items()):
+            self._pending[key] = (min(deadline, now), content)
+
+    def _next(self):
+        """Block until content is due, then remove and return it"""
+        with self._cond:
+            while True:
+                wait = None
+                if len(self._pending) > 0 and not self.batching:
+                    key, (deadline, content) = min(
+                        self._pending.items(), key=lambda item: item[1][0]
+                    )
+                    wait = deadline - time()
+                    if wait <= 0:
+                        del self._pending[key]
+                        self._busy += 1
+                        return content
+                self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            content = self._next()
+            try:
+                if content._sync:
+                    content._upload(content._sync, verbose=False)
+            except Exception:
+                print_exc()
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+
+SYNC_QUEUE = SyncQueue()
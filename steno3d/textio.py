@@ -0,0 +1,259 @@
+"""textio.py contains vectorized helpers for reading large text and
+binary files, used by the built-in parsers
+
+Files are memory-mapped and text is handled a chunk of whole lines at
+a time: lines are located, classified by their first word and turned
+into numbers with numpy, never with a Python loop over lines.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import warnings
+from os.path import getsize
+
+import numpy as np
+
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+_SPACE = np.zeros(256, bool)
+_SPACE[[ord(c) for c in ' \t\r\n\f\v']] = True
+
+
+def map_file(file_name, offset=0):
+    """Read-only memory map of the file bytes from offset onwards"""
+    if getsize(file_name) <= offset:
+        return np.zeros(0, np.uint8)
+    return np.memmap(file_name, dtype=np.uint8, mode='r', offset=offset)
+
+
+def iter_chunks(buf, chunk_size=CHUNK_SIZE):
+    """Yield (offset, chunk) pieces of buf that end at a line break"""
+    start = 0
+    while start < len(buf):
+        stop = min(start + chunk_size, len(buf))
+        if stop < len(buf):
+            breaks = np.flatnonzero(buf[start:stop] == ord('\n'))
+            if len(breaks) > 0:
+                stop = start + breaks[-1] + 1
+            else:
+                # A single line longer than the chunk size
+                rest = np.flatnonzero(buf[stop:] == ord('\n'))
+                stop = stop + rest[0] + 1 if len(rest) else len(buf)
+        yield start, np.asarray(buf[start:stop])
+        start = stop
+
+
+class Lines(object):
+    """The lines of a chunk of text, located with vectorized searches
+
+    `starts` and `ends` bound each line without its line break.
+    `first` is the position of the first non-space byte (or the line
+    end for blank lines) and `tokens` the number of whitespace
+    separated words on each line.
+    """
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        breaks = np.flatnonzero(chunk == ord('\n'))
+        self.starts = np.r_[0, breaks + 1]
+        self.ends = np.r_[breaks, len(chunk)]
+        if len(chunk) > 0 and chunk[-1] == ord('\n'):
+            self.starts, self.ends = self.starts[:-1], self.ends[:-1]
+        space = _SPACE[chunk]
+        word_start = ~space
+        word_start[1:] &= space[:-1]
+        words = np.flatnonzero(word_start)
+        lo = np.searchsorted(words, self.starts)
+        self.tokens = np.searchsorted(words, self.ends) - lo
+        self.first = self.ends.copy()
+        has = self.tokens > 0
+        self.first[has] = words[lo[has]]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def prefix(self, word):
+        """Mask of lines whose first word starts with `word`"""
+        word = np.frombuffer(word.encode('ascii'), np.uint8)
+        mask = self.first + len(word) <= self.ends
+        for i, byte in enumerate(word):
+            candidates = np.flatnonzero(mask)
+            mask[candidates] = self.chunk[self.first[candidates] + i] == byte
+        return mask
+
+    def keyword(self, word):
+        """Mask of lines whose first word is `word`"""
+        mask = self.prefix(word)
+        # The keyword must be followed by a space or the end of the line
+        after = self.first + len(word)
+        candidates = np.flatnonzero(mask & (after < self.ends))
+        mask[candidates] = _SPACE[self.chunk[after[candidates]]]
+        return mask
+
+    def line(self, index):
+        """Text of one line, without surrounding space"""
+        return self.chunk[self.starts[index]:self.ends[index]].tobytes(
+        ).decode('utf-8', 'replace').strip()
+
+    def fields(self, mask, sep=b','):
+        """Split the selected lines into fields at each `sep`
+
+        Every selected line must have the same number of fields.
+        Returns a list with, for each field, an array of its bytes
+        on each line (numpy 'S' strings, surrounding space and quotes
+        removed).
+        """
+        index = np.flatnonzero(mask)
+        starts, ends = self.starts[index], self.ends[index]
+        separators = np.flatnonzero(self.chunk == ord(sep))
+        first = np.searchsorted(separators, starts)
+        counts = np.searchsorted(separators, ends) - first
+        if len(index) == 0:
+            return []
+        if (counts != counts[0]).any():
+            bad = index[np.flatnonzero(counts != counts[0])[0]]
+            raise ValueError('Line "{}" has {} fields, not {}'.format(
+                self.line(bad), counts[index == bad][0] + 1, counts[0] + 1
+            ))
+        bounds = separators[first[:, None] + np.arange(counts[0])]
+        field_starts = np.column_stack([starts, bounds + 1])
+        field_ends = np.column_stack([bounds, ends])
+        return [_strings(self.chunk, field_starts[:, i], field_ends[:, i])
+                for i in range(counts[0] + 1)]
+
+    def text(self, mask, skip=0, replace=None):
+        """Bytes of the selected lines, ready for numbers
+
+        Other lines, and the start of each selected line up to `skip`
+        bytes past its first word start (e.g. the length of a keyword),
+        become spaces, as do bytes in `replace` (e.g. b'/').
+        """
+        index = np.flatnonzero(mask)
+        if len(index) == 0:
+            return b''
+        # Only the span from the first to the last selected line
+        span = slice(index[0], index[-1] + 1)
+        starts = self.starts[span]
+        nexts = np.r_[starts[1:], self.ends[index[-1]]]
+        keep_from = np.where(mask[span], np.minimum(
+            self.first[span] + skip, self.ends[span]
+        ), nexts)
+        lengths = np.empty(2 * len(starts), np.intp)
+        lengths[0::2] = keep_from - starts
+        lengths[1::2] = nexts - keep_from
+        keep = np.repeat(np.tile([False, True], len(starts)), lengths)
+        text = np.where(keep, self.chunk[starts[0]:nexts[-1]], np.uint8(32))
+        if replace:
+            for byte in bytearray(replace):
+                text[text == byte] = ord(' ')
+        return text.tobytes()
+
+
+def _strings(chunk, starts, ends):
+    """Fixed-width byte strings of chunk[start:end] for each pair"""
+    width = max(int((ends - starts).max()), 1) if len(starts) else 1
+    positions = starts[:, None] + np.arange(width)
+    inside = positions < ends[:, None]
+    values = np.where(inside, chunk[np.minimum(positions, len(chunk) - 1)],
+                      np.uint8(0))
+    values = np.ascontiguousarray(values).view('S{}'.format(width))[:, 0]
+    return np.char.strip(values, b' \t\r"\'')
+
+
+def to_numbers(strings, dtype=float):
+    """Convert byte strings to numbers; blank strings become NaN"""
+    strings = strings.copy()
+    strings[strings == b''] = b'nan'
+    try:
+        return strings.astype(dtype)
+    except ValueError as err:
+        raise ValueError('Invalid number: {}'.format(err))
+
+
+def numbers(text, dtype=float, count=None):
+    """Parse whitespace-separated numbers, raising ValueError on bad text
+
+    If count is given, exactly that many numbers must be found.
+    """
+    if not text.strip():
+        values = np.zeros(0, dtype)
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                values = np.fromstring(text, dtype=dtype, sep=' ')
+            except (ValueError, DeprecationWarning) as err:
+                raise ValueError('Invalid number in text: {}'.format(err))
+    if count is not None and len(values) != count:
+        raise ValueError('Expected {} numbers but found {}'.format(
+            count, len(values)
+        ))
+    return values
+
+
+class GrowableArray(object):
+    """Rows of a numpy array collected a block at a time
+
+    Storage is preallocated and doubled when full, so appending costs
+    amortized constant time per row and no Python list of rows is
+    built. `shape` is the shape of each row, e.g. (3,) for vertices.
+    """
+
+    def __init__(self, shape=(), dtype=np.float64, capacity=1024):
+        self._buffer = np.empty((max(capacity, 1),) + tuple(shape), dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def array(self):
+        """The rows so far, as a view that later appends may replace"""
+        return self._buffer[:self._size]
+
+    def append(self, rows):
+        """Append a block of rows (or a single row)"""
+        rows = np.asarray(rows, dtype=self._buffer.dtype)
+        if rows.ndim == self._buffer.ndim - 1:
+            rows = rows[None]
+        end = self._size + len(rows)
+        if end > len(self._buffer):
+            grown = np.empty(
+                (max(end, 2 * len(self._buffer)),) + self._buffer.shape[1:],
+                self._buffer.dtype
+            )
+            grown[:self._size] = self.array
+            self._buffer = grown
+        self._buffer[self._size:end] = rows
+        self._size = end
+
+    def take(self):
+        """Return a copy of the rows so far and start again empty,
+        keeping the storage for the next rows"""
+        rows = self.array.copy()
+        self._size = 0
+        return rows
+
+
+def fan_triangles(values, counts):
+    """Triangulate polygons given as a flat list of vertex indices
+
+    `counts` is the number of vertices of each polygon (at least 3).
+    Each polygon becomes a fan of counts - 2 triangles around its first
+    vertex. Returns the triangles and, for each, its polygon index.
+    """
+    counts = np.asarray(counts)
+    offsets = np.cumsum(counts) - counts
+    n_triangles = counts - 2
+    polygon = np.repeat(np.arange(len(counts)), n_triangles)
+    step = np.arange(n_triangles.sum()) - np.repeat(
+        np.cumsum(n_triangles) - n_triangles, n_triangles
+    )
+    first = offsets[polygon]
+    triangles = np.column_stack([values[first], values[first + step + 1],
+                                 values[first + step + 2]])
+    return triangles, polygon
@@ -6,12 +6,15 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import namedtuple
-from io import BytesIO
 from json import dumps
 from six import string_types
 from traitlets import observe, validate
 
 from .base import BaseTexture2D
+from .cache import cache_key
+from .client import Comms
+from .imaging import encode_texture
+from .tiling import TILE_SIZE, iter_tiles
 from .traits import Image, Vector
 
 
@@ -40,12 +43,20 @@ class Texture2DImage(BaseTexture2D):
         if img is None or (isinstance(img, string_types) and img == 'image'):
             img = self.image
         try:
+            img.seek(0, 2)
+            nbytes = img.tell()
             img.seek(0)
-            return len(img.read())
+            return nbytes
         except:
             raise ValueError('Texture2DImage cannot calculate the number of '
                              'bytes of {}'.format(img))
 
+    def _validate_file_size(self, name, arr):
+        # Images over the pixel budget are downsampled at upload
+        if Comms.texture_pixels is not None:
+            return True
+        return super(Texture2DImage, self)._validate_file_size(name, arr)
+
     @observe('image')
     def _reject_large_files(self, change):
         try:
@@ -63,12 +74,9 @@ class Texture2DImage(BaseTexture2D):
         files = super(Texture2DImage, self)._get_dirty_files(force)
         dirty = self._dirty_traits
         if 'image' in dirty or force:
-            self.image.seek(0)
-            copy = BytesIO()
-            copy.name = 'texture_copy.png'
-            copy.write(self.image.read())
-            copy.seek(0)
-            files['image'] = FileProp(copy, 'png')
+            stream, fmt = encode_texture(self.image, Comms.texture_pixels,
+                                         Comms.jpeg_textures)
+            files['image'] = FileProp(stream, fmt)
         return files
 
     def _get_dirty_data(self, force=False):
@@ -89,6 +97,33 @@ class Texture2DImage(BaseTexture2D):
         self.image.seek(0)
         return self.image.read()
 
+    @classmethod
+    def tiles(cls, image, O=(0., 0., 0.), U=(1., 0., 0.), V=(0., 1., 0.),
+              tile_size=TILE_SIZE, levels=1, workers=None, directory=None,
+              **kwargs):
+        """Split a large image into a grid of textures spanning O, U
+        and V, each at most tile_size x tile_size pixels
+
+        `image` is a PNG or JPEG file name or file, a .npy file name or
+        a (rows, columns[, planes]) uint8 or uint16 array such as a
+        memmap, with rows from the top. It is memory-mapped rather than
+        loaded (see `steno3d.tiling.map_image`). If `levels` is more
+        than 1, lower resolution levels are made too, each half the
+        size of the one before. Tiles are encoded on `workers` threads.
+        Other keyword arguments are passed to each Texture2DImage.
+
+        Returns a list of levels, full resolution first, each a list of
+        its tiles row by row from the top left.
+        """
+        tiles = []
+        for level, O, U, V, stream in iter_tiles(
+                image, O, U, V, tile_size, levels, workers, directory
+        ):
+            if level == len(tiles):
+                tiles.append([])
+            tiles[level].append(cls(O=O, U=U, V=V, image=stream, **kwargs))
+        return tiles
+
     @classmethod
     def _build_from_json(cls, json, **kwargs):
         tex = Texture2DImage(
@@ -97,7 +132,8 @@ class Texture2DImage(BaseTexture2D):
             O=json['OUV']['O'],
             U=json['OUV']['U'],
             V=json['OUV']['V'],
-            image=Image.download(json['image'])
+            image=Image.download(json['image'],
+                                 cache_key=cache_key(json, 'image'))
         )
         return tex
 
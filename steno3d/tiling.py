@@ -0,0 +1,166 @@
+"""tiling.py splits large images, such as orthophotos, into grids of
+texture tiles, with optional lower resolution levels
+
+The source pixels are memory-mapped: numpy arrays and .npy files are
+used as they are, and PNG images are decoded a row at a time into a
+temporary file. Each level is half the size of the one before, built a
+band of rows at a time, and tiles are encoded on a pool of threads.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tempfile import TemporaryFile
+
+import numpy as np
+from six import string_types
+
+from .imaging import (PILImage, encode_png, image_info, pillow_open,
+                      png_rows)
+from .parallel import parallel_map
+from .rasters import BAND_SIZE
+
+
+# Width and height of tiles in pixels
+TILE_SIZE = 2048
+
+
+def _temporary(shape, dtype, directory=None):
+    """Writable memory map of a temporary file, removed once unused"""
+    with TemporaryFile(dir=directory) as fileobj:
+        return np.memmap(fileobj, dtype=dtype, mode='w+', shape=shape)
+
+
+def map_image(source, directory=None):
+    """Pixels of an image as a (rows, columns, planes) array, with rows
+    from top to bottom
+
+    `source` may be a 2D or 3D uint8 or uint16 array, such as a memmap,
+    the name of a .npy file, which is memory-mapped, or a PNG or JPEG
+    file name or file. PNGs are decoded into a memory-mapped temporary
+    file in `directory`. JPEGs need Pillow, and are decoded in memory.
+    """
+    if isinstance(source, string_types) and source.lower().endswith('.npy'):
+        source = np.load(source, mmap_mode='r')
+    if not hasattr(source, 'read') and not isinstance(source, string_types):
+        pixels = np.asanyarray(source)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        if pixels.ndim != 3 or not 1 <= pixels.shape[2] <= 4:
+            raise ValueError('Image array must be (rows, columns) or '
+                             '(rows, columns, 1 to 4 planes), not '
+                             '{}'.format(pixels.shape))
+        if pixels.dtype not in (np.uint8, np.uint16):
+            raise ValueError('Image array must be uint8 or uint16, not '
+                             '{}'.format(pixels.dtype))
+        return pixels
+    fileobj = open(source, 'rb') if isinstance(source, string_types) \
+        else source
+    try:
+        info = image_info(fileobj)
+        if info.format == 'jpg':
+            if PILImage is None:
+                raise ValueError('JPEG images need Pillow to be tiled')
+            image = pillow_open(fileobj)
+            return map_image(np.asarray(image.convert(
+                image.mode if image.mode in ('L', 'LA', 'RGB', 'RGBA')
+                else 'RGB'
+            )))
+        width, height, planes, bitdepth, rows = png_rows(fileobj)
+        pixels = _temporary((height, width, planes),
+                            np.uint16 if bitdepth > 8 else np.uint8,
+                            directory)
+        flat = pixels.reshape(height, -1)
+        for index, row in enumerate(rows):
+            flat[index] = row
+        return pixels
+    finally:
+        if fileobj is not source:
+            fileobj.close()
+        else:
+            fileobj.seek(0)
+
+
+def half_image(pixels, directory=None):
+    """Image of half the width and height, each pixel the mean of a
+    2 x 2 block, built a band of rows at a time into a memory-mapped
+    temporary file"""
+    rows, cols, planes = pixels.shape
+    out = _temporary((-(-rows // 2), -(-cols // 2), planes), pixels.dtype,
+                     directory)
+    band_rows = 2 * max(BAND_SIZE // (2 * cols * planes *
+                                      pixels.dtype.itemsize), 1)
+    for start in range(0, rows, band_rows):
+        band = np.asarray(pixels[start:start + band_rows], np.uint32)
+        # Repeating the last row or column leaves the means of partial
+        # blocks unchanged
+        if len(band) % 2 or cols % 2:
+            band = np.pad(band, ((0, len(band) % 2), (0, cols % 2), (0, 0)),
+                          mode='edge')
+        total = (band[0::2, 0::2] + band[1::2, 0::2] + band[0::2, 1::2] +
+                 band[1::2, 1::2])
+        out[start // 2:start // 2 + len(total)] = np.rint(total / 4.)
+    return out
+
+
+def tile_bounds(shape, tile_size=TILE_SIZE):
+    """(first row, last row + 1, first column, last column + 1) of each
+    tile of an image of `shape` (rows, columns), row by row from the top
+    left"""
+    rows, cols = shape[:2]
+    return [(row, min(row + tile_size, rows), col,
+             min(col + tile_size, cols))
+            for row in range(0, rows, tile_size)
+            for col in range(0, cols, tile_size)]
+
+
+def tile_axes(bounds, shape, O, U, V):
+    """O, U and V of the tile within `bounds` of an image of `shape`
+    (rows, columns) spanning O, U and V, where O is the bottom left
+    corner and rows run from the top"""
+    first_row, last_row, first_col, last_col = bounds
+    rows, cols = shape[:2]
+    O, U, V = (np.asarray(axis, dtype=float) for axis in (O, U, V))
+    return (O + U * first_col / cols + V * (rows - last_row) / rows,
+            U * (last_col - first_col) / cols,
+            V * (last_row - first_row) / rows)
+
+
+def iter_tiles(source, O, U, V, tile_size=TILE_SIZE, levels=1,
+               workers=None, directory=None):
+    """Yield (level, O, U, V, PNG file) for each tile of an image
+
+    Level 0 is the image at full resolution, and each further level is
+    half the size of the one before, down to a single pixel. Tiles of a
+    level are encoded on `workers` threads (see
+    `steno3d.parallel.parallel_map`) and yielded row by row from the top
+    left before the next level is built.
+    """
+    if tile_size < 1 or levels < 1:
+        raise ValueError('tile_size and levels must be at least 1')
+    pixels = map_image(source, directory)
+    bitdepth = 16 if pixels.dtype == np.uint16 else 8
+    for level in range(levels):
+        if level > 0:
+            pixels = half_image(pixels, directory)
+        bounds = tile_bounds(pixels.shape, tile_size)
+
+        def encode(tile):
+            first_row, last_row, first_col, last_col = tile
+            return encode_png(pixels[first_row:last_row,
+                                     first_col:last_col], bitdepth)
+
+        streams, errors = parallel_map(encode, bounds, workers)
+        if len(errors) > 0:
+            raise ValueError(
+                'Failed to encode {} of {} tiles:\n{}'.format(
+                    len(errors), len(bounds), errors[0][1]
+                )
+            )
+        for tile, stream in zip(bounds, streams):
+            yield (level,) + tile_axes(tile, pixels.shape, O, U, V) + \
+                (stream,)
+        if max(pixels.shape[:2]) == 1:
+            break
@@ -6,17 +6,31 @@ from __future__ import unicode_literals
 from collections import namedtuple
 from functools import wraps
 from io import BytesIO
+from os import fstat, path, remove
+from shutil import copyfileobj
 from six import integer_types, string_types, with_metaclass
-from tempfile import NamedTemporaryFile
+from threading import RLock
+from uuid import uuid4
 from warnings import warn
 
 import numpy as np
-from png import Reader
-from requests import get
 import traitlets as tr
 
+from .cache import get_cache
+from .compression import decode_stream
+from .imaging import check_texture, image_info
+from .lazy import LazyArray
+
 
 _REGISTRY = {}
+_VALIDATION_LOCK = RLock()
+_DIRTY_LOCK = RLock()
+
+
+def get(url, **kwargs):
+    """Get a url through the pooled steno3d session"""
+    from .client import Comms
+    return Comms.session.get(url, timeout=Comms.timeout, **kwargs)
 
 
 class MetaDocTraits(tr.MetaHasTraits):
@@ -79,8 +93,7 @@ class MetaDocTraits(tr.MetaHasTraits):
 
 def validator(func):
     """wrapper used on validation functions to recursively validate"""
-    @wraps(func)
-    def func_wrapper(self):
+    def validate_unlocked(self):
         if getattr(self, '_validating', False):
             return
         self._cross_validation_lock = False
@@ -110,6 +123,11 @@ def validator(func):
             self._cross_validation_lock = True
             self._validating = False
         return func(self)
+
+    @wraps(func)
+    def func_wrapper(self):
+        with _VALIDATION_LOCK:
+            return validate_unlocked(self)
     return func_wrapper
 
 
@@ -124,58 +142,120 @@ class DelayedValidator(tr.HasTraits):
         return True
 
 
+def _instances(value):
+    """HasSteno3DTraits instances held by a trait value"""
+    if isinstance(value, HasSteno3DTraits):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if isinstance(v, HasSteno3DTraits)]
+    return []
+
+
 class HasSteno3DTraits(with_metaclass(MetaDocTraits, DelayedValidator)):
 
+    # Traits that point back up the tree (e.g. a resource's project);
+    # changes to their values do not make this instance dirty
+    _backref_traits = ()
+
     def __init__(self, **metadata):
         self._dirty_traits = set()
+        self._dirty_children = {}
+        self._generation = 0
+        self._parents = {}
         for key in metadata:
             if key not in self.trait_names():
                 raise KeyError('{}: Keyword input is not trait'.format(key))
         super(HasSteno3DTraits, self).__init__(**metadata)
 
+    @property
+    def _is_dirty(self):
+        return len(self._dirty_traits) > 0 or len(self._dirty_children) > 0
+
     @tr.observe(tr.All)
     def _mark_dirty(self, change):
-        self._dirty_traits.add(change['name'])
-
-    def _mark_clean(self, recurse=True):
-        self._dirty_traits = set()
-        if not recurse or getattr(self, '_inside_clean', False):
-            return
-        self._inside_clean = True
-        try:
-            traits = self._dirty
-            for trait in traits:
-                value = getattr(self, trait)
-                if isinstance(value, HasSteno3DTraits):
-                    value._mark_clean()
-                if isinstance(value, (list, tuple)):
-                    for v in value:
-                        if isinstance(v, HasSteno3DTraits):
-                            v._mark_clean()
-        finally:
-            self._inside_clean = False
+        name = change['name']
+        with _DIRTY_LOCK:
+            was_dirty = self._is_dirty
+            self._generation += 1
+            self._dirty_traits.add(name)
+            if name not in self._backref_traits:
+                new = _instances(change['new'])
+                new_ids = set(id(child) for child in new)
+                for child in _instances(change['old']):
+                    if id(child) not in new_ids:
+                        self._disown(name, child)
+                for child in new:
+                    self._adopt(name, child)
+            self._notify_parents(was_dirty)
+
+    def _mark_clean(self, recurse=True, generation=None):
+        """Mark traits clean, along with dirty children if recurse
+
+        If `generation` is given and traits have changed since
+        `_generation` had that value, nothing is marked clean.
+        """
+        with _DIRTY_LOCK:
+            if generation is not None and generation != self._generation:
+                return
+            was_dirty = self._is_dirty
+            self._dirty_traits = set()
+            if recurse:
+                for children in list(self._dirty_children.values()):
+                    for child in list(children.values()):
+                        child._mark_clean()
+            self._notify_parents(was_dirty)
 
     @property
     def _dirty(self):
-        if getattr(self, '_inside_dirty', False):
-            return set()
-        dirty_instances = set()
-        self._inside_dirty = True
-        try:
-            traits = self._non_deprecated_traits()
-            for trait in traits:
-                value = getattr(self, trait)
-                if (isinstance(value, HasSteno3DTraits) and
-                        len(value._dirty) > 0):
-                    dirty_instances.add(trait)
-                if isinstance(value, (list, tuple)):
-                    for v in value:
-                        if (isinstance(v, HasSteno3DTraits) and
-                                len(v._dirty) > 0):
-                            dirty_instances.add(trait)
-        finally:
-            self._inside_dirty = False
-        return self._dirty_traits.union(dirty_instances)
+        """Names of changed traits and traits holding dirty instances
+
+        Dirtiness is propagated up from children as it changes, so this
+        does not walk the tree.
+        """
+        return self._dirty_traits.union(self._dirty_children)
+
+    def _dirty_instances(self, name):
+        """Dirty instances held by trait name, in trait order"""
+        dirty = self._dirty_children.get(name, {})
+        if len(dirty) == 0:
+            return []
+        return [v for v in _instances(getattr(self, name)) if id(v) in dirty]
+
+    def _adopt(self, name, child):
+        """Register self as the parent of child through trait name"""
+        with _DIRTY_LOCK:
+            key = (id(self), name)
+            if key in child._parents:
+                return
+            child._parents[key] = (self, name)
+            if child._is_dirty:
+                self._child_changed(name, child, True)
+
+    def _disown(self, name, child):
+        """Remove self as the parent of child through trait name"""
+        with _DIRTY_LOCK:
+            if child._parents.pop((id(self), name), None) is not None:
+                self._child_changed(name, child, False)
+
+    def _child_changed(self, name, child, is_dirty):
+        """Record that child under trait name became dirty or clean"""
+        was_dirty = self._is_dirty
+        children = self._dirty_children.setdefault(name, {})
+        if is_dirty:
+            children[id(child)] = child
+        else:
+            children.pop(id(child), None)
+        if len(children) == 0:
+            del self._dirty_children[name]
+        self._notify_parents(was_dirty)
+
+    def _notify_parents(self, was_dirty):
+        """Pass a change between clean and dirty on to all parents"""
+        is_dirty = self._is_dirty
+        if is_dirty == was_dirty:
+            return
+        for parent, name in list(self._parents.values()):
+            parent._child_changed(name, self, is_dirty)
 
     def _non_deprecated_traits(self):
         return {k: v for k, v in self.traits().items()
@@ -341,56 +421,232 @@ class String(Steno3DTrait, tr.TraitType):
 
 
 class Image(Steno3DTrait, tr.TraitType):
-    """A trait for PNG images"""
+    """A trait for PNG and JPEG images"""
 
-    info_text = 'a PNG image file'
-    sphinx_extra = ', Format: PNG'
+    info_text = 'a PNG or JPEG image file'
+    sphinx_extra = ', Format: PNG or JPEG'
 
     def validate(self, obj, value):
-        """checks that image file is PNG and gets a copy"""
+        """checks that image file is PNG or JPEG from its header and gets
+        a copy"""
         if getattr(value, '__valid__', False):
             return value
 
         try:
             if hasattr(value, 'read'):
-                Reader(value).validate_signature()
+                fp = value
             else:
-                with open(value, 'rb') as v:
-                    Reader(v).validate_signature()
+                fp = open(value, 'rb')
+            info = image_info(fp)
         except Exception:
             self.error(obj, value)
 
-        output = BytesIO()
-        output.name = 'texture.png'
-        output.__valid__ = True
-        if hasattr(value, 'read'):
-            fp = value
-            fp.seek(0)
+        # The image must be uploadable with the current texture settings
+        from .client import Comms
+        try:
+            check_texture(info, Comms.texture_pixels, Comms.jpeg_textures)
+        except ValueError as err:
+            fp.close()
+            raise tr.TraitError(err)
+
+        # BytesIO(bytes) shares the bytes rather than copying them again
+        if isinstance(fp, BytesIO):
+            output = BytesIO(fp.getvalue())
         else:
-            fp = open(value, 'rb')
-        output.write(fp.read())
-        output.seek(0)
+            output = BytesIO(fp.read())
+        output.name = 'texture.' + info.format
+        output.info = info
+        output.__valid__ = True
         fp.close()
         return output
 
     @classmethod
-    def download(cls, url):
-        im_resp = get(url)
-        if im_resp.status_code != 200:
-            raise IOError('Failed to download image.')
-        output = BytesIO()
-        output.name = 'texture.png'
-        for chunk in im_resp:
-            output.write(chunk)
-        output.seek(0)
+    def download(cls, url, cache_key=None):
+        """Download a PNG or JPEG image into a BytesIO
+
+        The BytesIO is named 'texture.png' or 'texture.jpg' after its
+        format. If `cache_key` is given and the download cache is
+        enabled, the image is read from the cache when present and saved
+        to it otherwise.
+        """
+        cache = None if cache_key is None else get_cache()
+        cached = None if cache is None else cache.read(cache_key)
+        if cached is not None:
+            with cached as fp:
+                output = BytesIO(fp.read())
+        else:
+            im_resp = get(url)
+            if im_resp.status_code != 200:
+                raise IOError('Failed to download image.')
+            output = BytesIO(im_resp.content)
+            if cache is not None:
+                cache.put(cache_key, output)
+                output.seek(0)
+        try:
+            output.name = 'texture.' + image_info(output).format
+        except ValueError:
+            output.name = 'texture.png'
         return output
 
 
-FileProp = namedtuple('FileProp', ['file', 'dtype'])
+FileProp = namedtuple('FileProp', ['file', 'dtype', 'encoding'])
+FileProp.__new__.__defaults__ = (None,)
+
+CHUNK_SIZE = 8388608
+RANGE_BLOCK_SIZE = 65536
+
+
+def serialized_nbytes(arr):
+    """Number of bytes arr takes once serialized with 4-byte values"""
+    return 4 * int(np.size(arr))
+
+
+def array_range(arr, block_size=RANGE_BLOCK_SIZE):
+    """Minimum and maximum of arr in a single pass over memory
+
+    The array is scanned in blocks of about `block_size` values, small
+    enough to stay in cache between the min and max reductions, without
+    flattening or copying it. Any NaN propagates to both results.
+    Empty arrays raise ValueError, as np.min does.
+    """
+    if not isinstance(arr, LazyArray):
+        arr = np.asarray(arr)
+    if arr.ndim == 0 or arr.size == 0:
+        return np.asarray(arr).min(), np.asarray(arr).max()
+    lo = hi = None
+    for block in _blocks(arr, block_size):
+        block_lo, block_hi = block.min(), block.max()
+        lo = block_lo if lo is None else np.minimum(lo, block_lo)
+        hi = block_hi if hi is None else np.maximum(hi, block_hi)
+    return lo, hi
+
+
+def check_cast(arr, dtype, block_size=RANGE_BLOCK_SIZE):
+    """Raise ValueError unless arr converts to dtype without changing
+    its values
+
+    Integers must be within the range of dtype. Finite floats must be
+    within its largest magnitude; NaN and infinity are kept as they
+    are, and rounding to the lower precision is allowed. The array is
+    scanned in blocks, as in array_range.
+    """
+    dtype = np.dtype(dtype)
+    if not isinstance(arr, LazyArray):
+        arr = np.asarray(arr)
+    if arr.size == 0:
+        return
+    if arr.ndim == 0:
+        arr = np.atleast_1d(arr)
+    if dtype.kind == 'f':
+        limit = np.finfo(dtype).max
+        for block in _blocks(arr, block_size):
+            block = block[np.isfinite(block)]
+            if len(block) > 0 and np.abs(block).max() > limit:
+                raise ValueError(
+                    'Array values must be within +/-{:g} to be sent as '
+                    '{}, not {:g}'.format(limit, dtype,
+                                          block[np.abs(block).argmax()])
+                )
+    else:
+        lo, hi = array_range(arr, block_size)
+        info = np.iinfo(dtype)
+        if lo < info.min or hi > info.max:
+            raise ValueError(
+                'Array values must be within {} to {} to be sent as {}, '
+                'not {} to {}'.format(info.min, info.max, dtype, lo, hi)
+            )
+
+
+def _blocks(arr, block_size):
+    """Blocks of whole rows of about block_size values"""
+    rows = max(1, block_size // max(arr.size // len(arr), 1))
+    if isinstance(arr, LazyArray):
+        return arr.iter_chunks(rows)
+    return (arr[start:start + rows] for start in range(0, len(arr), rows))
+
+
+class ArrayStream(object):
+    """Read-only file-like object serializing an array one chunk at a time
+
+    Rows of the array are cast to `dtype` as they are read, so at most
+    one chunk of converted data (about `chunk_size` bytes) is held in
+    memory. Bytes are produced in C order, the same as `ndarray.tofile`.
+    Use check_cast first to make sure the conversion is lossless.
+    """
+
+    def __init__(self, data, dtype, chunk_size=CHUNK_SIZE, name='array.dat'):
+        if isinstance(data, LazyArray):
+            self.data = data.resolve()
+        else:
+            self.data = np.atleast_1d(data)
+        self.dtype = np.dtype(dtype)
+        self.name = name
+        self.closed = False
+        self._row_size = self.dtype.itemsize * int(
+            np.prod(self.data.shape[1:])
+        )
+        self._rows = max(1, chunk_size // max(self._row_size, 1))
+        self._nbytes = int(np.prod(self.data.shape)) * self.dtype.itemsize
+        self.seek(0)
+
+    def __len__(self):
+        return self._nbytes
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._nbytes
+        offset = min(max(offset, 0), self._nbytes)
+        row = offset // self._row_size if self._row_size else 0
+        self._row = row
+        self._position = row * self._row_size
+        self._buffer = np.zeros(0, dtype=np.uint8)
+        self.read(offset - self._position)
+        return self._position
+
+    def _next_chunk(self):
+        """Convert the next block of rows into the byte buffer"""
+        if self._row >= len(self.data):
+            return False
+        chunk = np.asarray(self.data[self._row:self._row + self._rows])
+        self._row += self._rows
+        converted = np.array(chunk, dtype=self.dtype, order='C')
+        self._buffer = converted.reshape(-1).view(np.uint8)
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._nbytes - self._position
+        pieces = []
+        while size > 0:
+            if len(self._buffer) == 0 and not self._next_chunk():
+                break
+            piece = self._buffer[:size]
+            self._buffer = self._buffer[len(piece):]
+            self._position += len(piece)
+            size -= len(piece)
+            pieces.append(piece.tobytes())
+        return b''.join(pieces)
+
+    def close(self):
+        self.closed = True
+        self.data = None
+        self._buffer = np.zeros(0, dtype=np.uint8)
 
 
 class Array(Steno3DTrait, tr.TraitType):
-    """A trait for serializable float or int arrays"""
+    """A trait for serializable float or int arrays
+
+    numpy arrays are stored as read-only views that share memory with
+    the array given, without a copy; other sequences are converted to
+    read-only arrays. Changing the original array in place changes the
+    resource too, but is not detected: to upload the change, assign the
+    array to the trait again.
+    """
 
     def __init__(self, shape=('*',), dtype=(float, int), **metadata):
         if not isinstance(shape, tuple):
@@ -413,9 +669,12 @@ class Array(Steno3DTrait, tr.TraitType):
         super(Array, self).__init__(**metadata)
 
     def info(self):
-        return 'a list or numpy array of {type} with shape {shp}'.format(
-            type=', '.join([str(t) for t in self.dtype]),
-            shp=self.shape
+        return (
+            'a list, numpy array or LazyArray source of {type} with '
+            'shape {shp}'.format(
+                type=', '.join([str(t) for t in self.dtype]),
+                shp=self.shape
+            )
         )
 
     @property
@@ -428,9 +687,21 @@ class Array(Steno3DTrait, tr.TraitType):
 
     def validate(self, obj, value):
         """Determine if array is valid based on shape and dtype"""
-        if not isinstance(value, (list, np.ndarray)):
+        if isinstance(value, string_types) or (
+                not isinstance(value, (np.ndarray, LazyArray)) and
+                (callable(value) or LazyArray.is_source(value))):
+            try:
+                value = LazyArray(value)
+            except Exception:
+                self.error(obj, value)
+        if not isinstance(value, (list, np.ndarray, LazyArray)):
             self.error(obj, value)
-        value = np.array(value)
+        if not isinstance(value, (np.memmap, LazyArray)):
+            # A read-only view checks and stores the array without
+            # copying its data, and without letting it change through
+            # the resource
+            value = np.asarray(value).view()
+            value.flags.writeable = False
         if (value.dtype.kind == 'i' and
                 len(set(self.dtype).intersection(integer_types)) == 0):
             self.error(obj, value)
@@ -443,39 +714,135 @@ class Array(Steno3DTrait, tr.TraitType):
                 self.error(obj, value)
         return value
 
+    def set(self, obj, value):
+        # Same as TraitType.set, but a changed array always notifies
+        # rather than comparing old and new elementwise into a temporary
+        # boolean array
+        new_value = self._validate(obj, value)
+        try:
+            old_value = obj._trait_values[self.name]
+        except KeyError:
+            old_value = self.default_value
+        obj._trait_values[self.name] = new_value
+        if new_value is not old_value:
+            obj._notify_trait(self.name, old_value, new_value)
+
     def serialize(self, data):
-        """Convert the array data to a serialized binary format"""
-        if isinstance(data.flatten()[0], np.floating):
+        """Convert the array data to a serialized binary format
+
+        The returned file streams little-endian bytes in bounded chunks
+        rather than writing a converted copy of the whole array. Values
+        that do not fit the serialized type raise ValueError here,
+        before any of them are sent.
+        """
+        if data.dtype.kind == 'f':
             use_dtype = '<f4'
-            nan_mask = ~np.isnan(data)
-            assert np.allclose(
-                    data.astype(use_dtype)[nan_mask], data[nan_mask]), \
-                'Converting the type should not screw things up.'
-        elif isinstance(data.flatten()[0], np.integer):
+        elif data.dtype.kind in ('i', 'u'):
             use_dtype = '<i4'
-            assert (data.astype(use_dtype) == data).all(), \
-                'Converting the type should not screw things up.'
         else:
             raise Exception('Must be a float or an int: {}'.format(data.dtype))
-
-        data_file = NamedTemporaryFile('rb+', suffix='.dat')
-        data.astype(use_dtype).tofile(data_file.file)
-        data_file.seek(0)
-        return FileProp(data_file, use_dtype)
+        check_cast(data, use_dtype)
+        return FileProp(ArrayStream(data, use_dtype), use_dtype)
 
     @classmethod
-    def download(cls, url, shape, dtype=float):
-        arr_resp = get(url)
+    def download(cls, url, shape, dtype=float, memmap_dir=None,
+                 cache_key=None, encoding=None):
+        """Download a serialized array without a temporary file
+
+        By default the response is streamed directly into a preallocated
+        array. If `memmap_dir` is given, the array is written to a new
+        file in that directory and returned as a copy-on-write np.memmap,
+        so it is never held in memory all at once.
+
+        If `cache_key` is given and the download cache is enabled, the
+        array is read from the cache when present and saved to it
+        otherwise.
+
+        If `encoding` is given, the payload is compressed (see
+        steno3d.compression) and is decoded frame by frame as it streams
+        in; the cache holds the decoded array.
+        """
+        dtype = np.dtype(dtype)
+        cache = None if cache_key is None else get_cache()
+        if cache is not None:
+            arr = cls._load_cached(cache, cache_key, shape, dtype,
+                                   memmap_dir)
+            if arr is not None:
+                return arr
+        arr = cls._download(url, shape, dtype, memmap_dir, encoding)
+        if cache is not None:
+            cache.put(cache_key, ArrayStream(arr, dtype))
+        return arr
+
+    @staticmethod
+    def _load_cached(cache, key, shape, dtype, memmap_dir):
+        """Read a cached array, copying it into memmap_dir if given
+
+        Returns None on a miss, or if the cached size does not match
+        shape and dtype.
+        """
+        fileobj = cache.read(key)
+        if fileobj is None:
+            return None
+        with fileobj:
+            shape = tuple(int(n) for n in np.atleast_1d(shape))
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            if fstat(fileobj.fileno()).st_size != nbytes:
+                return None
+            if memmap_dir is None or nbytes == 0:
+                return np.fromfile(fileobj, dtype).reshape(shape)
+            local = path.join(memmap_dir, uuid4().hex + '.dat')
+            with open(local, 'wb') as out:
+                copyfileobj(fileobj, out)
+        return np.memmap(local, dtype, 'c', shape=shape)
+
+    @staticmethod
+    def _download(url, shape, dtype, memmap_dir, encoding=None):
+        arr_resp = get(url, stream=True)
         if arr_resp.status_code != 200:
             raise IOError('Failed to download array.')
-        data_file = NamedTemporaryFile()
-        for chunk in arr_resp:
-            data_file.write(chunk)
-        data_file.seek(0)
-        arr = np.fromfile(data_file.file, dtype).reshape(shape)
-        data_file.close()
+        if memmap_dir is None or np.prod(shape) == 0:
+            memmap_dir = None
+            arr = np.empty(shape, dtype)
+        else:
+            filename = path.join(memmap_dir, uuid4().hex + '.dat')
+            arr = np.memmap(filename, dtype, 'w+', shape=shape)
+        chunks = arr_resp.iter_content(CHUNK_SIZE)
+        if encoding is not None:
+            chunks = (block.view(np.uint8) for block in
+                      decode_stream(chunks, dtype, encoding))
+        try:
+            Array._fill(arr, chunks)
+        except Exception:
+            # Leave no partial file behind in memmap_dir
+            if memmap_dir is not None:
+                del arr
+                try:
+                    remove(filename)
+                except OSError:
+                    pass
+            raise
+        finally:
+            arr_resp.close()
+        if memmap_dir is not None:
+            arr.flush()
+            del arr
+            arr = np.memmap(filename, dtype, 'c', shape=shape)
         return arr
 
+    @staticmethod
+    def _fill(arr, chunks):
+        """Copy the bytes of chunks into arr, which they must fill"""
+        buff = arr.reshape(-1).view(np.uint8)
+        offset = 0
+        for chunk in chunks:
+            if offset + len(chunk) > buff.size:
+                raise IOError('Downloaded array is larger than expected.')
+            buff[offset:offset + len(chunk)] = np.frombuffer(chunk, np.uint8)
+            offset += len(chunk)
+        if offset != buff.size:
+            raise IOError('Downloaded array is smaller than expected.')
+
 
 class Vector(Array):
     """A trait for 3D vectors
@@ -538,6 +905,16 @@ class KeywordInstance(Steno3DTrait, tr.Instance):
         except KeyError:
             return super(KeywordInstance, self)._resolve_string(string)
 
+    def get(self, obj, cls=None):
+        value = super(KeywordInstance, self).get(obj, cls)
+        # Dynamic defaults are created here without a change event, so
+        # they are registered for dirty tracking on first access
+        if (isinstance(obj, HasSteno3DTraits) and
+                isinstance(value, HasSteno3DTraits) and
+                self.name not in obj._backref_traits):
+            obj._adopt(self.name, value)
+        return value
+
     def validate(self, obj, value):
         if isinstance(value, self.klass):
             return value
@@ -6,17 +6,18 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from json import dumps
-from numpy import ndarray
+from numpy import asarray, ndarray
 from six import string_types
 from traitlets import validate
 
 from .base import BaseMesh
 from .base import CompositeResource
 from .data import DataArray
+from .lazy import LazyArray
 from .options import ColorOptions
 from .options import MeshOptions
 from .traits import (Array, HasSteno3DTraits, KeywordInstance, Repeated,
-                     String, Vector)
+                     String, Vector, serialized_nbytes)
 
 
 class _Mesh3DOptions(MeshOptions):
@@ -73,8 +74,8 @@ class Mesh3DGrid(BaseMesh):
             if getattr(self, arr, None) is None:
                 return 0
             arr = getattr(self, arr)
-        if isinstance(arr, ndarray):
-            return arr.astype('f4').nbytes
+        if isinstance(arr, (ndarray, LazyArray)):
+            return serialized_nbytes(arr)
         raise ValueError('Mesh3DGrid cannot calculate the number of '
                          'bytes of {}'.format(arr))
 
@@ -83,17 +84,17 @@ class Mesh3DGrid(BaseMesh):
         dirty = self._dirty_traits
         if force or ('h1' in dirty or 'h2' in dirty or 'h3' in dirty):
             datadict['tensors'] = dumps(dict(
-                h1=self.h1.tolist(),
-                h2=self.h2.tolist(),
-                h3=self.h3.tolist()
+                h1=asarray(self.h1).tolist(),
+                h2=asarray(self.h2).tolist(),
+                h3=asarray(self.h3).tolist()
             ))
         if force or ('h1' in dirty or 'h2' in dirty or 'h3' in dirty or
                      'x0' in dirty):
             datadict['OUVZ'] = dumps(dict(
                 O=self.x0.tolist(),
-                U=[self.h1.sum().astype(float), 0, 0],
-                V=[0, self.h2.sum().astype(float), 0],
-                Z=[0, 0, self.h3.sum().astype(float)]
+                U=[asarray(self.h1).sum().astype(float), 0, 0],
+                V=[0, asarray(self.h2).sum().astype(float), 0],
+                Z=[0, 0, asarray(self.h3).sum().astype(float)]
             ))
         return datadict
 
@@ -154,6 +155,19 @@ class Volume(CompositeResource):
                 proposal['owner'].mesh.nC if dat.location == 'CC'
                 else proposal['owner'].mesh.nN
             )
+            grid_shape = dat.data.grid_shape
+            if dat.location == 'CC' and grid_shape is not None:
+                mesh = proposal['owner'].mesh
+                mesh_shape = (len(mesh.h1), len(mesh.h2), len(mesh.h3))
+                if tuple(grid_shape) != mesh_shape:
+                    raise ValueError(
+                        'volume.data[{index}] grid shape {grid} does not '
+                        'match mesh shape {mesh}'.format(
+                            index=ii,
+                            grid=grid_shape,
+                            mesh=mesh_shape
+                        )
+                    )
             if len(dat.data.array) != valid_length:
                 raise ValueError(
                     'volume.data[{index}] length {datalen} does not match '
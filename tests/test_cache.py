@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+from steno3d.cache import DownloadCache
+
+
+class TestDownloadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_revision_ignores_url_signatures(self):
+        json_a = {'vertices': 'https://s3/a.dat?Signature=1', 'title': 'a'}
+        json_b = {'vertices': 'https://s3/a.dat?Signature=2', 'title': 'a'}
+        json_c = {'vertices': 'https://s3/b.dat?Signature=1', 'title': 'a'}
+        rev = DownloadCache.revision
+        assert rev(json_a) == rev(json_b)
+        assert rev(json_a) != rev(json_c)
+
+    def test_put_read_evict(self):
+        cache = DownloadCache(self.directory, max_size=25)
+        assert cache.read('a') is None
+        with open(cache.put('a', BytesIO(b'a' * 10)), 'rb') as fp:
+            assert fp.read() == b'a' * 10
+        cache.put('b', BytesIO(b'b' * 10))
+        os.utime(os.path.join(self.directory, 'a.dat'), (1, 1))
+        os.utime(os.path.join(self.directory, 'b.dat'), (2, 2))
+        # Reading a marks it as the most recently used
+        cache.read('a').close()
+        cache.put('c', BytesIO(b'c' * 10))
+        assert cache.size == 20
+        assert cache.read('b') is None
+        cache.clear()
+        assert cache.size == 0
+
+    def test_read_survives_eviction(self):
+        cache = DownloadCache(self.directory)
+        assert cache.read('a') is None
+        cache.put('a', BytesIO(b'a' * 10))
+        fileobj = cache.read('a')
+        cache.clear()
+        with fileobj:
+            assert fileobj.read() == b'a' * 10
+        assert cache.read('a') is None
+
+
+if __name__ == '__main__':
+    unittest.main()
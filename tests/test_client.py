@@ -0,0 +1,572 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import email
+import json
+import os
+import shutil
+import struct
+import tempfile
+from base64 import b64encode
+from hashlib import md5
+import threading
+import unittest
+from io import BytesIO
+
+import numpy as np
+import requests
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs
+
+import steno3d
+from steno3d import cache, client
+from steno3d.client import Comms
+from steno3d.data import DataArray
+from steno3d.point import Mesh0D
+from steno3d.traits import Array, FileProp, Image
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive stand-in for the steno3d API"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path.startswith('/api/upload/') and self.command == 'PUT':
+            return self._upload_part(body)
+        if self.path in self.server.payloads:
+            with self.server.lock:
+                self.server.payload_gets.append(self.path)
+            return self._send(200, self.server.payloads[self.path])
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.paths.append(self.path)
+            self.server.last_request = (self.headers.get('Content-Type'),
+                                        body)
+            status = (self.server.failures.pop(0)
+                      if self.server.failures else 200)
+            if self.path in self.server.fail_paths:
+                status = 400
+        if self.path.startswith('/api/upload/'):
+            parts = self.server.uploads[self.path.split('/')[-1]]
+            self._send(status, {'parts': {
+                index: b64encode(md5(part).digest()).decode('utf-8')
+                for index, part in parts.items()
+            }})
+        elif self.path == '/api/upload':
+            with self.server.lock:
+                upload_uid = 'u' * 19 + str(len(self.server.uploads))
+                self.server.uploads[upload_uid] = {}
+            self._send(status, {'uid': upload_uid})
+        else:
+            self._send(status, {'uid': 'a' * 20,
+                                'longUid': 'resource/' + 'a' * 20})
+
+    def _upload_part(self, body):
+        _, _, _, upload_uid, index = self.path.split('/')
+        with self.server.lock:
+            self.server.part_puts.append(int(index))
+            if int(index) in self.server.drop_parts:
+                self.server.drop_parts.remove(int(index))
+                self.close_connection = True
+                return
+        checksum = b64encode(md5(body).digest()).decode('utf-8')
+        if checksum != self.headers.get('Content-MD5'):
+            return self._send(400, {'reason': 'checksum mismatch'})
+        self.server.uploads[upload_uid][index] = body
+        self._send(200, {})
+
+    def _send(self, status, content):
+        if isinstance(content, bytes):
+            body, content_type = content, 'application/octet-stream'
+        else:
+            body = json.dumps(content).encode('utf-8')
+            content_type = 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+    do_PUT = _respond
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.failures = []
+        self.last_request = None
+        self.uploads = {}
+        self.part_puts = []
+        self.drop_parts = []
+        self.payloads = {}
+        self.payload_gets = []
+        self.paths = []
+        self.fail_paths = []
+
+    def last_form(self):
+        """Parse the last form request body into a dict"""
+        content_type, body = self.last_request
+        if content_type == 'application/x-www-form-urlencoded':
+            return {key.decode('utf-8'): value[0] for key, value
+                    in parse_qs(body).items()}
+        msg = email.message_from_bytes(
+            b'Content-Type: ' + content_type.encode('utf-8') +
+            b'\r\n\r\n' + body
+        )
+        return {part.get_param('name', header='content-disposition'):
+                part.get_payload(decode=True)
+                for part in msg.get_payload()}
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server_address[1])
+
+
+class TestCommsSession(unittest.TestCase):
+
+    n_calls = 50
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.old_url = Comms.base_url
+        Comms.base_url = self.server.url
+        Comms._reset_session()
+
+    def tearDown(self):
+        Comms._reset_session()
+        Comms.base_url = self.old_url
+        Comms.configure(retries=3, backoff_factor=.5, chunk_size=0,
+                        delta_uploads=False, compression=False)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _upload(self, post):
+        for i in range(self.n_calls):
+            post('api/resource/mesh2d', data={'title': str(i)},
+                 files={'vertices': FileProp(BytesIO(b'\0' * 1024), '<f4')})
+
+    def test_connection_reuse(self):
+        # Before: module-level requests open a new connection per call
+        def unpooled_post(url, data, files):
+            requests.post(self.server.url + url, data=data,
+                          files={k: v.file for k, v in files.items()})
+
+        self._upload(unpooled_post)
+        assert self.server.requests == self.n_calls
+        assert self.server.connections == self.n_calls
+
+        # After: the Comms session keeps a single connection alive
+        self.server.connections = 0
+        self._upload(Comms.post)
+        assert self.server.requests == 2 * self.n_calls
+        assert self.server.connections == 1
+
+    def test_streamed_array_upload(self):
+        arr = np.random.rand(100000, 3)
+        Comms.post('api/resource/mesh2d', data={'title': 'streamed'},
+                   files={'vertices': Array().serialize(arr)})
+        form = self.server.last_form()
+        assert form['title'] == b'streamed'
+        assert form['verticesType'] == b'<f4'
+        assert np.array_equal(
+            np.frombuffer(form['vertices'], '<f4').reshape(arr.shape),
+            arr.astype('<f4')
+        )
+
+    def test_retry_on_server_error(self):
+        Comms.configure(retries=2, backoff_factor=0)
+        self.server.failures = [503, 502]
+        resp = Comms.put('api/resource/mesh2d/' + 'a' * 20, data={'a': 1})
+        assert resp['status_code'] == 200
+        assert self.server.requests == 3
+
+        self.server.failures = [500, 500, 500]
+        resp = Comms.put('api/resource/mesh2d/' + 'a' * 20, data={'a': 1})
+        assert resp['status_code'] == 500
+
+    def test_resumable_chunked_upload(self):
+        Comms.configure(retries=1, backoff_factor=0, chunk_size=65536)
+        arr = np.random.rand(20000, 3)
+        # Part 3 is dropped on the first try and on the session's own
+        # retry, so the chunked upload has to resume
+        self.server.drop_parts = [3, 3]
+        Mesh0D()._client_upload(
+            Comms.post, 'api/resource/mesh0d', {'title': 'chunked'},
+            {'vertices': Array().serialize(arr)}
+        )
+        form = self.server.last_form()
+        assert form['title'] == b'chunked'
+        assert form['verticesType'] == b'<f4'
+        assert 'vertices' not in form
+        parts = self.server.uploads[form['verticesUpload'].decode('utf-8')]
+        assert len(parts) == 4
+        assert self.server.part_puts == [0, 1, 2, 3, 3, 3]
+        payload = b''.join(parts[str(i)] for i in range(4))
+        assert np.array_equal(
+            np.frombuffer(payload, '<f4').reshape(arr.shape),
+            arr.astype('<f4')
+        )
+
+    def _synced_data(self, sync):
+        data = DataArray(array=np.zeros(10))
+        data._upload_data = {'uid': 'a' * 20}
+        data._mark_clean()
+        data._sync = sync
+        return data
+
+    def test_batched_sync(self):
+        data = self._synced_data(1.)
+        for i in range(50):
+            data.title = 'step {}'.format(i)
+        data.array = np.ones(10)
+        assert self.server.requests == 0
+        assert data.flush(5)
+        assert self.server.requests == 1
+        form = self.server.last_form()
+        assert form['title'] == b'step 49'
+        assert 'array' in form
+        assert data._dirty == set()
+
+        data = self._synced_data(True)
+        with data.batch():
+            for i in range(50):
+                data.title = 'batch {}'.format(i)
+        assert data.flush(5)
+        assert self.server.requests == 2
+        assert self.server.last_form()['title'] == b'batch 49'
+
+    def test_delta_upload(self):
+        data = self._synced_data(False)
+        data._upload_data = None
+        data.array = np.random.rand(100000)
+        # The first upload hashes the file as it is sent
+        block_hashes = client.block_hashes
+        client.block_hashes = None
+        try:
+            data._upload(verbose=False)
+        finally:
+            client.block_hashes = block_hashes
+        assert self.server.requests == 1
+        assert data._file_hashes['array'] == (400000, block_hashes(
+            BytesIO(data.array.astype('<f4').tobytes())
+        ))
+
+        # Unchanged files are skipped
+        data.array = data.array.copy()
+        data._upload(verbose=False)
+        assert self.server.requests == 1
+
+        # Without server support, changed files are sent in full
+        array = data.array.copy()
+        array[10] = -1
+        data.array = array
+        data._upload(verbose=False)
+        assert self.server.requests == 2
+        assert len(self.server.last_form()['array']) == 400000
+
+        # With it, only the changed block is sent
+        Comms.configure(delta_uploads=True)
+        array = data.array.copy()
+        array[-1] = -1
+        data.array = array
+        data._upload(verbose=False)
+        assert self.server.requests == 3
+        form = self.server.last_form()
+        assert 'array' not in form
+        assert form['arrayDeltaBlocks'] == b'6'
+        assert np.array_equal(np.frombuffer(form['arrayDelta'], '<f4'),
+                              array[-(400000 - 6*65536)//4:].astype('<f4'))
+
+    def test_compressed_upload(self):
+        vertices = np.random.rand(300000, 3)
+        triangles = np.arange(600000).reshape(-1, 3) // 2
+        Comms.configure(compression='zlib')
+        Comms.post('api/resource/mesh2d', data={'title': 'compressed'},
+                   files={'vertices': Array().serialize(vertices),
+                          'triangles': Array().serialize(triangles)})
+        form = self.server.last_form()
+        assert form['verticesEncoding'] == b'shuffle-zlib'
+        assert form['trianglesEncoding'] == b'delta-shuffle-zlib'
+        assert len(form['triangles']) < triangles.size * 4 // 50
+
+        # Compressed payloads are decoded as they are downloaded
+        self.server.payloads['/vertices'] = form['vertices']
+        self.server.payloads['/triangles'] = form['triangles']
+        for name, arr in (('vertices', vertices), ('triangles', triangles)):
+            downloaded = Array.download(
+                self.server.url + name, arr.shape,
+                form[name + 'Type'].decode('utf-8'),
+                encoding=form[name + 'Encoding'].decode('utf-8')
+            )
+            assert np.array_equal(downloaded, arr.astype(downloaded.dtype))
+
+        # Chunked uploads are compressed before they are split
+        Comms.configure(chunk_size=65536)
+        data, files = Comms.chunk_files(
+            {}, {'triangles': Array().serialize(triangles)}
+        )
+        assert len(files) == 0
+        assert data['trianglesEncoding'] == 'delta-shuffle-zlib'
+        parts = self.server.uploads[data['trianglesUpload']]
+        assert b''.join(parts[str(i)] for i in range(len(parts))) == \
+            form['triangles']
+
+    def _project(self):
+        proj = steno3d.Project(title='concurrent')
+        for i in range(3):
+            steno3d.Surface(
+                proj, title='surface {}'.format(i),
+                mesh=steno3d.Mesh2D(vertices=np.random.rand(4, 3),
+                                    triangles=[[0, 1, 2], [1, 2, 3]]),
+                data=[dict(location='N',
+                           data=DataArray(array=np.random.rand(4)))]
+            )
+        steno3d.Line(proj, title='line',
+                     mesh=steno3d.Mesh1D(vertices=np.random.rand(3, 3),
+                                         segments=[[0, 1], [1, 2]]))
+        return proj
+
+    def test_concurrent_upload(self):
+        proj = self._project()
+        proj._upload_concurrent(False, False, 4)
+        paths = self.server.paths
+        assert len(paths) == 12
+        # Meshes and data, then composite resources, then the project
+        assert sorted(paths[:7]) == ['/api/resource/data/array'] * 3 + \
+            ['/api/resource/mesh1d'] + ['/api/resource/mesh2d'] * 3
+        assert sorted(paths[7:11]) == ['/api/resource/line'] + \
+            ['/api/resource/surface'] * 3
+        assert paths[11] == '/api/project/steno3d'
+        assert proj._upload_data is not None
+
+    def test_concurrent_upload_failure(self):
+        Comms.configure(retries=0)
+        proj = self._project()
+        self.server.fail_paths = ['/api/resource/line']
+        with self.assertRaises(Exception) as context:
+            proj._upload_concurrent(False, False, 4)
+        message = str(context.exception)
+        assert message.startswith('Upload failed for 1 of 4 resource(s)')
+        assert 'line: line' in message
+        # The other resources are uploaded; the project is not
+        paths = self.server.paths
+        assert paths.count('/api/resource/surface') == 3
+        assert '/api/project/steno3d' not in paths
+        assert all(res._upload_data is not None
+                   for res in proj.resources[:3])
+        assert getattr(proj.resources[3], '_upload_data', None) is None
+
+    def test_memmap_download(self):
+        directory = tempfile.mkdtemp()
+        try:
+            arr = np.random.rand(1000, 3)
+            self.server.payloads['/vertices'] = arr.astype('<f8').tobytes()
+            url = self.server.url + 'vertices'
+            downloaded = Array.download(url, arr.shape, memmap_dir=directory)
+            assert isinstance(downloaded, np.memmap)
+            assert downloaded.mode == 'c'
+            assert np.array_equal(downloaded, arr)
+            # The array is backed by a file left in memmap_dir
+            (file_name,) = os.listdir(directory)
+            assert os.path.getsize(os.path.join(directory, file_name)) == \
+                arr.nbytes
+            assert os.path.realpath(downloaded.filename) == \
+                os.path.realpath(os.path.join(directory, file_name))
+            # Copy-on-write: changes are not written back
+            downloaded[0] = -1
+            downloaded.flush()
+            assert np.array_equal(
+                np.fromfile(os.path.join(directory, file_name)),
+                arr.ravel()
+            )
+
+            self.assertRaises(IOError, lambda: Array.download(
+                url, (999, 3), memmap_dir=directory
+            ))
+            self.assertRaises(IOError, lambda: Array.download(
+                url, (1001, 3), memmap_dir=directory
+            ))
+            # Failed downloads leave no partial files
+            assert os.listdir(directory) == [file_name]
+
+            # Empty arrays are never memory-mapped
+            self.server.payloads['/empty'] = b''
+            empty = Array.download(self.server.url + 'empty', (0, 3),
+                                   memmap_dir=directory)
+            assert not isinstance(empty, np.memmap)
+            assert empty.shape == (0, 3)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertRaises(ValueError, lambda: steno3d.Project._build(
+            'a' * 20, memmap_dir=directory
+        ))
+
+    def _serve_project(self, n_points=3):
+        """Serve json and payloads of a project of points with data"""
+        def uid(prefix, index):
+            return prefix * 19 + str(index)
+
+        payloads = self.server.payloads
+        arrays = []
+        for i in range(n_points):
+            vertices = np.random.rand(5, 3).astype('<f4')
+            array = np.random.rand(5).astype('<f4')
+            arrays.append((vertices, array))
+            payloads['/vertices{}'.format(i)] = vertices.tobytes()
+            payloads['/array{}'.format(i)] = array.tobytes()
+            payloads['/api/resource/mesh0d/' + uid('m', i)] = {
+                'title': 'mesh', 'description': None, 'meta': {},
+                'vertices': self.server.url + 'vertices{}'.format(i),
+                'verticesSize': 60, 'verticesType': '<f4'
+            }
+            payloads['/api/resource/data/array/' + uid('d', i)] = {
+                'title': 'data', 'description': None, 'meta': {},
+                'order': 'c', 'array': self.server.url + 'array{}'.format(i),
+                'arraySize': 20, 'arrayType': '<f4'
+            }
+            payloads['/api/resource/point/' + uid('p', i)] = {
+                'title': 'point {}'.format(i), 'description': None,
+                'meta': {}, 'mesh': {'uid': 'ResourceMesh0D:' + uid('m', i)},
+                'data': [{'location': 'N',
+                          'uid': 'ResourceDataArray:' + uid('d', i)}]
+            }
+        payloads['/api/project/steno3d/' + uid('j', 0)] = {
+            'title': 'project', 'description': None, 'access': [],
+            'owner': {'uid': 'someone'}, 'perspectiveUids': [],
+            'resourceUids': ['ResourcePoint:' + uid('p', i)
+                             for i in range(n_points)]
+        }
+        return uid('j', 0), arrays
+
+    def test_parallel_download(self):
+        project_uid, arrays = self._serve_project()
+        calls = []
+
+        def progress(count, total, res):
+            calls.append((count, total, res._resource_class,
+                          threading.current_thread()))
+
+        proj = steno3d.Project._build(project_uid, workers=3,
+                                      progress=progress)
+        # Meshes and data, then the points in project order, all
+        # reported on the calling thread
+        assert [call[:2] for call in calls] == [(i, 9) for i in range(1, 10)]
+        assert sorted(call[2] for call in calls[:6]) == \
+            ['array'] * 3 + ['mesh0d'] * 3
+        assert [call[2] for call in calls[6:]] == ['point'] * 3
+        assert all(call[3] is threading.current_thread() for call in calls)
+        assert [res.title for res in proj.resources] == \
+            ['point 0', 'point 1', 'point 2']
+        for res, (vertices, array) in zip(proj.resources, arrays):
+            assert np.array_equal(res.mesh.vertices, vertices)
+            assert np.array_equal(res.data[0].data.array, array)
+
+        # The same project as a sequential download
+        sequential = steno3d.Project._build(project_uid)
+        for res, other in zip(proj.resources, sequential.resources):
+            assert res.title == other.title
+            assert np.array_equal(res.mesh.vertices, other.mesh.vertices)
+
+        # A failed resource is reported after the others are fetched
+        del self.server.payloads['/array1']
+        with self.assertRaises(IOError) as context:
+            steno3d.Project._build(project_uid, workers=3,
+                                   progress=lambda *args: None)
+        assert 'Download failed for 1 of 6' in str(context.exception)
+
+    def test_shared_children(self):
+        project_uid, _ = self._serve_project()
+        # Points 0 and 1 share a mesh
+        point = self.server.payloads['/api/resource/point/' + 'p' * 19 + '1']
+        point['mesh'] = {'uid': 'ResourceMesh0D:' + 'm' * 19 + '0'}
+        for workers in (None, 3):
+            proj = steno3d.Project._build(project_uid, workers=workers)
+            first, second, third = proj.resources
+            assert first.mesh is second.mesh
+            assert first.mesh is not third.mesh
+            assert len(first.mesh._parents) == 2
+            first.mesh._mark_clean()
+            first._mark_clean()
+            second._mark_clean()
+            first.mesh.vertices = np.zeros((5, 3))
+            assert first._dirty and second._dirty
+
+    def test_cached_download(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache.enable(directory)
+            arr = np.random.rand(100, 3)
+            self.server.payloads['/vertices'] = arr.astype('<f8').tobytes()
+            # Start of a JPEG with a baseline frame header
+            jpeg = (b'\xff\xd8\xff\xc0' +
+                    struct.pack('>HBHHB', 17, 8, 2, 2, 3) + b'\0' * 9)
+            self.server.payloads['/image'] = jpeg
+            json_v1 = {'longUid': 'resource/a', 'title': 'v1'}
+
+            def download(json):
+                return (
+                    Array.download(self.server.url + 'vertices', arr.shape,
+                                   cache_key=cache.cache_key(json,
+                                                             'vertices')),
+                    Image.download(self.server.url + 'image',
+                                   cache_key=cache.cache_key(json, 'image'))
+                )
+
+            # A miss downloads and saves, a hit reads from disk
+            for _ in range(2):
+                vertices, image = download(json_v1)
+                assert np.array_equal(vertices, arr)
+                assert image.read() == jpeg
+                assert image.name == 'texture.jpg'
+                assert self.server.payload_gets == ['/vertices', '/image']
+
+            # A new revision of the resource is downloaded again
+            download(dict(json_v1, title='v2'))
+            assert len(self.server.payload_gets) == 4
+
+            # Entries whose size does not match are misses, so the
+            # payload is downloaded again (and is too large here)
+            self.assertRaises(IOError, lambda: Array.download(
+                self.server.url + 'vertices', (50, 3),
+                cache_key=cache.cache_key(json_v1, 'vertices')
+            ))
+            assert len(self.server.payload_gets) == 5
+
+            # An evicted entry is a miss, not an error
+            cache.get_cache().clear()
+            vertices, _ = download(json_v1)
+            assert np.array_equal(vertices, arr)
+            assert len(self.server.payload_gets) == 7
+        finally:
+            cache.disable()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
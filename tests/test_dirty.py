@@ -0,0 +1,61 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+import steno3d
+
+
+class TestDirtyTracking(unittest.TestCase):
+
+    def setUp(self):
+        self.proj = steno3d.Project()
+        self.surfs = [
+            steno3d.Surface(
+                self.proj,
+                mesh=steno3d.Mesh2D(vertices=np.random.rand(3, 3),
+                                    triangles=[[0, 1, 2]]),
+                data=[dict(location='N',
+                           data=steno3d.DataArray(array=np.random.rand(3)))]
+            ) for _ in range(3)
+        ]
+        self.proj._mark_clean()
+
+    def test_mark_clean(self):
+        assert self.proj._dirty == set()
+        for surf in self.surfs:
+            assert surf._dirty == set()
+            assert surf.mesh._dirty == set()
+            assert surf.data[0].data._dirty == set()
+
+    def test_change_propagates_up(self):
+        self.surfs[1].data[0].data.array = np.random.rand(3)
+        assert self.surfs[1].data[0]._dirty == {'data'}
+        assert self.surfs[1]._dirty == {'data'}
+        assert self.proj._dirty == {'resources'}
+        assert self.proj._dirty_instances('resources') == [self.surfs[1]]
+        self.surfs[1].data[0].data._mark_clean(recurse=False)
+        assert self.surfs[1]._dirty == set()
+        assert self.proj._dirty == set()
+
+    def test_default_instance_propagates_up(self):
+        self.surfs[0].opts.opacity = .5
+        assert self.surfs[0]._dirty == {'opts'}
+        assert self.proj._dirty == {'resources'}
+
+    def test_replaced_child_is_released(self):
+        old_mesh = self.surfs[2].mesh
+        self.surfs[2].mesh = steno3d.Mesh2D(vertices=np.random.rand(3, 3),
+                                            triangles=[[0, 1, 2]])
+        self.proj._mark_clean()
+        old_mesh.vertices = np.random.rand(3, 3)
+        assert self.surfs[2]._dirty == set()
+        assert self.proj._dirty == set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from io import BytesIO
+
+import numpy as np
+import png
+from traitlets import TraitError
+
+import steno3d
+from steno3d.client import Comms
+from steno3d.imaging import (PILImage, encode_png, encode_texture,
+                             image_info, reduction_factor)
+from steno3d.tiling import half_image, map_image
+
+
+def png_file(pixels, **kwargs):
+    output = BytesIO()
+    png.Writer(pixels.shape[1], pixels.shape[0], **kwargs).write(
+        output, pixels.reshape(pixels.shape[0], -1)
+    )
+    output.seek(0)
+    return output
+
+
+def jpeg_header(width, height):
+    # Start of image, an APP0 segment and a baseline frame header
+    return (b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) +
+            b'JFIF\0\x01\x01\0\0\x01\0\x01\0\0' + b'\xff\xc0' +
+            struct.pack('>HBHHB', 17, 8, height, width, 3) + b'\0' * 9)
+
+
+class TestImaging(unittest.TestCase):
+
+    def setUp(self):
+        self.pixels = np.random.randint(0, 256, (80, 100, 3)).astype(
+            np.uint8
+        )
+        self._pixels = Comms.texture_pixels
+        self._jpeg = Comms.jpeg_textures
+
+    def tearDown(self):
+        Comms.texture_pixels = self._pixels
+        Comms.jpeg_textures = self._jpeg
+
+    def test_image_info(self):
+        info = image_info(png_file(self.pixels, greyscale=False))
+        assert info == ('png', 100, 80, False)
+        info = image_info(png_file(self.pixels[:, :, :2], greyscale=True,
+                                   alpha=True))
+        assert info == ('png', 100, 80, True)
+        info = image_info(BytesIO(jpeg_header(640, 480)))
+        assert info == ('jpg', 640, 480, False)
+        self.assertRaises(ValueError, lambda: image_info(BytesIO(b'GIF89a')))
+
+    def test_reduction_factor(self):
+        assert reduction_factor(100, 80, 8000) == 1
+        assert reduction_factor(100, 80, 1000) == 3
+        assert reduction_factor(20000, 20000, 4000000) == 10
+
+    def test_pass_through(self):
+        image = png_file(self.pixels, greyscale=False)
+        stream, fmt = encode_texture(image)
+        assert fmt == 'png'
+        assert stream.getvalue() is image.getvalue()
+        stream.close()
+        assert not image.closed
+        image = BytesIO(jpeg_header(640, 480))
+        stream, fmt = encode_texture(image, jpeg=True)
+        assert fmt == 'jpg'
+        assert stream.getvalue() is image.getvalue()
+
+    def test_downsample(self):
+        image = png_file(self.pixels, greyscale=False)
+        stream, fmt = encode_texture(image, max_pixels=1000)
+        assert fmt == 'png'
+        width, height, rows, _ = png.Reader(file=stream).asDirect()
+        assert width * height <= 1000
+        if PILImage is not None:
+            return
+        assert (width, height) == (34, 27)
+        rows = np.array([list(row) for row in rows]).reshape(27, 34, 3)
+        assert rows[0, 0, 0] == np.round(self.pixels[:3, :3, 0].mean())
+        assert rows[-1, -1, 2] == np.round(self.pixels[78:, 99:, 2].mean())
+
+    @unittest.skipIf(PILImage is not None, 'Pillow encodes JPEG')
+    def test_without_pillow(self):
+        image = png_file(self.pixels, greyscale=False)
+        stream, fmt = encode_texture(image, max_pixels=1000, jpeg=True)
+        assert fmt == 'png'
+        image = BytesIO(jpeg_header(640, 480))
+        self.assertRaises(ValueError, lambda: encode_texture(image))
+
+    @unittest.skipIf(PILImage is not None, 'Pillow converts JPEG')
+    def test_jpeg_texture_without_pillow(self):
+        def texture():
+            return steno3d.Texture2DImage(
+                O=[0., 0, 0], U=[1., 0, 0], V=[0., 1, 0],
+                image=BytesIO(jpeg_header(640, 480))
+            )
+
+        # Only a JPEG that can be sent as it is passes validation
+        Comms.jpeg_textures = False
+        self.assertRaises(TraitError, texture)
+        Comms.jpeg_textures = True
+        Comms.texture_pixels = 1000
+        self.assertRaises(TraitError, texture)
+        Comms.texture_pixels = None
+        tex = texture()
+        stream, fmt = tex._get_dirty_files(force=True)['image']
+        assert fmt == 'jpg'
+        assert stream.getvalue() == jpeg_header(640, 480)
+
+    def test_texture(self):
+        image = png_file(self.pixels, greyscale=False)
+        data = image.getvalue()
+        tex = steno3d.Texture2DImage(O=[0., 0, 0], U=[1., 0, 0],
+                                     V=[0., 1, 0], image=image)
+        assert tex.image.info == ('png', 100, 80, False)
+        assert tex.image.getvalue() is data
+        assert tex._nbytes() == len(data)
+        Comms.texture_pixels = None
+        stream = tex._get_dirty_files(force=True)['image'].file
+        assert stream.getvalue() is data
+        Comms.texture_pixels = 1000
+        stream, fmt = tex._get_dirty_files(force=True)['image']
+        assert fmt == 'png'
+        assert image_info(stream).width * image_info(stream).height <= 1000
+
+    def test_encode_png(self):
+        for pixels, bitdepth in ((self.pixels[:, :, :1], 8),
+                                 (self.pixels[:, :, :2], 8),
+                                 (self.pixels.astype(np.uint16) * 257, 16)):
+            width, height, rows, meta = png.Reader(
+                file=encode_png(pixels, bitdepth)
+            ).asDirect()
+            assert meta['planes'] == pixels.shape[2]
+            assert meta['bitdepth'] == bitdepth
+            rows = np.array([list(row) for row in rows])
+            assert np.array_equal(rows, pixels.reshape(80, -1))
+
+
+class TestTiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pixels = np.random.randint(0, 256, (50, 70, 3)).astype(
+            np.uint8
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_map_image(self):
+        image = png_file(self.pixels, greyscale=False)
+        pixels = map_image(image, self.directory)
+        assert isinstance(pixels, np.memmap)
+        assert np.array_equal(pixels, self.pixels)
+        file_name = os.path.join(self.directory, 'image.npy')
+        np.save(file_name, self.pixels[:, :, 0])
+        pixels = map_image(file_name)
+        assert isinstance(pixels, np.memmap)
+        assert pixels.shape == (50, 70, 1)
+        self.assertRaises(ValueError, lambda: map_image(np.zeros((2, 2))))
+        self.assertRaises(ValueError, lambda: map_image(np.zeros(2, 'u1')))
+        if PILImage is None:
+            self.assertRaises(ValueError,
+                              lambda: map_image(BytesIO(jpeg_header(4, 4))))
+
+    def test_half_image(self):
+        half = half_image(self.pixels)
+        assert half.shape == (25, 35, 3)
+        assert half[3, 4, 1] == np.round(self.pixels[6:8, 8:10, 1].mean())
+        half = half_image(half)
+        assert half.shape == (13, 18, 3)
+        # The last pixel covers a single 2 x 2 block of the image
+        assert half[-1, -1, 0] == np.round(self.pixels[48:, 68:, 0].mean())
+
+    def test_tiles(self):
+        tiles = steno3d.Texture2DImage.tiles(
+            self.pixels, O=[10., 20, 0], U=[70., 0, 0], V=[0., 50, 0],
+            tile_size=32, levels=3, workers=2, title='Ortho'
+        )
+        assert [len(level) for level in tiles] == [6, 2, 1]
+        top_left, bottom_right = tiles[0][0], tiles[0][-1]
+        assert top_left.title == 'Ortho'
+        assert np.allclose(top_left.O, [10., 38, 0])
+        assert np.allclose(top_left.U, [32., 0, 0])
+        assert np.allclose(top_left.V, [0., 32, 0])
+        assert np.allclose(bottom_right.O, [74., 20, 0])
+        assert np.allclose(bottom_right.U, [6., 0, 0])
+        assert np.allclose(bottom_right.V, [0., 18, 0])
+        width, height, rows, _ = png.Reader(
+            file=bottom_right.image
+        ).asDirect()
+        rows = np.array([list(row) for row in rows]).reshape(18, 6, 3)
+        assert np.array_equal(rows, self.pixels[32:, 64:])
+        assert np.allclose(tiles[2][0].O, [10., 20, 0])
+        assert np.allclose(tiles[2][0].U, [70., 0, 0])
+        assert image_info(tiles[2][0].image)[1:3] == (18, 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
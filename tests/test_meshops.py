@@ -0,0 +1,244 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+import steno3d
+from steno3d.meshops import (decimate_triangles, group_rows, kd_partition,
+                             optimize_cells, simplify_polylines, weld)
+
+
+class TestOptimize(unittest.TestCase):
+
+    def test_group_rows(self):
+        rows = np.array([[1., 2, 3], [0, 0, -0.], [1, 2, 3], [0, 0, 0]])
+        first, inverse = group_rows(rows)
+        assert np.array_equal(first, [0, 1])
+        assert np.array_equal(inverse, [0, 1, 0, 1])
+
+    def test_weld_tolerance(self):
+        vertices = np.array([[0., 0, 0], [1e-4, 0, 0], [1, 0, 0]])
+        assert len(weld(vertices)[0]) == 3
+        first, inverse = weld(vertices, tolerance=1e-2)
+        assert np.array_equal(first, [0, 2])
+        assert np.array_equal(inverse, [0, 0, 1])
+
+    def test_optimize_cells(self):
+        vertices = np.random.rand(1000, 3)
+        triangles = np.random.randint(0, 1000, (3000, 3))
+        # Duplicate every vertex, as a triangle soup does
+        soup = vertices[triangles.reshape(-1)]
+        cells = np.arange(len(soup)).reshape(-1, 3)
+        new_vertices, new_cells, node_index, cell_index = optimize_cells(
+            soup, cells
+        )
+        keep = ((triangles[:, 0] != triangles[:, 1]) &
+                (triangles[:, 1] != triangles[:, 2]) &
+                (triangles[:, 0] != triangles[:, 2]))
+        assert len(new_cells) == keep.sum()
+        assert len(new_vertices) == len(np.unique(triangles[keep]))
+        assert np.array_equal(np.sort(cell_index), np.flatnonzero(keep))
+        assert np.array_equal(new_vertices, soup[node_index])
+        assert np.array_equal(new_vertices[new_cells],
+                              soup[cells[cell_index]])
+
+    def test_surface_optimize(self):
+        proj = steno3d.Project()
+        vertices = np.array([[0., 0, 0], [1, 0, 0], [0, 1, 0],
+                             [1, 0, 0], [1, 1, 0], [5, 5, 5]])
+        triangles = np.array([[0, 1, 2], [3, 4, 2], [0, 3, 1]])
+        surf = steno3d.Surface(
+            proj,
+            mesh=steno3d.Mesh2D(vertices=vertices, triangles=triangles),
+            data=[
+                dict(location='N',
+                     data=steno3d.DataArray(array=np.arange(6.))),
+                dict(location='CC',
+                     data=steno3d.DataArray(array=np.arange(3.))),
+            ]
+        )
+        node_index, cell_index = surf.optimize()
+        assert surf.mesh.nN == 4
+        assert surf.mesh.nC == 2
+        assert np.array_equal(surf.data[0].data.array, node_index)
+        assert np.array_equal(surf.data[1].data.array, cell_index)
+        assert np.array_equal(surf.mesh.vertices[surf.mesh.triangles],
+                              vertices[triangles[cell_index]])
+        surf.validate()
+
+    def test_line_optimize(self):
+        proj = steno3d.Project()
+        line = steno3d.Line(
+            proj,
+            mesh=steno3d.Mesh1D(
+                vertices=[[0., 0, 0], [1, 0, 0], [1, 0, 0], [2, 0, 0]],
+                segments=[[0, 1], [2, 3], [3, 3]]
+            ),
+            data=[dict(location='CC',
+                       data=steno3d.DataArray(array=[1., 2, 3]))]
+        )
+        line.optimize(reorder=False)
+        assert np.array_equal(line.mesh.vertices,
+                              [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+        assert np.array_equal(line.mesh.segments, [[0, 1], [1, 2]])
+        assert np.array_equal(line.data[0].data.array, [1, 2])
+
+
+def height_field(n=40):
+    """Triangulated grid on a smooth bump"""
+    x, y = np.meshgrid(np.linspace(0, 1, n), np.linspace(0, 1, n),
+                       indexing='ij')
+    z = np.exp(-((x - .5)**2 + (y - .5)**2) * 8)
+    vertices = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+    index = np.arange(n * n).reshape(n, n)
+    a, b = index[:-1, :-1].ravel(), index[1:, :-1].ravel()
+    c, d = index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+    triangles = np.vstack([np.column_stack([a, b, c]),
+                           np.column_stack([a, c, d])])
+    return vertices, triangles
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_decimate_triangles(self):
+        vertices, triangles = height_field()
+        new_vertices, new_triangles, node_index, cell_index = \
+            decimate_triangles(vertices, triangles, 500)
+        assert 400 <= len(new_triangles) <= 500
+        assert new_triangles.max() == len(new_vertices) - 1
+        assert np.array_equal(np.unique(cell_index), np.sort(cell_index))
+        # The surface and its outline keep their shape
+        z = np.exp(-((new_vertices[:, 0] - .5)**2 +
+                     (new_vertices[:, 1] - .5)**2) * 8)
+        assert np.abs(new_vertices[:, 2] - z).max() < .05
+        assert np.allclose(new_vertices[:, :2].min(axis=0), 0)
+        assert np.allclose(new_vertices[:, :2].max(axis=0), 1)
+
+    def test_simplify_polylines(self):
+        x = np.linspace(0, 10, 1001)
+        vertices = np.column_stack([x, np.sin(x), np.zeros_like(x)])
+        segments = np.column_stack([np.arange(1000), np.arange(1, 1001)])
+        # A second, separate straight line
+        vertices = np.vstack([vertices, [[0, 5, 0], [1, 5, 0], [2, 5, 0]]])
+        segments = np.vstack([segments, [[1001, 1002], [1002, 1003]]])
+
+        new_vertices, new_segments, node_index, cell_index = \
+            simplify_polylines(vertices, segments, tolerance=.01)
+        assert 10 < len(new_segments) < 100
+        assert 1001 in node_index and 1002 not in node_index
+        assert np.array_equal(new_vertices, vertices[node_index])
+        assert np.array_equal(vertices[segments[cell_index, 0]],
+                              new_vertices[new_segments[:, 0]])
+
+        _, new_segments, _, _ = simplify_polylines(vertices, segments,
+                                                   target=20)
+        assert len(new_segments) == 20
+
+    def test_surface_decimate(self):
+        vertices, triangles = height_field()
+        proj = steno3d.Project()
+        surf = steno3d.Surface(
+            proj,
+            mesh=steno3d.Mesh2D(vertices=vertices, triangles=triangles),
+            data=[
+                dict(location='N',
+                     data=steno3d.DataArray(array=vertices[:, 2])),
+                dict(location='CC',
+                     data=steno3d.DataArray(array=np.arange(
+                         len(triangles), dtype=float
+                     ))),
+            ]
+        )
+        budget = surf._nbytes() // 4
+        node_index, cell_index = surf.decimate(max_bytes=budget)
+        assert surf._nbytes() <= budget
+        assert np.array_equal(surf.data[0].data.array,
+                              vertices[node_index, 2])
+        assert np.array_equal(surf.data[1].data.array, cell_index)
+        surf.validate()
+
+        surf.fit(file_size_limit=6000)
+        assert max(surf._file_sizes()) <= 6000
+        surf.validate()
+
+    def test_line_decimate(self):
+        x = np.linspace(0, 10, 1001)
+        proj = steno3d.Project()
+        line = steno3d.Line(
+            proj,
+            mesh=steno3d.Mesh1D(
+                vertices=np.column_stack([x, np.sin(x), np.zeros_like(x)]),
+                segments=np.column_stack([np.arange(1000),
+                                          np.arange(1, 1001)])
+            ),
+            data=[dict(location='N', data=steno3d.DataArray(array=x)),
+                  dict(location='CC',
+                       data=steno3d.DataArray(array=x[:-1]))]
+        )
+        node_index, cell_index = line.decimate(target=50)
+        assert line.mesh.nC == 50
+        assert np.array_equal(line.data[0].data.array, x[node_index])
+        assert np.array_equal(line.data[1].data.array, x[cell_index])
+        assert np.array_equal(line.data[0].data.array,
+                              line.mesh.vertices[:, 0])
+        line.validate()
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_kd_partition(self):
+        points = np.random.rand(1000, 3) * [10, 1, 1]
+        groups = kd_partition(points, lambda index: len(index) <= 100)
+        assert len(groups) == 16
+        assert np.array_equal(np.sort(np.concatenate(groups)),
+                              np.arange(1000))
+        # Groups are slabs along the long axis first
+        assert max(np.ptp(points[group, 0]) for group in groups) < 5
+
+    def test_partition_resources(self):
+        vertices, triangles = height_field(60)
+        proj = steno3d.Project()
+        surf = steno3d.Surface(
+            proj,
+            title='Surface',
+            opts=dict(color='red'),
+            mesh=steno3d.Mesh2D(vertices=vertices, triangles=triangles),
+            data=[
+                dict(location='N',
+                     data=steno3d.DataArray(title='z', array=vertices[:, 2])),
+                dict(location='CC',
+                     data=steno3d.DataArray(array=np.arange(
+                         len(triangles), dtype=float
+                     ))),
+            ]
+        )
+        point = steno3d.Point(
+            proj, mesh=steno3d.Mesh0D(vertices=np.random.rand(100, 3))
+        )
+        proj.partition_resources(20000)
+        pieces = proj.resources[:-1]
+        assert len(pieces) > 1
+        assert proj.resources[-1] is point
+        assert proj not in surf.project
+        assert sum(piece.mesh.nC for piece in pieces) == len(triangles)
+        for piece in pieces:
+            assert max(piece._file_sizes()) <= 20000
+            assert piece.title == 'Surface'
+            assert piece.opts.color == (255, 0, 0)
+            assert piece.data[0].data.title == 'z'
+            assert proj in piece.project
+            assert np.array_equal(piece.data[0].data.array,
+                                  piece.mesh.vertices[:, 2])
+            assert np.array_equal(
+                piece.mesh.vertices[piece.mesh.triangles],
+                vertices[triangles[piece.data[1].data.array.astype(int)]]
+            )
+        proj.validate()
+
+
+if __name__ == '__main__':
+    unittest.main()
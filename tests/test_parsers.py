@@ -0,0 +1,643 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+import png
+
+import steno3d
+from steno3d import meshfiles
+from steno3d.parsers import _build_payload, _parse_payloads, _payload
+from steno3d.textio import GrowableArray, iter_chunks, map_file, numbers
+
+
+CUBE_VERTICES = np.array([[0., 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                          [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
+CUBE_QUADS = np.array([[0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4],
+                       [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7]])
+
+
+class TestMeshParsers(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as fileobj:
+            fileobj.write(content)
+        return file_name
+
+    def check_cube(self, surface):
+        assert surface.mesh.nC == 12
+        corners = surface.mesh.vertices[surface.mesh.triangles]
+        # Each quad splits into two triangles with the same corners
+        for quad in range(6):
+            found = np.unique(corners[2*quad:2*quad + 2].reshape(-1, 3),
+                              axis=0)
+            expected = np.unique(CUBE_VERTICES[CUBE_QUADS[quad]], axis=0)
+            assert np.array_equal(found, expected)
+        surface.validate()
+
+    def test_obj(self):
+        lines = ['# cube', 'o cube']
+        lines += ['v {} {} {}'.format(*v) for v in CUBE_VERTICES]
+        lines += ['vt 0 0', 'vn 0 0 1', '']
+        lines += ['f ' + ' '.join('{0}/1/1'.format(i + 1) for i in quad)
+                  for quad in CUBE_QUADS[:3]]
+        # Negative indices count back from the last vertex
+        lines += ['f ' + ' '.join(str(i - 8) for i in quad)
+                  for quad in CUBE_QUADS[3:]]
+        lines += ['l 1 2 3']
+        file_name = self.write('cube.obj', '\n'.join(lines).encode())
+        (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+        surface, line = proj.resources
+        assert surface.title == 'cube'
+        self.check_cube(surface)
+        assert np.array_equal(line.mesh.segments, [[0, 1], [1, 2]])
+
+        bad = self.write('bad.obj', b'v 0 0 0\nv 1 1 x\n')
+        self.assertRaises(steno3d.parsers.ParseError,
+                          steno3d.parsers.obj(bad).parse)
+        bad = self.write('bad2.obj', b'v 0 0 0\nf 1 2 3\n')
+        self.assertRaises(steno3d.parsers.ParseError,
+                          steno3d.parsers.obj(bad).parse)
+
+    def ply_header(self, fmt, face_type='int'):
+        return '\n'.join([
+            'ply', 'format {} 1.0'.format(fmt), 'comment cube',
+            'element vertex 8', 'property float x', 'property float y',
+            'property float z', 'property uchar red',
+            'element face 6',
+            'property list uchar {} vertex_indices'.format(face_type),
+            'property float quality', 'end_header', ''
+        ]).encode()
+
+    def test_ply_ascii(self):
+        body = ['{} {} {} {}'.format(x, y, z, i * 10)
+                for i, (x, y, z) in enumerate(CUBE_VERTICES)]
+        body += ['4 {} {} {} {} {}'.format(*(list(q) + [i]))
+                 for i, q in enumerate(CUBE_QUADS)]
+        file_name = self.write(
+            'cube.ply', self.ply_header('ascii') + '\n'.join(body).encode()
+        )
+        (proj,) = steno3d.parsers.ply(file_name).parse()
+        surface = proj.resources[0]
+        self.check_cube(surface)
+        node, cell = surface.data
+        assert node.data.title == 'red'
+        assert np.array_equal(node.data.array, np.arange(8) * 10)
+        assert cell.data.title == 'quality'
+        assert np.array_equal(cell.data.array, np.repeat(np.arange(6), 2))
+
+    def test_ply_binary(self):
+        for fmt, endian in (('binary_little_endian', '<'),
+                            ('binary_big_endian', '>')):
+            body = b''.join(struct.pack(endian + 'fffB', *(list(v) + [i]))
+                            for i, v in enumerate(CUBE_VERTICES))
+            # A triangle among the quads needs a second run
+            faces = [list(q) for q in CUBE_QUADS]
+            faces[3:4] = [faces[3][:3], [faces[3][0]] + faces[3][2:]]
+            body += b''.join(
+                struct.pack(endian + 'B{}if'.format(len(f)), len(f),
+                            *(f + [i]))
+                for i, f in enumerate(faces)
+            )
+            header = self.ply_header(fmt).replace(b'face 6', b'face 7')
+            file_name = self.write('cube.ply', header + body)
+            (proj,) = steno3d.parsers.ply(file_name).parse()
+            surface = proj.resources[0]
+            self.check_cube(surface)
+            assert np.array_equal(surface.data[1].data.array,
+                                  [0, 0, 1, 1, 2, 2, 3, 4, 5, 5, 6, 6])
+
+    def stl_triangles(self):
+        triangles = []
+        for quad in CUBE_QUADS:
+            triangles += [quad[[0, 1, 2]], quad[[0, 2, 3]]]
+        return CUBE_VERTICES[np.array(triangles)]
+
+    def test_stl_ascii(self):
+        lines = []
+        for name in ('first', 'second'):
+            lines.append('solid ' + name)
+            for corners in self.stl_triangles():
+                lines += ['  facet normal 0 0 0', '    outer loop']
+                lines += ['      vertex {} {} {}'.format(*c)
+                          for c in corners]
+                lines += ['    endloop', '  endfacet']
+            lines.append('endsolid ' + name)
+        file_name = self.write('cube.stl', '\n'.join(lines).encode())
+        (proj,) = steno3d.parsers.stl(file_name).parse()
+        assert [res.title for res in proj.resources] == ['first', 'second']
+        for surface in proj.resources:
+            assert surface.mesh.nN == 8
+            self.check_cube(surface)
+
+    def test_stl_binary(self):
+        triangles = self.stl_triangles()
+        body = b''.join(struct.pack('<12fH', *(
+            [0., 0, 0] + list(corners.reshape(-1)) + [0]
+        )) for corners in triangles)
+        file_name = self.write(
+            'cube.stl',
+            b'solid-looking header'.ljust(80) +
+            struct.pack('<I', len(triangles)) + body
+        )
+        (proj,) = steno3d.parsers.stl(file_name).parse(weld=False)
+        surface = proj.resources[0]
+        assert surface.mesh.nN == 36
+        self.check_cube(surface)
+
+    def test_external_precedence(self):
+        file_name = self.write('cube.obj', b'v 0 0 0\n')
+        builtin = meshfiles.obj
+        assert steno3d.parsers.AllParsers._parser_class(file_name) is \
+            builtin
+        try:
+            # A parser package with a parser of the same name, imported
+            # after the extensions were mapped, takes precedence
+            class obj(steno3d.parsers.BaseParser):
+                extensions = ('obj',)
+
+                def parse(self, project=None, **kwargs):
+                    return (steno3d.Project(title='external'),)
+
+            assert steno3d.parsers.obj is obj
+            (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+            assert proj.title == 'external'
+            # Built-in parsers still handle other extensions
+            assert steno3d.parsers.AllParsers._parser_class(
+                self.write('cube.stl', b'')
+            ) is meshfiles.stl
+        finally:
+            steno3d.parsers.obj = builtin
+            steno3d.parsers._BUILTIN_PARSERS['obj'] = builtin
+            steno3d.parsers.AllParsers.extensions = None
+        assert steno3d.parsers.AllParsers._parser_class(file_name) is \
+            builtin
+
+
+class TestGeoParsers(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as fileobj:
+            fileobj.write(content)
+        return file_name
+
+    def test_gocad(self):
+        lines = ['GOCAD TSurf 1', 'HEADER {', 'name:Top surface', '}',
+                 'ZPOSITIVE Depth', 'PROPERTIES grade', 'TFACE']
+        lines += ['PVRTX {} {} {} {} {}'.format(i + 10, x, y, z, i * 2)
+                  for i, (x, y, z) in enumerate(CUBE_VERTICES[:4])]
+        lines += ['ATOM 20 12', 'TRGL 10 11 12', 'TRGL 10 20 13', 'END',
+                  'GOCAD PLine 1', 'HEADER {', 'name:Trace', '}', 'ILINE',
+                  'VRTX 1 0 0 0', 'VRTX 2 1 0 0', 'VRTX 3 1 1 0',
+                  'SEG 1 2', 'SEG 2 3', 'END']
+        file_name = self.write('objects.ts', '\n'.join(lines).encode())
+        (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+        surface, line = proj.resources
+        assert surface.title == 'Top surface'
+        assert np.array_equal(surface.mesh.vertices,
+                              CUBE_VERTICES[:4] * [1, 1, -1])
+        assert np.array_equal(surface.mesh.triangles, [[0, 1, 2], [0, 2, 3]])
+        assert surface.data[0].data.title == 'grade'
+        assert np.array_equal(surface.data[0].data.array, [0, 2, 4, 6])
+        assert line.title == 'Trace'
+        assert np.array_equal(line.mesh.segments, [[0, 1], [1, 2]])
+        proj.validate()
+
+        bad = self.write('bad.ts', b'GOCAD TSurf 1\nVRTX 1 0 0 0\n'
+                                   b'TRGL 1 2 3\nEND\n')
+        self.assertRaises(steno3d.parsers.ParseError,
+                          steno3d.parsers.gocad(bad).parse)
+
+    def test_voxet(self):
+        values = np.arange(24, dtype='>f4')
+        values[5] = -99
+        self.write('grid@@', values.tobytes())
+        file_name = self.write('grid.vo', '\n'.join([
+            'GOCAD Voxet 1', 'HEADER {', 'name:Density', '}',
+            'AXIS_O 10 20 30', 'AXIS_U 4 0 0', 'AXIS_V 0 2 0',
+            'AXIS_W 0 0 -3', 'AXIS_MIN 0 0 0', 'AXIS_MAX 1 1 1',
+            'AXIS_N 2 3 4', 'PROPERTY 1 "density"', 'PROP_ESIZE 1 4',
+            'PROP_ETYPE 1 IEEE', 'PROP_NO_DATA_VALUE 1 -99',
+            'PROP_FILE 1 grid@@', 'END'
+        ]).encode())
+        (proj,) = steno3d.parsers.gocad(file_name).parse()
+        volume = proj.resources[0]
+        assert volume.title == 'Density'
+        assert np.array_equal(volume.mesh.h1, [4, 4])
+        assert np.array_equal(volume.mesh.h2, [1, 1, 1])
+        assert np.array_equal(volume.mesh.h3, [1, 1, 1, 1])
+        assert np.array_equal(volume.mesh.x0, [8, 19.5, 26.5])
+        data = volume.data[0].data
+        assert data.title == 'density'
+        # The w axis points down, so the layers are flipped
+        expected = np.arange(24.).reshape((2, 3, 4), order='F')
+        expected[1, 2, 0] = np.nan
+        expected = expected[:, :, ::-1].ravel(order='F')
+        assert np.array_equal(data.array, expected, equal_nan=True)
+        proj.validate()
+
+    def test_surpac(self):
+        file_name = self.write('pit.str', '\n'.join([
+            'pit, 01-Jan-20,,', '0, 0.000, 0.000, 0.000,',
+            '1, 20.0, 10.0, 5.0, toe', '1, 21.0, 11.0, 5.0', '1, 22, 12, 5',
+            '0, 0.000, 0.000, 0.000,', '2, 30, 40, 50,', '2, 31, 41, 50',
+            '3, 0, 0, 0', '0, 0.000, 0.000, 0.000, END'
+        ]).encode())
+        (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+        line = proj.resources[0]
+        assert line.title == 'pit'
+        assert np.array_equal(line.mesh.vertices[:2],
+                              [[10, 20, 5], [11, 21, 5]])
+        assert np.array_equal(line.mesh.segments,
+                              [[0, 1], [1, 2], [3, 4]])
+        assert np.array_equal(line.data[0].data.array, [1, 1, 1, 2, 2, 3])
+        proj.validate()
+
+        # Small chunks stream a Line per chunk without splitting strings
+        parser = steno3d.parsers.surpac(file_name)
+        lines = list(parser.iter_parse(chunk_size=40))
+        assert [line.title for line in lines] == ['pit', 'pit 2', 'pit 3']
+        assert np.array_equal(
+            np.vstack([line.mesh.vertices for line in lines]),
+            proj.resources[0].mesh.vertices
+        )
+        assert [len(line.mesh.segments) for line in lines] == [2, 1, 0]
+
+    def test_drillholes(self):
+        collar = self.write('pit_collar.csv', b'\n'.join([
+            b'HoleID,East,North,RL', b'DH2,100,0,50', b'DH1,0,0,10'
+        ]))
+        self.write('pit_survey.csv', b'\n'.join([
+            b'HoleID,Depth,Azimuth,Dip', b'DH1,0,90,0', b'DH1,10,90,0',
+            b'DH1,20,90,-90'
+        ]))
+        self.write('pit_assay.csv', b'\n'.join([
+            b'HoleID,From,To,Au,Rock', b'DH1,0,10,1.5,ox', b'DH1,10,30,,fr',
+            b'DH2,0,4,2,ox'
+        ]))
+        (proj,) = steno3d.parsers.drillholes(collar).parse()
+        collars, holes = proj.resources
+        assert np.array_equal(collars.mesh.vertices,
+                              [[0, 0, 10], [100, 0, 50]])
+        # The last survey interval turns down, balanced half way
+        assert np.allclose(holes.mesh.vertices, [
+            [0, 0, 10], [10, 0, 10], [10, 0, 10], [15, 0, -5],
+            [100, 0, 50], [100, 0, 46]
+        ])
+        assert [data.data.title for data in holes.data] == ['au']
+        assert np.array_equal(holes.data[0].data.array, [1.5, np.nan, 2],
+                              equal_nan=True)
+        proj.validate()
+
+        # Without assays the holes are traced through their stations
+        other = self.write('holes.csv', open(collar, 'rb').read())
+        (proj,) = steno3d.parsers.drillholes(other).parse(
+            survey=os.path.join(self.directory, 'pit_survey.csv')
+        )
+        assert np.array_equal(proj.resources[1].mesh.segments,
+                              [[0, 1], [1, 2]])
+
+        # A directory is parsed from its collar tables only
+        os.remove(other)
+        proj, errors = steno3d.parsers.AllParsers.parse_many(
+            [self.directory]
+        )
+        assert errors == []
+        assert len(proj.resources) == 2
+
+        # Errors name the table being read, once
+        bad = self.write('bad_collar.csv', b'HoleID,East,North\nDH1,0,0')
+        with self.assertRaises(steno3d.parsers.ParseError) as context:
+            steno3d.parsers.drillholes(bad).parse()
+        message = str(context.exception)
+        assert message.startswith(os.path.realpath(bad) + ': No z column')
+        assert message.count('bad_collar.csv') == 1
+        survey = self.write('bad_survey.csv', b'HoleID,Depth\nDH1,0')
+        with self.assertRaises(steno3d.parsers.ParseError) as context:
+            steno3d.parsers.drillholes(collar).parse(survey=survey)
+        assert str(context.exception).startswith(survey + ': No azimuth')
+
+
+class TestRasterParsers(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.raster = np.arange(30.).reshape(5, 6)
+        self.raster[0, 0] = -9999
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as fileobj:
+            fileobj.write(content)
+        return file_name
+
+    def check_surface(self, surface, origin, cell_size):
+        mesh = surface.mesh
+        assert np.array_equal(mesh.h1, [cell_size] * 5)
+        assert np.array_equal(mesh.h2, [cell_size] * 4)
+        assert np.allclose(mesh.O, [origin[0] + cell_size / 2,
+                                    origin[1] + cell_size / 2, 0])
+        # Nodes run south to north fastest, then west to east
+        expected = self.raster[::-1].T.ravel()
+        expected[expected == -9999] = np.nan
+        assert np.array_equal(mesh.Z, expected, equal_nan=True)
+        texture = surface.textures[0]
+        assert np.array_equal(texture.U, [6 * cell_size, 0, 0])
+        assert np.array_equal(texture.V, [0, 5 * cell_size, 0])
+        surface.validate()
+
+    def test_asc(self):
+        rows = ['ncols 6', 'nrows 5', 'xllcorner 100', 'yllcorner 200',
+                'cellsize 2', 'NODATA_value -9999']
+        # Rows may wrap across lines
+        rows += [' '.join(str(v) for v in self.raster.ravel()[i:i + 4])
+                 for i in range(0, 30, 4)]
+        file_name = self.write('dem.asc', '\n'.join(rows).encode())
+        (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+        self.check_surface(proj.resources[0], (100, 200), 2.)
+
+        (proj,) = steno3d.parsers.asc(file_name).parse(max_cells=4,
+                                                       texture=False)
+        mesh = proj.resources[0].mesh
+        assert (mesh.nC, len(proj.resources[0].textures)) == (4, 0)
+        assert np.array_equal(mesh.h1, [4, 4])
+        # The southern blocks are one row deep
+        assert np.array_equal(mesh.h2, [3, 4])
+        assert mesh.Z[0] == 24.5
+        # The north west block leaves out the nodata value
+        assert mesh.Z[2] == np.mean([1, 6, 7])
+
+    def write_tiff(self, name, endian, big=False, strip_gap=0):
+        raster = self.raster.astype(endian + 'f4')
+        strips = [raster[:3].tobytes(), raster[3:].tobytes()]
+        data_offset = 16
+        offsets = [data_offset, data_offset + len(strips[0]) + strip_gap]
+        body = strips[0] + b'\0' * strip_gap + strips[1]
+        extra = np.r_[2., 2, 0, 0, 0, 0, 100, 210, 0]
+        extra_offset = data_offset + len(body)
+        entries = [(256, 3, 1, 6), (257, 3, 1, 5), (258, 3, 1, 32),
+                   (259, 3, 1, 1), (273, 16 if big else 4, 2, offsets),
+                   (277, 3, 1, 1), (278, 3, 1, 3),
+                   (279, 4, 2, [len(strip) for strip in strips]),
+                   (339, 3, 1, 3), (33550, 12, 3, extra_offset),
+                   (33922, 12, 6, extra_offset + 24),
+                   (42113, 2, 6, b'-9999')]
+        ifd_offset = extra_offset + extra.nbytes
+        size = 8 if big else 4
+        offset_fmt = endian + ('Q' if big else 'I')
+        fmt = {2: 's', 3: 'H', 4: 'I', 16: 'Q'}
+        ifd = struct.pack(endian + ('Q' if big else 'H'), len(entries))
+        tail = ifd_offset + len(ifd) + (20 if big else 12) * len(entries) + \
+            size
+        arrays = b''
+        for tag, kind, count, value in entries:
+            if kind == 12:
+                data = struct.pack(offset_fmt, value)
+            elif kind == 2:
+                data = value + b'\0'
+            else:
+                data = struct.pack(endian + '{}{}'.format(count, fmt[kind]),
+                                   *np.atleast_1d(value))
+            if len(data) > size:
+                # Values that do not fit in the entry follow the IFD
+                arrays += data
+                data = struct.pack(offset_fmt, tail + len(arrays) -
+                                   len(data))
+            ifd += struct.pack(endian + ('HHQ' if big else 'HHI'), tag, kind,
+                               count)
+            ifd += data.ljust(size, b'\0')
+        ifd += b'\0' * size + arrays
+        magic = b'II' if endian == '<' else b'MM'
+        if big:
+            header = magic + struct.pack(endian + 'HHHQ', 43, 8, 0,
+                                         ifd_offset)
+        else:
+            header = magic + struct.pack(endian + 'HI', 42, ifd_offset)
+        header = header.ljust(data_offset, b'\0')
+        return self.write(name, header + body + extra.astype(
+            endian + 'f8').tobytes() + ifd)
+
+    def test_tif(self):
+        for endian, big, gap in (('<', False, 0), ('>', False, 7),
+                                 ('<', True, 0), ('>', True, 3)):
+            file_name = self.write_tiff('dem.tif', endian, big, gap)
+            (proj,) = steno3d.parsers.AllParsers(file_name).parse()
+            self.check_surface(proj.resources[0], (100, 200), 2.)
+
+        bad = self.write('bad.tif', b'II*\0' + b'\0' * 12)
+        self.assertRaises(steno3d.parsers.ParseError,
+                          steno3d.parsers.tif(bad).parse)
+
+    def test_from_raster(self):
+        project = steno3d.Project()
+        raster = np.ones((1000, 700), dtype=np.int16)
+        surface = steno3d.Surface.from_raster(
+            project, raster, cell_size=(1., 2.), max_cells=5000
+        )
+        assert surface.mesh.nC <= 5000
+        assert np.all(surface.mesh.Z == 1)
+        assert np.all(surface.mesh.h1[:-1] == 12)
+        assert np.all(surface.mesh.h2[1:] == 24)
+        self.assertRaises(ValueError, steno3d.Surface.from_raster, project,
+                          raster[:1])
+
+
+class xyzblocks(steno3d.parsers.BaseParser):
+    """Streams x y z lines into a Point per block of lines"""
+
+    extensions = ('xyzblocks',)
+
+    def iter_parse(self, project=None, block_size=1024):
+        vertices = GrowableArray((3,))
+        for _, chunk in iter_chunks(map_file(self.file_name), block_size):
+            vertices.append(numbers(chunk.tobytes()).reshape(-1, 3))
+            yield steno3d.Point(project, title=self.file_name,
+                                mesh=steno3d.Mesh0D(vertices=vertices.take()))
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_growable_array(self):
+        array = GrowableArray((2,), dtype=int, capacity=2)
+        array.append([1, 2])
+        array.append(np.arange(10).reshape(5, 2))
+        assert len(array) == 6
+        assert array.array.base.shape[0] == 6
+        assert np.array_equal(array.array[0], [1, 2])
+        assert np.array_equal(array.take()[1:], np.arange(10).reshape(5, 2))
+        assert len(array) == 0
+        array.append(np.zeros((0, 2)))
+        assert array.array.shape == (0, 2)
+
+    def test_iter_parse(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'points.xyzblocks')
+            points = np.arange(300.).reshape(100, 3)
+            np.savetxt(file_name, points, fmt='%d')
+            project = steno3d.Project()
+            resources = list(xyzblocks(file_name).iter_parse(
+                project, block_size=256
+            ))
+            assert len(resources) > 1
+            assert resources == project.resources
+            assert np.array_equal(
+                np.vstack([res.mesh.vertices for res in resources]), points
+            )
+            (project,) = steno3d.parsers.AllParsers(file_name).parse()
+            assert sum(res.mesh.nN for res in project.resources) == 100
+
+            # Parsers with only parse() yield what it added
+            obj_file = os.path.join(directory, 'tri.obj')
+            with open(obj_file, 'wb') as fileobj:
+                fileobj.write(b'v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n')
+            new = list(steno3d.parsers.obj(obj_file).iter_parse(project))
+            assert new == project.resources[-1:]
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestParseMany(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'wb') as fileobj:
+            fileobj.write(content)
+        return file_name
+
+    def test_parse_many(self):
+        files = []
+        for i in range(3):
+            files.append(self.write('tri{}.obj'.format(i), '\n'.join([
+                'v 0 0 {}'.format(i), 'v 1 0 0', 'v 0 1 0', 'f 1 2 3'
+            ]).encode()))
+        bad = self.write('bad.obj', b'v 0 0 0\nf 1 2 3\n')
+        unknown = self.write('notes.txt', b'not a mesh')
+        paths = [files[0], bad, files[1], unknown, files[2]]
+        for workers in (None, 2):
+            project, errors = steno3d.parsers.AllParsers.parse_many(
+                paths, workers=workers
+            )
+            assert [res.title for res in project.resources] == \
+                ['tri0', 'tri1', 'tri2']
+            assert [res.mesh.vertices[0, 2] for res in project.resources] \
+                == [0, 1, 2]
+            assert [error[0] for error in errors] == [unknown, bad]
+            assert 'out of range' in errors[1][1]
+            project.validate()
+
+        # A directory holds its files with supported extensions
+        project = steno3d.Project(title='Existing')
+        same, errors = steno3d.parsers.AllParsers.parse_many(
+            [self.directory], project=project
+        )
+        assert same is project
+        assert len(project.resources) == 3
+        assert [error[0] for error in errors] == [bad]
+
+    def test_parse_many_partial(self):
+        solid = ('solid {0}\nfacet normal 0 0 1\nouter loop\n'
+                 'vertex 0 0 0\nvertex 1 0 0\nvertex 0 1 0\nendloop\n'
+                 'endfacet\nendsolid {0}\n')
+        two = self.write('two.stl', (solid.format('a') +
+                                     solid.format('b')).encode())
+        build = steno3d.parsers._build_payload
+        built = []
+
+        def fail_second(payload, project=None):
+            # Resources are built with a project, their parts without
+            if project is not None:
+                built.append(payload)
+                if len(built) == 2:
+                    raise ValueError('cannot build')
+            return build(payload, project)
+
+        # A file whose second resource fails adds none of them
+        steno3d.parsers._build_payload = fail_second
+        try:
+            project, errors = steno3d.parsers.AllParsers.parse_many([two])
+        finally:
+            steno3d.parsers._build_payload = build
+        assert len(built) == 2
+        assert project.resources == []
+        assert [error[0] for error in errors] == [two]
+        assert 'cannot build' in errors[0][1]
+
+    def test_payload(self):
+        image = self.write('texture.png', b'')
+        with open(image, 'wb') as fileobj:
+            png.Writer(2, 2, greyscale=True).write(fileobj, [[0, 255],
+                                                             [255, 0]])
+        project = steno3d.Project()
+        steno3d.Surface(
+            project,
+            title='Grid',
+            opts=dict(color='red'),
+            mesh=steno3d.Mesh2DGrid(h1=[1., 1], h2=[2., 2],
+                                    Z=np.arange(9.)),
+            data=[dict(location='CC',
+                       data=steno3d.DataArray(title='d', array=[1., 2, 3,
+                                                                4]))],
+            textures=[steno3d.Texture2DImage(O=[0., 0, 0], U=[2., 0, 0],
+                                             V=[0., 4, 0], image=image)]
+        )
+        steno3d.Volume(
+            project,
+            mesh=steno3d.Mesh3DGrid(h1=[1., 1], h2=[1.], h3=[1., 1, 1]),
+            data=[dict(location='CC',
+                       data=steno3d.DataArray(array=np.arange(6.)))]
+        )
+        payloads = [_payload(res) for res in project.resources]
+        rebuilt = steno3d.Project()
+        for payload in payloads:
+            _build_payload(payload, rebuilt)
+        surface, volume = rebuilt.resources
+        assert surface.title == 'Grid'
+        assert surface.opts.color == (255, 0, 0)
+        assert np.array_equal(surface.mesh.Z, np.arange(9.))
+        assert surface.data[0].data.title == 'd'
+        assert np.array_equal(surface.textures[0].U, [2, 0, 0])
+        project.resources[0].textures[0].image.seek(0)
+        surface.textures[0].image.seek(0)
+        assert (surface.textures[0].image.read() ==
+                project.resources[0].textures[0].image.read())
+        assert volume.mesh.nC == 6
+        rebuilt.validate()
+
+        payloads, error = _parse_payloads((steno3d.parsers.obj,
+                                           'missing.obj', {}))
+        assert payloads is None and 'File not found' in error
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+import steno3d
+from steno3d.spatial import (GridIndex, aggregate, poisson_thin,
+                             voxel_downsample)
+
+
+class TestSpatial(unittest.TestCase):
+
+    def setUp(self):
+        self.points = np.random.RandomState(0).rand(5000, 3) * [10, 10, 1]
+
+    def test_grid_index(self):
+        points = self.points
+        index = GridIndex(points)
+        found = index.query_box([2, 3, 0], [5, 4, .5])
+        inside = ((points >= [2, 3, 0]) & (points <= [5, 4, .5])).all(axis=1)
+        assert np.array_equal(found, np.flatnonzero(inside))
+        found = index.query_radius([5, 5, .5], 1.5)
+        near = ((points - [5, 5, .5])**2).sum(axis=1) <= 1.5**2
+        assert np.array_equal(found, np.flatnonzero(near))
+        assert len(index.query_box([20, 20, 20], [30, 30, 30])) == 0
+
+    def test_aggregate(self):
+        values = np.array([1., 5, 2, 4])
+        groups = np.array([1, 0, 1, 0])
+        assert np.array_equal(aggregate(values, groups, 2), [4.5, 1.5])
+        assert np.array_equal(aggregate(values, groups, 2, 'max'), [5, 2])
+        assert np.array_equal(aggregate(values, groups, 2, 'min'), [4, 1])
+        assert np.array_equal(aggregate(values, groups, 2, 'first'), [5, 1])
+        self.assertRaises(ValueError, aggregate, values, groups, 2, 'sum')
+
+    def test_voxel_downsample(self):
+        centroids, groups = voxel_downsample(self.points, 1.)
+        assert len(centroids) == 100
+        assert np.allclose(centroids, aggregate(self.points, groups, 100))
+        # Voxels start at the lowest corner of the points
+        corner = self.points.min(axis=0)
+        assert (np.floor(centroids[groups] - corner) ==
+                np.floor(self.points - corner)).all()
+
+    def test_poisson_thin(self):
+        index, groups = poisson_thin(self.points, .5, seed=1)
+        kept = self.points[index]
+        # No two kept points are within the radius...
+        grid = GridIndex(kept)
+        for point in kept:
+            assert len(grid.query_radius(point, .4999)) == 1
+        # ...and every removed point is within it of its kept point
+        distance = np.sqrt(((self.points - kept[groups])**2).sum(axis=1))
+        assert distance.max() <= .5
+        assert np.array_equal(groups[index], np.arange(len(index)))
+
+    def test_point_methods(self):
+        proj = steno3d.Project()
+        point = steno3d.Point(
+            proj,
+            mesh=steno3d.Mesh0D(vertices=self.points),
+            data=[dict(data=steno3d.DataArray(array=self.points[:, 2]))]
+        )
+        # An unknown aggregate leaves the points and data unchanged
+        self.assertRaises(ValueError, lambda: point.downsample(2., 'median'))
+        self.assertRaises(ValueError, lambda: point.thin(.5, 'median'))
+        assert point.mesh.nN == len(self.points)
+        assert len(point.data[0].data.array) == len(self.points)
+        groups = point.downsample(2., how='max')
+        assert point.mesh.nN == 25
+        assert np.array_equal(point.data[0].data.array,
+                              aggregate(self.points[:, 2], groups, 25, 'max'))
+        point.validate()
+
+        point.mesh.vertices = self.points
+        point.data[0].data.array = self.points[:, 2]
+        index, _ = point.thin(.5, seed=1)
+        assert np.array_equal(point.mesh.vertices, self.points[index])
+        assert np.array_equal(point.data[0].data.array,
+                              self.points[index, 2])
+        assert np.array_equal(point.mesh.query_box([0, 0, 0], [2, 2, 1]),
+                              np.flatnonzero((self.points[index] <= [2, 2, 1])
+                                             .all(axis=1)))
+        point.validate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import steno3d
+from steno3d.lazy import GridView
+from steno3d.traits import (ArrayStream, array_range, check_cast,
+                            serialized_nbytes)
+
+
+class TestArrayValidation(unittest.TestCase):
+
+    def test_array_range(self):
+        arr = np.random.randint(-5, 100, (100000, 3))
+        assert array_range(arr, block_size=999) == (arr.min(), arr.max())
+        arr = np.random.rand(1000)
+        arr[500] = np.nan
+        assert all(np.isnan(array_range(arr, block_size=64)))
+        self.assertRaises(ValueError, lambda: array_range(np.zeros((0, 3))))
+
+    def test_check_cast(self):
+        check_cast(np.array([-2**31, 2**31 - 1]), '<i4')
+        check_cast(np.array([1e-50, 1e30, np.nan, -np.inf]), '<f4')
+        check_cast(np.zeros((0, 3)), '<i4')
+        arr = np.zeros((1000, 3), int)
+        arr[600, 1] = 2**40
+        self.assertRaises(ValueError, lambda: check_cast(arr, '<i4',
+                                                         block_size=64))
+        arr = np.zeros(1000)
+        arr[[10, 700]] = np.nan, -1e300
+        self.assertRaises(ValueError, lambda: check_cast(arr, '<f4',
+                                                         block_size=64))
+        # Serializing checks every value before any bytes are read
+        prop = steno3d.Mesh2D.class_traits()['triangles']
+        self.assertRaises(ValueError, lambda: prop.serialize(
+            np.array([[0, 1, 2**40]])
+        ))
+
+    def test_no_copy(self):
+        vertices = np.random.rand(10, 3)
+        triangles = np.random.randint(0, 10, (20, 3))
+        mesh = steno3d.Mesh2D(vertices=vertices, triangles=triangles)
+        assert mesh.validate()
+        assert mesh.vertices is not vertices
+        assert np.shares_memory(mesh.vertices, vertices)
+        assert np.shares_memory(mesh.triangles, triangles)
+        assert mesh._nbytes() == serialized_nbytes(vertices) + 240
+        # The stored arrays are read-only views of the arrays given
+        with self.assertRaises(ValueError):
+            mesh.vertices[0, 0] = 99
+        assert vertices.flags.writeable
+        mesh.vertices = [[0., 0, 0], [1, 0, 0], [0, 1, 0]]
+        assert not mesh.vertices.flags.writeable
+
+
+class TestLazyArray(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_npy_source(self):
+        vertices = np.random.rand(1000, 3)
+        triangles = np.random.randint(0, 1000, (2000, 3))
+        np.save(os.path.join(self.directory, 'v.npy'), vertices)
+        np.save(os.path.join(self.directory, 't.npy'), triangles)
+        mesh = steno3d.Mesh2D(
+            vertices=os.path.join(self.directory, 'v.npy'),
+            triangles=os.path.join(self.directory, 't.npy')
+        )
+        assert isinstance(mesh.vertices, steno3d.LazyArray)
+        assert mesh.validate()
+        assert mesh._nbytes() == 36000
+        fileprop = mesh.traits()['triangles'].serialize(mesh.triangles)
+        assert fileprop.dtype == '<i4'
+        assert np.array_equal(
+            np.frombuffer(fileprop.file.read(), '<i4').reshape(2000, 3),
+            triangles
+        )
+
+    def test_callable_source(self):
+        calls = []
+
+        def values():
+            calls.append(1)
+            return np.arange(10.)
+
+        data = steno3d.DataArray(array=steno3d.LazyArray(values, (10,),
+                                                         float))
+        assert data.validate()
+        assert len(calls) == 0
+        fileprop = data.traits()['array'].serialize(data.array)
+        assert np.array_equal(np.frombuffer(fileprop.file.read(), '<f4'),
+                              np.arange(10.))
+        assert len(calls) == 1
+        data.traits()['array'].serialize(data.array).file.read()
+        assert len(calls) == 1
+
+    def test_callable_without_shape(self):
+        calls = []
+
+        def values():
+            calls.append(1)
+            return np.arange(10.)
+
+        lazy = steno3d.LazyArray(values)
+        assert lazy.shape == (10,)
+        assert len(calls) == 1
+        assert np.array_equal(lazy[...], np.arange(10.))
+        assert np.array_equal(steno3d.LazyArray(lazy)[...], np.arange(10.))
+        assert len(calls) == 1
+
+    def test_grid_view(self):
+        grid = np.random.rand(4, 5, 6)
+        for order in ('c', 'f'):
+            view = GridView(grid, order)
+            flat = np.ravel(grid, order=order.upper())
+            assert np.array_equal(view[...], flat)
+            assert np.array_equal(view[7:53], flat[7:53])
+            assert np.array_equal(view[3:100:7], flat[3:100:7])
+            assert view[-1] == flat[-1]
+            stream = ArrayStream(steno3d.LazyArray(view), '<f4',
+                                 chunk_size=44)
+            assert np.array_equal(np.frombuffer(stream.read(), '<f4'),
+                                  flat.astype('<f4'))
+        # Fortran-ordered files give contiguous Fortran-order planes
+        file_name = os.path.join(self.directory, 'fortran.npy')
+        np.save(file_name, np.asfortranarray(grid))
+        view = GridView(file_name, 'f')
+        assert view.source.flags.f_contiguous
+        assert np.array_equal(view[...], np.ravel(grid, order='F'))
+
+    def test_out_of_core_volume(self):
+        grid = np.random.rand(4, 5, 6)
+        np.save(os.path.join(self.directory, 'grid.npy'), grid)
+        proj = steno3d.Project()
+        vol = steno3d.Volume(
+            proj,
+            mesh=steno3d.Mesh3DGrid(h1=np.ones(4), h2=np.ones(5),
+                                    h3=np.ones(6)),
+            data=[dict(location='CC', data=steno3d.DataArray.from_grid(
+                os.path.join(self.directory, 'grid.npy'), order='f'
+            ))]
+        )
+        assert vol.validate()
+        data = vol.data[0].data
+        assert data.order == 'f'
+        assert data.grid_shape == (4, 5, 6)
+        assert data._nbytes() == 480
+        bad = steno3d.DataArray.from_grid(np.random.rand(6, 5, 4))
+        with self.assertRaises(ValueError):
+            vol.data = [dict(location='CC', data=bad)]
+            vol.validate()
+
+
+if __name__ == '__main__':
+    unittest.main()